@@ -267,6 +267,68 @@ CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', f"{REDIS_URL}/0")
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 
+# nmap / nikto run on their own queue, served by a separate worker (see Procfile);
+# scans go to one queue per subscription tier (scanner/queues.py)
+CELERY_TASK_ROUTES = (
+    'scanner.queues.route_task',
+    {'scanner.tasks.run_heavy_check': {'queue': 'heavy'}},
+)
+# A worker listening on several queues drains them in its -Q order instead of round-robin,
+# and reserves one task at a time so a queued enterprise scan isn't stuck behind its backlog
+CELERY_BROKER_TRANSPORT_OPTIONS = {'queue_order_strategy': 'priority'}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Recurring scans are started by one beat process (see Procfile); a tick that sat in the
+# queue past the next one is dropped
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-scheduled-scans': {
+        'task': 'scanner.tasks.dispatch_scheduled_scans',
+        'schedule': 60.0,
+        'options': {'expires': 55},
+    },
+}
+
+# ========================= SCANNER =========================
+# Checks run concurrently inside each scan task: threads for sync checks,
+# plus a cap on native async checks in flight on the scan's event loop
+SCANNER_MAX_WORKERS = int(os.getenv('SCANNER_MAX_WORKERS', 6))
+SCANNER_ASYNC_CONCURRENCY = int(os.getenv('SCANNER_ASYNC_CONCURRENCY', 50))
+# Default TTL (seconds) for cached check results; per-check TTLs live in scanner/result_cache.py
+SCANNER_RESULT_CACHE_TTL = int(os.getenv('SCANNER_RESULT_CACHE_TTL', 3600))
+# Celery soft time limit (seconds) for one nmap/nikto run on the heavy queue
+SCANNER_HEAVY_TIME_LIMIT = int(os.getenv('SCANNER_HEAVY_TIME_LIMIT', 900))
+# Portfolio (bulk) scans: domains accepted per batch, and scans one firm may run at once
+SCANNER_BATCH_MAX_DOMAINS = int(os.getenv('SCANNER_BATCH_MAX_DOMAINS', 500))
+SCANNER_FIRM_MAX_CONCURRENT_SCANS = int(os.getenv('SCANNER_FIRM_MAX_CONCURRENT_SCANS', 3))
+# Politeness towards scanned sites, shared by all workers through Redis (0 rps disables).
+# Limits apply per target host and, more loosely, per resolved IP.
+SCANNER_POLITE_RPS = float(os.getenv('SCANNER_POLITE_RPS', 5))
+SCANNER_POLITE_BURST = int(os.getenv('SCANNER_POLITE_BURST', 10))
+SCANNER_POLITE_MAX_IN_FLIGHT = int(os.getenv('SCANNER_POLITE_MAX_IN_FLIGHT', 4))
+SCANNER_POLITE_IP_RPS = float(os.getenv('SCANNER_POLITE_IP_RPS', 20))
+SCANNER_POLITE_IP_BURST = int(os.getenv('SCANNER_POLITE_IP_BURST', 40))
+SCANNER_POLITE_IP_MAX_IN_FLIGHT = int(os.getenv('SCANNER_POLITE_IP_MAX_IN_FLIGHT', 16))
+SCANNER_POLITE_MAX_WAIT = float(os.getenv('SCANNER_POLITE_MAX_WAIT', 60))
+# Site crawl bounds per scan (pages, link depth from the homepage, total body bytes, seconds)
+# and pages fetched at once per host
+SCANNER_CRAWL_MAX_PAGES = int(os.getenv('SCANNER_CRAWL_MAX_PAGES', 50))
+SCANNER_CRAWL_MAX_DEPTH = int(os.getenv('SCANNER_CRAWL_MAX_DEPTH', 3))
+SCANNER_CRAWL_MAX_BYTES = int(os.getenv('SCANNER_CRAWL_MAX_BYTES', 5 * 1024 * 1024))
+SCANNER_CRAWL_TIME_BUDGET = float(os.getenv('SCANNER_CRAWL_TIME_BUDGET', 30))
+SCANNER_CRAWL_PER_HOST = int(os.getenv('SCANNER_CRAWL_PER_HOST', 4))
+# Total wall-clock budget (seconds) for one scan, per tier; then it finishes with partial results
+SCANNER_TIME_BUDGET_FREE = int(os.getenv('SCANNER_TIME_BUDGET_FREE', 300))
+SCANNER_TIME_BUDGET_PRO = int(os.getenv('SCANNER_TIME_BUDGET_PRO', 900))
+SCANNER_TIME_BUDGET_ENTERPRISE = int(os.getenv('SCANNER_TIME_BUDGET_ENTERPRISE', 1800))
+# Response bodies are read up to this many bytes (HTML/XML; other types get less, see sessions.py)
+SCANNER_MAX_BODY_BYTES = int(os.getenv('SCANNER_MAX_BODY_BYTES', 2 * 1024 * 1024))
+# Live progress of a running scan: at most one DB write / websocket message per interval (seconds)
+SCANNER_PROGRESS_DB_INTERVAL = float(os.getenv('SCANNER_PROGRESS_DB_INTERVAL', 2))
+SCANNER_PROGRESS_WS_INTERVAL = float(os.getenv('SCANNER_PROGRESS_WS_INTERVAL', 0.25))
+# Recurring scans: none start while this many scans wait in their tier's queue,
+# and at most this many start per beat tick
+SCANNER_SCHEDULE_MAX_QUEUE_DEPTH = int(os.getenv('SCANNER_SCHEDULE_MAX_QUEUE_DEPTH', 10))
+SCANNER_SCHEDULE_MAX_PER_TICK = int(os.getenv('SCANNER_SCHEDULE_MAX_PER_TICK', 20))
+
 
 
 # ========================= DEFAULT AUTO FIELD =========================
@@ -0,0 +1,150 @@
+# scanner/batches.py
+# Portfolio batches and a firm's scan slots. A firm runs at most FIRM_MAX_CONCURRENT_SCANS
+# scans at once. The rest wait in the DB as PENDING scans that were never sent to a worker
+# (queued_at is None) and are queued, oldest first, when a slot frees up: whenever one of the
+# firm's scans finishes, and on the scheduler's beat tick as a fallback. A waiting scan
+# costs nothing until then: no task cycling through the broker, no worker, no DB polling.
+
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+from users.models import FirmProfile
+
+from . import progress as scan_progress
+from .models import ScanBatch, ScanResult
+
+# Scans one firm may run at once; the rest of a portfolio batch waits its turn
+FIRM_MAX_CONCURRENT_SCANS = getattr(settings, "SCANNER_FIRM_MAX_CONCURRENT_SCANS", 3)
+# Scans RUNNING (or queued but not started) for longer than this are assumed dead (killed
+# worker, lost message) and stop holding a slot: twice the heavy tools' time limit
+FIRM_SLOT_STALE_AFTER = timedelta(seconds=getattr(settings, "SCANNER_HEAVY_TIME_LIMIT", 900) * 2)
+WAITING_STEP = "Queued (waiting for a free slot)..."
+
+
+def _lock_firm(firm_id):
+    """Lock the firm row so two workers can't both take the last slot; returns its tier"""
+    return FirmProfile.objects.select_for_update().filter(pk=firm_id).values_list("subscription_tier", flat=True).first()
+
+
+def _waiting(now):
+    """PENDING scans not sent to a worker, or whose task was lost"""
+    return ScanResult.objects.filter(status='PENDING').filter(
+        Q(queued_at__isnull=True) | Q(queued_at__lt=now - FIRM_SLOT_STALE_AFTER)
+    )
+
+
+def claim_slot(scan, **options):
+    """Mark the scan RUNNING if its firm is under the concurrent-scan cap.
+
+    Otherwise the scan waits for start_waiting_scans() (options are the task's keyword
+    arguments it is queued with again) and False is returned. None if the scan is no
+    longer PENDING (cancelled since it was read).
+    """
+    with transaction.atomic():
+        _lock_firm(scan.firm_id)
+        running = ScanResult.objects.filter(
+            firm_id=scan.firm_id,
+            status='RUNNING',
+            started_at__gte=timezone.now() - FIRM_SLOT_STALE_AFTER,
+        ).exclude(pk=scan.pk).count()
+        if running < FIRM_MAX_CONCURRENT_SCANS:
+            # Conditional, so a cancel that lands after the scan was read is never overwritten
+            started_at = timezone.now()
+            if not ScanResult.objects.filter(pk=scan.pk, status='PENDING').update(status='RUNNING', started_at=started_at):
+                return None
+            scan.status = 'RUNNING'
+            scan.started_at = started_at
+            return True
+        if not ScanResult.objects.filter(pk=scan.pk, status='PENDING').update(
+            queued_at=None, run_options=options, current_step=WAITING_STEP
+        ):
+            return None
+    # A scan of the firm may have finished since the count, before this one was waiting
+    start_waiting_scans(scan.firm_id)
+    return False
+
+
+def start_waiting_scans(firm_id) -> int:
+    """Queue the firm's oldest waiting scans for the slots that are free; how many were queued"""
+    from .tasks import run_compliance_scan
+
+    with transaction.atomic():
+        subscription = _lock_firm(firm_id)
+        now = timezone.now()
+        fresh = now - FIRM_SLOT_STALE_AFTER
+        busy = ScanResult.objects.filter(firm_id=firm_id).filter(
+            Q(status='RUNNING', started_at__gte=fresh) | Q(status='PENDING', queued_at__gte=fresh)
+        ).count()
+        if busy >= FIRM_MAX_CONCURRENT_SCANS:
+            return 0
+        scans = list(
+            _waiting(now).filter(firm_id=firm_id)
+            .order_by('scan_date', 'pk')
+            .values_list('pk', 'run_options')[:FIRM_MAX_CONCURRENT_SCANS - busy]
+        )
+        if not scans:
+            return 0
+        ScanResult.objects.filter(pk__in=[pk for pk, _ in scans]).update(queued_at=now)
+
+        def _send():
+            for pk, options in scans:
+                run_compliance_scan.delay(pk, subscription=subscription, **(options or {}))
+        transaction.on_commit(_send)
+    return len(scans)
+
+
+def start_all_waiting_scans() -> int:
+    """start_waiting_scans() for every firm with waiting scans (beat fallback: a scan that
+    died without finishing frees its slot only once it is stale)"""
+    firm_ids = _waiting(timezone.now()).order_by().values_list('firm_id', flat=True).distinct()
+    return sum(start_waiting_scans(firm_id) for firm_id in list(firm_ids))
+
+
+def finish_batch_if_done(batch_id):
+    """Close a portfolio batch once its last scan reaches a final state and build the summary"""
+    if not batch_id:
+        return
+    with transaction.atomic():
+        batch = ScanBatch.objects.select_for_update().filter(pk=batch_id, status='RUNNING').first()
+        if batch is None or batch.scans.filter(status__in=['PENDING', 'RUNNING']).exists():
+            return
+        scans = batch.scans.all()
+        completed = scans.filter(status='COMPLETED')
+        findings = Counter()
+        for scan in completed:
+            findings.update({f.get("title") for f in scan.get_findings() if isinstance(f, dict) and f.get("title")})
+        batch.summary = {
+            "total": batch.total,
+            "statuses": dict(scans.values_list('status').annotate(n=Count('id'))),
+            "grades": dict(completed.values_list('grade').annotate(n=Count('id'))),
+            "avg_risk_score": round(completed.aggregate(avg=Avg('risk_score'))['avg'] or 0, 1),
+            "highest_risk": [
+                {"domain": d, "scan_id": s, "grade": g, "risk_score": r}
+                for d, s, g, r in completed.order_by('-risk_score').values_list('domain', 'scan_id', 'grade', 'risk_score')[:10]
+            ],
+            "common_findings": [{"title": t, "domains": n} for t, n in findings.most_common(10)],
+        }
+        batch.status = 'COMPLETED'
+        batch.completed_at = timezone.now()
+        batch.save(update_fields=['summary', 'status', 'completed_at'])
+
+    if batch.user_id:
+        scan_progress.send(
+            f"user_{batch.user_id}",
+            {
+                "type": "batch_notification",
+                "message": f"Portfolio scan of {batch.total} domains completed!",
+                "batch_id": batch.batch_id,
+            }
+        )
+
+
+def scan_finished(scan):
+    """A scan of the firm reached a final state: its slot goes to the next waiting scan"""
+    finish_batch_if_done(scan.batch_id)
+    start_waiting_scans(scan.firm_id)
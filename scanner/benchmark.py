@@ -0,0 +1,397 @@
+# scanner/benchmark.py
+# End-to-end scan benchmark without network access: a local HTTPS stub site (self-signed
+# certificate, configurable latency) that every *.bench.test host resolves to, a stub DNS
+# zone for the same hosts, and run_compliance_scan run eagerly against it for each tier.
+# Used by `manage.py scanner_benchmark`.
+
+import asyncio
+import datetime
+import hashlib
+import os
+import resource
+import socket
+import ssl
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager, ExitStack
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import dns.asyncresolver
+import dns.resolver
+import dns.rrset
+from celery import current_app
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from .check_stats import percentile
+
+BENCH_SUFFIX = ".bench.test"
+DEFAULT_LATENCY = 0.05  # seconds added to every stub response and DNS answer
+DEFAULT_PAGES = 20      # blog posts on the stub site, on top of its fixed pages
+
+FILLER = (
+    "<p>We help businesses of every size meet their regulatory obligations. Our team reviews "
+    "contracts, advises on data protection and represents clients before supervisory "
+    "authorities. This paragraph stands in for the marketing copy of a real site.</p>"
+) * 12
+
+
+# === Stub site ===
+
+def _layout(title, body):
+    return (
+        f"<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\"><title>{title}</title>"
+        "<link rel=\"stylesheet\" href=\"/static/site.css\"></head><body>"
+        "<nav><a href=\"/\">Home</a> <a href=\"/about\">About</a> <a href=\"/blog\">Blog</a> "
+        "<a href=\"/contact\">Contact</a> <a href=\"/login\">Client login</a></nav>"
+        f"<main><h1>{title}</h1>{body}</main>"
+        "<div id=\"cookie-banner\">We use cookies. <button>Accept</button> <button>Reject</button> "
+        "<a href=\"/cookies\">Cookie policy</a> - manage your cookie consent.</div>"
+        "<footer><a href=\"/privacy\">Privacy Policy</a> <a href=\"/terms\">Terms of Service</a> "
+        "<a href=\"/cookies\">Cookies</a></footer>"
+        "<script src=\"/static/app.js\"></script></body></html>"
+    ).encode()
+
+
+def build_site(posts: int = DEFAULT_PAGES) -> dict:
+    """path -> (content type, body) for a small law-firm site with posts blog posts"""
+    html = "text/html; charset=utf-8"
+    blog = "".join(f"<li><a href=\"/blog/post-{n}\">Update {n}</a></li>" for n in range(posts))
+    site = {
+        "/": (html, _layout("Example Law", f"<ul>{blog[:2000]}</ul>{FILLER}")),
+        "/about": (html, _layout("About us", FILLER)),
+        "/blog": (html, _layout("Blog", f"<ul>{blog}</ul>")),
+        "/contact": (html, _layout("Contact", (
+            "<p>To exercise your rights or make a data subject access request (DSAR), "
+            "email our data protection officer (DPO) at dpo@example.test.</p>"
+            "<form method=\"post\" action=\"/contact\"><input name=\"email\"><textarea name=\"msg\">"
+            "</textarea><input type=\"hidden\" name=\"csrfmiddlewaretoken\" value=\"x\"></form>"
+        ))),
+        "/privacy": (html, _layout("Privacy Policy", (
+            "<p>Example Law is the data controller under the GDPR and CCPA. You have the right "
+            "to access, rectify and erase your personal data. Our data protection officer can be "
+            "reached at dpo@example.test. We keep personal data for a retention period of six "
+            "years and carry out a data protection impact assessment (DPIA) for high-risk "
+            "processing.</p>" + FILLER
+        ))),
+        "/terms": (html, _layout("Terms of Service", FILLER)),
+        "/cookies": (html, _layout("Cookie Policy", "<p>Strictly necessary and analytics cookies, "
+                                   "set only with your consent.</p>")),
+        "/login": (html, _layout("Client login", (
+            "<form method=\"post\" action=\"/login\"><input name=\"username\">"
+            "<input type=\"password\" name=\"password\"><input type=\"hidden\" "
+            "name=\"csrfmiddlewaretoken\" value=\"x\"><button>Sign in</button></form>"
+            "<p>Two-factor authentication (MFA) is required for every account.</p>"
+        ))),
+        "/static/site.css": ("text/css", b"body{font-family:sans-serif}" * 200),
+        "/static/app.js": ("application/javascript", b"console.log('ok');" * 200),
+        "/robots.txt": ("text/plain", b"User-agent: *\nDisallow: /admin\nSitemap: /sitemap.xml\n"),
+        "/.well-known/security.txt": ("text/plain", b"Contact: mailto:security@example.test\n"),
+    }
+    for n in range(posts):
+        links = f"<a href=\"/blog/post-{(n + 1) % posts}\">Next</a>"
+        site[f"/blog/post-{n}"] = (html, _layout(f"Update {n}", FILLER + links))
+    locs = "".join(f"<url><loc>{{base}}{path}</loc></url>" for path in site if path.startswith(("/blog", "/about")))
+    site["/sitemap.xml"] = (
+        "application/xml",
+        f"<?xml version=\"1.0\"?><urlset xmlns=\"http://www.sitemaps.org/schemas/sitemap/0.9\">{locs}</urlset>".encode(),
+    )
+    return site
+
+
+SECURITY_HEADERS = {
+    "Server": "nginx/1.24.0",
+    "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+    "Content-Security-Policy": "default-src 'self'",
+    "X-Frame-Options": "DENY",
+    "X-Content-Type-Options": "nosniff",
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+}
+
+
+class StubSite:
+    """HTTPS (and redirecting HTTP) servers on 127.0.0.1 serving build_site() to any host"""
+
+    def __init__(self, latency: float = DEFAULT_LATENCY, posts: int = DEFAULT_PAGES):
+        self.latency = latency
+        self.site = build_site(posts)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._dir = tempfile.TemporaryDirectory(prefix="scanner-bench-")
+        self.cert_file = os.path.join(self._dir.name, "cert.pem")
+        self._servers = []
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+
+    def _write_cert(self):
+        key = ec.generate_private_key(ec.SECP256R1())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, f"*{BENCH_SUFFIX}")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=90))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(f"*{BENCH_SUFFIX}")]), critical=False)
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+            .sign(key, hashes.SHA256())
+        )
+        key_file = os.path.join(self._dir.name, "key.pem")
+        with open(self.cert_file, "wb") as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+        with open(key_file, "wb") as f:
+            f.write(key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            ))
+        return key_file
+
+    def _handler(self, secure):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, head):
+                stub._count()
+                time.sleep(stub.latency)
+                path = self.path.split("?")[0].split("#")[0]
+                host = (self.headers.get("Host") or "").split(":")[0]
+                if not secure:
+                    self.send_response(301)
+                    self.send_header("Location", f"https://{host}{self.path}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if path != "/" and path.endswith("/"):
+                    path = path.rstrip("/")
+                content_type, body = stub.site.get(path, (None, None))
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = body.replace(b"{base}", f"https://{host}".encode())
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                status = 304 if self.headers.get("If-None-Match") == etag else 200
+                self.send_response(status)
+                self.send_header("ETag", etag)
+                for name, value in SECURITY_HEADERS.items():
+                    self.send_header(name, value)
+                if path == "/login":
+                    self.send_header("Set-Cookie", "sessionid=abc; Path=/; Secure; HttpOnly; SameSite=Lax")
+                if status == 304:
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(False)
+
+            def do_HEAD(self):
+                self._respond(True)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self._respond(False)
+
+        return Handler
+
+    def start(self):
+        key_file = self._write_cert()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.cert_file, key_file)
+        https = ThreadingHTTPServer(("127.0.0.1", 0), self._handler(secure=True))
+        https.socket = context.wrap_socket(https.socket, server_side=True)
+        http = ThreadingHTTPServer(("127.0.0.1", 0), self._handler(secure=False))
+        for server in (https, http):
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        self._servers = [https, http]
+        self.ports = {443: https.server_address[1], 80: http.server_address[1]}
+        return self
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._dir.cleanup()
+
+
+# === Routing every bench host to the stub ===
+
+def _zone(name, rdtype):
+    """Records of the stub DNS zone, the same for every bench domain (x.bench.test)"""
+    base = ".".join(name.split(".")[-3:])
+    return {
+        ("", "A"): ["127.0.0.1"],
+        ("www.", "A"): ["127.0.0.1"],
+        ("", "TXT"): ['"v=spf1 mx include:_spf.example.test -all"'],
+        ("_dmarc.", "TXT"): [f'"v=DMARC1; p=reject; rua=mailto:dmarc@{base}"'],
+        ("", "MX"): [f"10 mx1.{base}.", f"20 mx2.{base}."],
+        ("", "CAA"): ['0 issue "letsencrypt.org"'],
+        ("google._domainkey.", "TXT"): ['"v=DKIM1; k=rsa; p=MIIBIjANBg"'],
+    }.get((name[:-len(base)], rdtype))
+
+
+class _Answer:
+    def __init__(self, rrset):
+        self.rrset = rrset
+
+    def __iter__(self):
+        return iter(self.rrset)
+
+
+@contextmanager
+def routed_to(stub: StubSite):
+    """Resolve *.bench.test (getaddrinfo and dnspython) to the stub and trust its certificate"""
+    getaddrinfo = socket.getaddrinfo
+    resolve = dns.asyncresolver.resolve
+
+    def _getaddrinfo(host, port, *args, **kwargs):
+        if isinstance(host, str) and host.rstrip(".").endswith(BENCH_SUFFIX):
+            port = stub.ports.get(int(port) if str(port).isdigit() else port, port) if port else port
+            return getaddrinfo("127.0.0.1", port, *args, **kwargs)
+        return getaddrinfo(host, port, *args, **kwargs)
+
+    async def _resolve(qname, rdtype="A", *args, **kwargs):
+        name = str(qname).rstrip(".").lower()
+        if not name.endswith(BENCH_SUFFIX):
+            return await resolve(qname, rdtype, *args, **kwargs)
+        await asyncio.sleep(stub.latency)
+        texts = _zone(name, str(rdtype))
+        if not texts:
+            raise dns.resolver.NoAnswer()
+        return _Answer(dns.rrset.from_text(name + ".", 300, "IN", str(rdtype), *texts))
+
+    saved_env = {k: os.environ.get(k) for k in ("REQUESTS_CA_BUNDLE", "SSL_CERT_FILE")}
+    socket.getaddrinfo, dns.asyncresolver.resolve = _getaddrinfo, _resolve
+    os.environ.update(REQUESTS_CA_BUNDLE=stub.cert_file, SSL_CERT_FILE=stub.cert_file)
+    try:
+        yield
+    finally:
+        socket.getaddrinfo, dns.asyncresolver.resolve = getaddrinfo, resolve
+        for k, v in saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+# === Runner ===
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+@contextmanager
+def _light_tiers(tasks):
+    """Leave the nmap/nikto checks out: they shell out to tools that resolve names themselves"""
+    saved = dict(tasks.TIERS)
+    for tier, tests in saved.items():
+        tasks.TIERS[tier] = [t for t in tests if tasks.check_id(t[1]) not in tasks.HEAVY_CHECKS]
+    try:
+        yield
+    finally:
+        tasks.TIERS.update(saved)
+
+
+@contextmanager
+def _eager():
+    # The heavy checks run in a chord; eager mode runs it in this process
+    saved = current_app.conf.task_always_eager
+    current_app.conf.task_always_eager = True
+    try:
+        yield
+    finally:
+        current_app.conf.task_always_eager = saved
+
+
+def _summary(samples):
+    return {
+        "p50": round(percentile(samples, 50), 3),
+        "p95": round(percentile(samples, 95), 3),
+        "max": round(max(samples), 3),
+        "runs": len(samples),
+    }
+
+
+def run_benchmark(tiers=("free", "pro", "enterprise"), scans=5, warmup=1, latency=DEFAULT_LATENCY,
+                  posts=DEFAULT_PAGES, heavy=False, log=print) -> dict:
+    """Scan the stub site scans times per tier; returns the JSON-friendly report"""
+    from users.models import FirmProfile, UserAccount
+    from . import tasks
+    from .models import ScanResult
+
+    tag = uuid.uuid4().hex[:8]
+    user = UserAccount.objects.create(username=f"bench-{tag}", email=f"bench-{tag}@example.test")
+    firm = FirmProfile.objects.create(
+        user=user, firm_name="Scanner benchmark", email=f"bench-{tag}@example.test",
+        domain=f"firm-{tag}{BENCH_SUFFIX}", phone=None,
+    )
+    stub = StubSite(latency, posts).start()
+    report = {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": {"tiers": list(tiers), "scans": scans, "warmup": warmup, "latency_ms": round(latency * 1000),
+                   "pages": len(stub.site), "heavy": heavy},
+        "tiers": {},
+    }
+    try:
+        with ExitStack() as stack:
+            stack.enter_context(routed_to(stub))
+            stack.enter_context(_eager() if heavy else _light_tiers(tasks))
+            for tier in tiers:
+                durations, walls, target_requests, scanner_requests, errors = {}, [], [], [], 0
+                for n in range(warmup + scans):
+                    # A fresh host per scan, so no cache or shared probe carries over between scans
+                    scan = ScanResult.objects.create(firm=firm, user=user, domain=f"{tier}-{n}-{tag}{BENCH_SUFFIX}")
+                    before, started = stub.requests, time.monotonic()
+                    outcome = tasks.run_compliance_scan.apply(args=[scan.pk], kwargs={"force_refresh": True, "tier": tier})
+                    wall = time.monotonic() - started
+                    if n < warmup:
+                        continue
+                    scan.refresh_from_db()
+                    errors += outcome.failed() or scan.status != 'COMPLETED'
+                    walls.append(wall)
+                    target_requests.append(stub.requests - before)
+                    telemetry = scan.raw_data.get("telemetry", {})
+                    scanner_requests.append(telemetry.get("requests", 0))
+                    for stat_id, seconds in telemetry.get("durations", {}).items():
+                        durations.setdefault(stat_id, []).append(seconds)
+                    log(f"{tier} scan {n - warmup + 1}/{scans}: {wall:.2f}s, {target_requests[-1]} requests")
+                report["tiers"][tier] = {
+                    "checks": len(tasks.TIERS[tier]),
+                    "scans": len(walls),
+                    "errors": errors,
+                    "scans_per_minute": round(len(walls) * 60 / sum(walls), 2) if walls else 0,
+                    "scan_seconds": _summary(walls) if walls else None,
+                    "target_requests_per_scan": round(sum(target_requests) / len(walls), 1) if walls else 0,
+                    "scanner_requests_per_scan": round(sum(scanner_requests) / len(walls), 1) if walls else 0,
+                    "peak_rss_mb": peak_rss_mb(),
+                    "durations": {k: _summary(v) for k, v in sorted(durations.items(), key=lambda i: -max(i[1]))},
+                }
+    finally:
+        stub.stop()
+        # Deletes the benchmark's scans with the firm
+        firm.delete()
+        user.delete()
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
@@ -0,0 +1,87 @@
+# scanner/check_stats.py
+# Rolling per-check duration samples (Redis, via the default Django cache) used to
+# start the slowest checks and resources first
+
+from django.core.cache import cache
+
+from .result_cache import normalize_domain
+
+DAY = 24 * 60 * 60
+GLOBAL_SAMPLES = 200   # most recent durations kept per check
+DOMAIN_SAMPLES = 20    # ... and per check and domain
+DOMAIN_MIN_SAMPLES = 3  # before a domain's own history is trusted over the global one
+STATS_TTL = 30 * DAY
+
+# Estimate (seconds) for checks that have never run
+DEFAULT_ESTIMATES = {"light": 1.0, "heavy": 300.0}
+
+
+def _key(stat_id, domain=None):
+    if domain:
+        return f"scanner:durations:{stat_id}:{normalize_domain(domain)}"
+    return f"scanner:durations:{stat_id}"
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers (None when empty)"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def record_durations(domain, durations: dict):
+    """Append {stat_id: seconds} from one scan to the global and per-domain samples"""
+    if not durations:
+        return
+    keys = {}
+    for stat_id in durations:
+        keys[_key(stat_id)] = (stat_id, GLOBAL_SAMPLES)
+        keys[_key(stat_id, domain)] = (stat_id, DOMAIN_SAMPLES)
+    try:
+        # Read-modify-write without a lock: a sample lost to a concurrent scan doesn't matter
+        found = cache.get_many(list(keys))
+        updated = {}
+        for key, (stat_id, size) in keys.items():
+            samples = found.get(key, []) + [round(durations[stat_id], 3)]
+            updated[key] = samples[-size:]
+        cache.set_many(updated, STATS_TTL)
+    except Exception as e:
+        print(f"[Check stats unavailable] {e}")
+
+
+def duration_stats(stat_ids, domain=None) -> dict:
+    """{stat_id: {"p50", "p95", "samples"}} from the global history (or one domain's)"""
+    keys = {_key(stat_id, domain): stat_id for stat_id in stat_ids}
+    try:
+        found = cache.get_many(list(keys))
+    except Exception as e:
+        print(f"[Check stats unavailable] {e}")
+        found = {}
+    return {
+        keys[key]: {"p50": percentile(samples, 50), "p95": percentile(samples, 95), "samples": len(samples)}
+        for key, samples in found.items()
+    }
+
+
+def estimate_durations(domain, stat_ids, costs=None) -> dict:
+    """Expected seconds per stat_id: the domain's own p50 once it has enough history,
+    else the global p50, else a default for the check's cost class"""
+    costs = costs or {}
+    global_stats = duration_stats(stat_ids)
+    domain_stats = duration_stats(stat_ids, domain)
+    estimates = {}
+    for stat_id in stat_ids:
+        own = domain_stats.get(stat_id)
+        if own and own["samples"] >= DOMAIN_MIN_SAMPLES:
+            estimates[stat_id] = own["p50"]
+        elif stat_id in global_stats:
+            estimates[stat_id] = global_stats[stat_id]["p50"]
+        else:
+            estimates[stat_id] = DEFAULT_ESTIMATES.get(costs.get(stat_id, "light"), 1.0)
+    return estimates
+
+
+def longest_first(items, stat_id, estimates):
+    """items sorted by estimated duration, slowest first (stable for ties)"""
+    return sorted(items, key=lambda item: -estimates.get(stat_id(item), 0))
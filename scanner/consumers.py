@@ -115,3 +115,10 @@ class NotificationConsumer(WebsocketConsumer):
             "risk_score": event["risk_score"],
             "scan_id": event["scan_id"]
         }))
+
+    def batch_notification(self, event):
+        self.send(text_data=json.dumps({
+            "type": "notification",
+            "message": event["message"],
+            "batch_id": event["batch_id"]
+        }))
@@ -0,0 +1,101 @@
+# scanner/deltas.py
+# What changed since the last scan of a domain. Each finished scan keeps a small index of its
+# check outcomes by fingerprint (ScanResult.finding_index) and, once, the difference to the
+# previous completed scan's index (ScanResult.delta): new, resolved and changed findings.
+# Both are encrypted like the raw data (finding titles say what is wrong with a site), but
+# reading "what changed" only decrypts these two small fields, never a scan's raw data.
+
+import hashlib
+
+from .models import ScanResult
+
+FAILING = ("fail", "warn")
+OUTCOMES = ("pass",) + FAILING  # errored or skipped checks say nothing about a finding
+SEVERITY = ("status", "risk_level")
+
+
+def fingerprint(result: dict) -> str:
+    """Stable id of a finding: its check, since titles vary with the outcome of a check"""
+    key = result.get("check") or f"{result.get('standard') or ''}|{result.get('title') or ''}".lower()
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def finding_index(results) -> dict:
+    """{fingerprint: outcome} for the results that reached a pass/fail/warn verdict"""
+    index = {}
+    for result in results:
+        if isinstance(result, dict) and result.get("status") in OUTCOMES:
+            index[fingerprint(result)] = {
+                "title": result.get("title") or "",
+                "standard": result.get("standard") or "",
+                "status": result["status"],
+                "risk_level": result.get("risk_level") or "",
+            }
+    return index
+
+
+def _entry(fp, outcome, **extra):
+    return dict(outcome, fingerprint=fp, **extra)
+
+
+def compare(before: dict, after: dict) -> dict:
+    """Findings of after that are new, resolved or changed in severity compared to before.
+
+    A finding whose check reached no verdict this time (error, skipped, not in the tier)
+    is "unverified" rather than resolved.
+    """
+    new, changed, resolved, unverified = [], [], [], []
+    for fp, outcome in after.items():
+        was = before.get(fp)
+        if outcome["status"] not in FAILING:
+            continue
+        if was is None or was["status"] not in FAILING:
+            new.append(_entry(fp, outcome))
+        elif any(was[field] != outcome[field] for field in SEVERITY):
+            changed.append(_entry(fp, outcome, was={field: was[field] for field in SEVERITY}))
+    for fp, was in before.items():
+        if was["status"] not in FAILING:
+            continue
+        outcome = after.get(fp)
+        if outcome is None:
+            unverified.append(_entry(fp, was))
+        elif outcome["status"] not in FAILING:
+            resolved.append(_entry(fp, was))
+    return {
+        "new": new,
+        "resolved": resolved,
+        "changed": changed,
+        "unverified": unverified,
+        "unchanged": sum(1 for fp, o in after.items() if o["status"] in FAILING) - len(new) - len(changed),
+    }
+
+
+def previous_scan(scan):
+    """The latest completed scan of the same firm and domain, loading only its finding index"""
+    return (
+        ScanResult.objects.filter(firm_id=scan.firm_id, domain=scan.domain, status='COMPLETED')
+        .exclude(pk=scan.pk)
+        .order_by('-completed_at')
+        .only('pk', 'scan_id', 'completed_at', '_finding_index')
+        .first()
+    )
+
+
+def record_delta(scan, results):
+    """Set the scan's finding_index, previous_scan and delta (the caller saves the scan).
+
+    A previous scan from before finding indexes were kept has nothing to compare with,
+    so delta stays empty and this scan becomes the baseline.
+    """
+    scan.finding_index = finding_index(results)
+    previous = previous_scan(scan)
+    scan.previous_scan = previous
+    before = previous.finding_index if previous is not None else None
+    if not before:
+        scan.delta = None
+        return
+    scan.delta = dict(
+        compare(before, scan.finding_index),
+        previous_scan_id=previous.scan_id,
+        previous_completed_at=previous.completed_at.isoformat() if previous.completed_at else None,
+    )
@@ -0,0 +1,111 @@
+# scanner/incremental.py
+# Incremental rescans: keep resource fingerprints/validators and passive check results on
+# each completed scan, and reuse those results next time if the inputs are byte-identical
+
+from .models import ScanResult
+from .result_cache import CHECK_VERSIONS
+from .scanner_tasks.registry import get_check, check_id
+from .scanner_tasks.resources import ACTIVE_RESOURCES, CONDITIONAL_RESOURCES
+
+STATE_KEY = "incremental"  # in ScanResult.raw_data
+BASELINE_LOOKBACK = 5      # recent completed scans searched for one with incremental state
+
+
+def is_passive(entry) -> bool:
+    """Reusable checks only read declared resources, and none of them are attack probes"""
+    return (
+        entry is not None
+        and entry.cost == "light"
+        and bool(entry.resources)
+        and not any(name in ACTIVE_RESOURCES for name in entry.resources)
+    )
+
+
+class Baseline:
+    """What the previous completed scan of the domain saw"""
+
+    def __init__(self, scan_id: str, state: dict, crawl: dict | None = None):
+        self.scan_id = scan_id
+        self.resources = state.get("resources", {})
+        self.checks = state.get("checks", {})
+        self.crawl = crawl or {}  # its crawl summary, for a rescan that crawls nothing
+
+    def validators(self) -> dict:
+        """url -> {"etag", "last_modified", "hash"} for the pages worth a conditional GET"""
+        validators = {}
+        for name in CONDITIONAL_RESOURCES:
+            info = self.resources.get(name) or {}
+            if info.get("url") and info.get("hash") and (info.get("etag") or info.get("last_modified")):
+                validators[info["url"]] = info
+        return validators
+
+    def reusable(self, ctx, selected_tests) -> dict:
+        """{idx: previous result} for passive checks whose every input hash is unchanged"""
+        reused = {}
+        for idx, (test_name, test_func) in enumerate(selected_tests):
+            entry = get_check(test_func)
+            previous = self.checks.get(check_id(test_func))
+            if not is_passive(entry) or not previous:
+                continue
+            current = {name: ctx.fingerprints.get(name, {}).get("hash") for name in entry.resources}
+            # A result from an older version of the check is never reused
+            version = CHECK_VERSIONS.get(entry.id, 1)
+            if None not in current.values() and current == previous.get("inputs") and previous.get("version", 1) == version:
+                reused[idx] = dict(
+                    previous["result"],
+                    reused_from=previous["result"].get("reused_from") or self.scan_id,
+                )
+        return reused
+
+
+def load_baseline(scan) -> Baseline | None:
+    """The latest completed scan of the same firm and domain that recorded incremental state.
+
+    Partial and cancelled scans are never COMPLETED, so they are not baselines; scans
+    without usable state (older code, external scanner) are passed over.
+    """
+    recent = (
+        ScanResult.objects.filter(firm_id=scan.firm_id, domain=scan.domain, status='COMPLETED')
+        .exclude(pk=scan.pk)
+        .order_by('-completed_at')
+        .only('pk', 'scan_id', '_raw_data')[:BASELINE_LOOKBACK]
+    )
+    for previous in recent:
+        try:
+            data = previous.raw_data
+            state = data.get(STATE_KEY) or {}
+        except Exception as e:
+            print(f"[Incremental baseline unreadable] {e}")
+            continue
+        if state.get("resources") or state.get("checks"):
+            return Baseline(previous.scan_id, state, data.get("crawl"))
+    return None
+
+
+def snapshot(ctx, selected_tests, results, baseline=None) -> dict:
+    """Incremental state for this scan: resource fingerprints and passive results by check id.
+
+    results is {idx: result} for selected_tests; errors are not kept, so they always re-run.
+    What this scan did not fetch or run (results served from the result cache) is carried
+    over from baseline, so a cached rescan doesn't leave the next scan without state.
+    """
+    checks, ran = {}, set()
+    for idx, (test_name, test_func) in enumerate(selected_tests):
+        entry = get_check(test_func)
+        result = results.get(idx)
+        if entry is not None and result and not result.get("cached"):
+            ran.add(entry.id)
+        if not is_passive(entry) or not result or result.get("status") == "error" or result.get("cached"):
+            continue
+        inputs = {name: ctx.fingerprints.get(name, {}).get("hash") for name in entry.resources}
+        if None not in inputs.values():
+            checks[entry.id] = {"inputs": inputs, "result": result, "version": CHECK_VERSIONS.get(entry.id, 1)}
+    resources = {
+        name: {k: v for k, v in info.items() if k != "not_modified"}
+        for name, info in ctx.fingerprints.items()
+    }
+    if baseline is not None:
+        # A carried-over result is only reused while its recorded inputs still match
+        checks = dict({cid: state for cid, state in baseline.checks.items() if cid not in ran}, **checks)
+        resources = dict(baseline.resources, **resources)
+    return {"resources": resources, "checks": checks}
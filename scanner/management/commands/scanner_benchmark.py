@@ -0,0 +1,44 @@
+# scanner/management/commands/scanner_benchmark.py
+import json
+
+from django.core.management.base import BaseCommand
+
+from scanner.benchmark import DEFAULT_LATENCY, DEFAULT_PAGES, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks full scans against a local HTTPS stub site (no network access needed) and '
+        'prints JSON: scans/minute, per-check latency, requests per scan and peak RSS per tier. '
+        'Scans are stored and deleted again; check durations are recorded like any other scan, '
+        'so point --settings at a development database and cache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tiers', nargs='+', default=['free', 'pro', 'enterprise'])
+        parser.add_argument('--scans', type=int, default=5, help='Timed scans per tier')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed scans per tier first')
+        parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY * 1000,
+                            help='Milliseconds added to every stub HTTP response and DNS answer')
+        parser.add_argument('--pages', type=int, default=DEFAULT_PAGES, help='Blog posts on the stub site')
+        parser.add_argument('--heavy', action='store_true',
+                            help='Also run nmap/nikto (needs the tools; they resolve the stub hosts themselves)')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        report = run_benchmark(
+            tiers=options['tiers'],
+            scans=options['scans'],
+            warmup=options['warmup'],
+            latency=options['latency'] / 1000,
+            posts=options['pages'],
+            heavy=options['heavy'],
+            log=self.stderr.write,
+        )
+        data = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(data + "\n")
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,24 @@
+# scanner/management/commands/scanner_check_stats.py
+from django.core.management.base import BaseCommand
+
+from scanner.check_stats import duration_stats
+from scanner.scanner_tasks.resources import RESOURCES
+from scanner.tasks import CHECKS
+
+
+class Command(BaseCommand):
+    help = 'Shows p50/p95 run time per check and prefetched resource, slowest first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domain', help='Only the history recorded for this domain')
+
+    def handle(self, *args, **options):
+        stat_ids = list(CHECKS) + [f"resource:{name}" for name in RESOURCES]
+        stats = duration_stats(stat_ids, options.get('domain'))
+        if not stats:
+            self.stdout.write("No durations recorded yet.")
+            return
+
+        self.stdout.write(f"{'check / resource':<45} {'p50':>8} {'p95':>8} {'runs':>6}")
+        for stat_id, s in sorted(stats.items(), key=lambda item: -item[1]["p95"]):
+            self.stdout.write(f"{stat_id:<45} {s['p50']:>7.2f}s {s['p95']:>7.2f}s {s['samples']:>6}")
@@ -0,0 +1,17 @@
+# scanner/management/commands/scanner_queue_stats.py
+from django.core.management.base import BaseCommand
+
+from scanner.queues import SUBSCRIPTION_TIERS, queue_depth, queue_wait_stats, scan_queue
+
+
+class Command(BaseCommand):
+    help = 'Shows queued scans and p50/p95 queue wait (request to start) per subscription tier'
+
+    def handle(self, *args, **options):
+        stats = queue_wait_stats()
+        self.stdout.write(f"{'tier':<12} {'queued':>7} {'p50':>9} {'p95':>9} {'max':>9} {'scans':>6}")
+        for tier in SUBSCRIPTION_TIERS:
+            depth = queue_depth(scan_queue(tier))
+            s = stats.get(tier)
+            waits = f"{s['p50']:>8.1f}s {s['p95']:>8.1f}s {s['max']:>8.1f}s {s['samples']:>6}" if s else f"{'-':>9} {'-':>9} {'-':>9} {0:>6}"
+            self.stdout.write(f"{tier:<12} {'?' if depth is None else depth:>7} {waits}")
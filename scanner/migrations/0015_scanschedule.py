@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-17 10:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0014_scanbatch'),
+        ('users', '0012_remove_useraccount_pending_subscription_tier_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=255)),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly')], default='daily', max_length=10)),
+                ('enabled', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('next_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('deferrals', models.IntegerField(default=0)),
+                ('firm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scan_schedules', to='users.firmprofile')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scan_schedules', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['domain'],
+            },
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='schedule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scans', to='scanner.scanschedule'),
+        ),
+        migrations.AddIndex(
+            model_name='scanschedule',
+            index=models.Index(fields=['enabled', 'next_run_at'], name='scanner_sca_enabled_3cadc9_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='scanschedule',
+            constraint=models.UniqueConstraint(fields=('firm', 'domain'), name='unique_scan_schedule_per_domain'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-17 10:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0015_scanschedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanresult',
+            name='delta',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='finding_index',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='previous_scan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='next_scans', to='scanner.scanresult'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-17 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0016_scanresult_delta'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scanresult',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'PENDING'), ('RUNNING', 'RUNNING'), ('COMPLETED', 'COMPLETED'), ('PARTIAL', 'PARTIAL'), ('FAILED', 'FAILED'), ('CANCELLED', 'CANCELLED')], default='PENDING', max_length=10),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-17 11:12
+
+import json
+
+import encrypted_model_fields.fields
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations
+
+
+def encrypt_existing(apps, schema_editor):
+    ScanResult = apps.get_model('scanner', 'ScanResult')
+    scans = ScanResult.objects.exclude(finding_index={}, delta=None).only('pk', 'finding_index', 'delta')
+    for scan in scans.iterator():
+        scan._finding_index = json.dumps(scan.finding_index or {}, cls=DjangoJSONEncoder)
+        scan._delta = json.dumps(scan.delta, cls=DjangoJSONEncoder) if scan.delta else ''
+        scan.save(update_fields=['_finding_index', '_delta'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0017_alter_scanresult_status_partial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanresult',
+            name='_delta',
+            field=encrypted_model_fields.fields.EncryptedTextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='_finding_index',
+            field=encrypted_model_fields.fields.EncryptedTextField(default='{}'),
+        ),
+        migrations.RunPython(encrypt_existing, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='scanresult',
+            name='delta',
+        ),
+        migrations.RemoveField(
+            model_name='scanresult',
+            name='finding_index',
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-17 11:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0018_encrypt_finding_index_delta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanresult',
+            name='queued_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='run_options',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -12,11 +12,93 @@ import json
 import uuid
 
 
+class ScanBatch(models.Model):
+    """A portfolio scan: many domains for one firm submitted as a single job."""
+
+    STATUS_CHOICES = [
+        ("RUNNING", "RUNNING"),
+        ("COMPLETED", "COMPLETED"),
+    ]
+
+    firm = models.ForeignKey(FirmProfile, on_delete=models.CASCADE, related_name="scan_batches")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name="scan_batches",
+        null=True,
+        blank=True
+    )
+    batch_id = models.CharField(max_length=36, unique=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="RUNNING")
+    total = models.IntegerField(default=0)
+    summary = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Batch {self.batch_id} – {self.total} domains – {self.status}"
+
+    @property
+    def progress(self):
+        """Aggregate 0–100 progress across every scan in the batch"""
+        if not self.total:
+            return 100
+        done = sum(
+            100 if status in ("COMPLETED", "PARTIAL", "FAILED", "CANCELLED") else progress
+            for status, progress in self.scans.values_list("status", "progress")
+        )
+        return int(done / self.total)
+
+
+class ScanSchedule(models.Model):
+    """A recurring rescan of one domain for a firm (started by scanner.scheduling)."""
+
+    FREQUENCY_CHOICES = [
+        ("daily", "Daily"),
+        ("weekly", "Weekly"),
+    ]
+
+    firm = models.ForeignKey(FirmProfile, on_delete=models.CASCADE, related_name="scan_schedules")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name="scan_schedules",
+        null=True,
+        blank=True
+    )
+    domain = models.CharField(max_length=255)
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default="daily")
+    enabled = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Start of the next run: a fixed, hash-derived slot in each day/week (scheduling.next_slot)
+    next_run_at = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    # Ticks this run was held back because the tier's queue was full
+    deferrals = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["domain"]
+        constraints = [
+            models.UniqueConstraint(fields=["firm", "domain"], name="unique_scan_schedule_per_domain"),
+        ]
+        indexes = [
+            models.Index(fields=["enabled", "next_run_at"]),
+        ]
+
+    def __str__(self):
+        return f"Schedule {self.domain} – {self.frequency} – {'on' if self.enabled else 'off'}"
+
+
 class ScanResult(models.Model):
     STATUS_CHOICES = [
         ("PENDING", "PENDING"),
         ("RUNNING", "RUNNING"),
         ("COMPLETED", "COMPLETED"),
+        # Stopped at its time budget: findings are kept, but the scan is not graded or reported
+        ("PARTIAL", "PARTIAL"),
         ("FAILED", "FAILED"),
         ("CANCELLED", "CANCELLED"),
     ]
@@ -29,8 +111,26 @@ class ScanResult(models.Model):
         null=True, # Allows existing scans to remain
         blank=True
     )
+    batch = models.ForeignKey(
+        ScanBatch,
+        on_delete=models.SET_NULL,
+        related_name="scans",
+        null=True,
+        blank=True
+    )
+    schedule = models.ForeignKey(
+        ScanSchedule,
+        on_delete=models.SET_NULL,
+        related_name="scans",
+        null=True,
+        blank=True
+    )
     domain = models.CharField(max_length=255)
     scan_date = models.DateTimeField(auto_now_add=True)
+    # When the scan's task was sent to a worker; None while it waits for a firm slot (batches.py)
+    queued_at = models.DateTimeField(null=True, blank=True, default=timezone.now)
+    run_options = models.JSONField(default=dict, blank=True)  # task kwargs it is queued with again
+    started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     
     @property
@@ -55,6 +155,17 @@ class ScanResult(models.Model):
     recommendations = models.JSONField(default=list)
     anomaly_score = models.FloatField(null=True, blank=True)
 
+    # Changes since the previous completed scan of the domain (scanner/deltas.py)
+    previous_scan = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        related_name="next_scans",
+        null=True,
+        blank=True
+    )
+    _finding_index = EncryptedTextField(default="{}")
+    _delta = EncryptedTextField(blank=True, default="")
+
     scan_log = EncryptedTextField(blank=True)
     pdf_report_path = models.CharField(max_length=500, null=True, blank=True)
 
@@ -111,6 +222,23 @@ class ScanResult(models.Model):
 
     checklist_status = property(get_checklist_status, set_checklist_status)
 
+    # Finding index ({fingerprint: outcome}) and delta to the previous scan
+    def get_finding_index(self):
+        return self._get_json(self._finding_index)
+
+    def set_finding_index(self, value):
+        self._set_json("_finding_index", value)
+
+    finding_index = property(get_finding_index, set_finding_index)
+
+    def get_delta(self):
+        return self._get_json(self._delta) or None
+
+    def set_delta(self, value):
+        self._set_json("_delta", value)
+
+    delta = property(get_delta, set_delta)
+
     # ---------------------------------------------------------------- #
     # PDF-safe getters
     # ---------------------------------------------------------------- #
@@ -126,7 +254,11 @@ class ScanResult(models.Model):
         return self.raw_data.get("vulnerabilities", [])
 
     def get_scanned_urls(self):
-        return self.raw_data.get("scanned_urls", [])
+        crawl = self.raw_data.get("crawl")
+        if crawl is None and self.previous_scan_id:
+            # No crawl ran (every site check came from the result cache)
+            crawl = self.previous_scan.raw_data.get("crawl")
+        return (crawl or {}).get("urls", [])
 
     # ---------------------------------------------------------------- #
     # Duration
@@ -0,0 +1,158 @@
+# scanner/progress.py
+# Live progress of running scans at bounded write rates: per scan at most one DB write every
+# DB_INTERVAL and one websocket message every WS_INTERVAL, the latest state winning. Messages
+# go out on one event loop per worker process, so they share one channel-layer connection
+# instead of opening one per async_to_sync() call.
+
+import asyncio
+import os
+import threading
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+DB_INTERVAL = float(getattr(settings, "SCANNER_PROGRESS_DB_INTERVAL", 2))
+WS_INTERVAL = float(getattr(settings, "SCANNER_PROGRESS_WS_INTERVAL", 0.25))
+SEND_TIMEOUT = 5  # seconds; the final messages of a scan are waited for this long
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+# scan pk -> its publisher in this process
+_publishers = {}
+_publishers_lock = threading.Lock()
+
+
+def _get_loop():
+    """The worker's sender loop, started on first use (again in a forked child)"""
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="progress-loop", daemon=True).start()
+        return _loop
+
+
+async def _group_send(group, message):
+    try:
+        await asyncio.wait_for(get_channel_layer().group_send(group, message), SEND_TIMEOUT)
+    except Exception as e:
+        print(f"WS Error: {e}")
+
+
+def send(group: str, message: dict, wait: bool = False):
+    """group_send on the worker's sender loop; wait=True blocks until it is delivered"""
+    try:
+        future = asyncio.run_coroutine_threadsafe(_group_send(group, message), _get_loop())
+        if wait:
+            future.result(SEND_TIMEOUT + 1)
+    except Exception as e:
+        print(f"WS Error: {e}")
+
+
+class ProgressPublisher:
+    """Coalesces the progress updates of one scan.
+
+    update() saves progress/current_step only if DB_INTERVAL has passed since the last
+    write (flush() writes what is left) and queues a websocket message; queued messages
+    replace each other until the sender gets to them. finish() delivers the final messages
+    after anything still queued.
+    """
+
+    def __init__(self, scan):
+        self.scan = scan
+        self.group = f"scan_{scan.scan_id}"
+        self._saved_at = 0.0
+        self._dirty = False
+        self._pending = None   # newest websocket message not sent yet
+        self._sender = None    # future of the running _drain()
+        self._lock = threading.Lock()
+
+    def update(self, progress, step):
+        self.scan.progress = progress
+        self.scan.current_step = step
+        if time.monotonic() - self._saved_at >= DB_INTERVAL:
+            self._save()
+        else:
+            self._dirty = True
+        self._publish({"type": "scan_update", "progress": progress, "step": step, "status": "RUNNING"})
+
+    def flush(self):
+        """Write progress/current_step if an update is still held back"""
+        if self._dirty:
+            self._save()
+
+    def _save(self):
+        try:
+            self.scan.save(update_fields=['progress', 'current_step'])
+        except Exception as e:
+            print(f"[Progress save failed] {e}")
+        self._saved_at = time.monotonic()
+        self._dirty = False
+
+    def _publish(self, message):
+        with self._lock:
+            self._pending = message
+            if self._sender is not None:
+                return
+            try:
+                self._sender = asyncio.run_coroutine_threadsafe(self._drain(), _get_loop())
+            except Exception as e:
+                self._pending = None
+                print(f"WS Error: {e}")
+
+    async def _drain(self):
+        while True:
+            with self._lock:
+                message, self._pending = self._pending, None
+                if message is None:
+                    self._sender = None
+                    return
+            await _group_send(self.group, message)
+            await asyncio.sleep(WS_INTERVAL)
+
+    def finish(self, messages):
+        """Drop queued updates (the caller saved the final state) and deliver messages in order"""
+        with self._lock:
+            self._pending = None
+            sender = self._sender
+        self._dirty = False
+
+        async def _final():
+            if sender is not None:
+                # Lets a message already being sent arrive before the final ones
+                await asyncio.wrap_future(sender)
+            for message in messages:
+                await _group_send(self.group, message)
+
+        try:
+            asyncio.run_coroutine_threadsafe(_final(), _get_loop()).result(SEND_TIMEOUT * (len(messages) + 1) + 1)
+        except Exception as e:
+            print(f"WS Finalize Error: {e}")
+
+
+def publisher(scan) -> ProgressPublisher:
+    """The publisher of this scan in this process (one per scan, so its limits hold)"""
+    with _publishers_lock:
+        current = _publishers.get(scan.pk)
+        if current is None:
+            current = _publishers[scan.pk] = ProgressPublisher(scan)
+        current.scan = scan
+        return current
+
+
+def close(scan, messages=None):
+    """Forget the scan's publisher: write what is held back, or deliver the final messages"""
+    with _publishers_lock:
+        current = _publishers.pop(scan.pk, None)
+    if current is None:
+        current = ProgressPublisher(scan) if messages else None
+    if current is None:
+        return
+    if messages:
+        current.finish(messages)
+    else:
+        current.flush()
@@ -0,0 +1,83 @@
+# scanner/queues.py
+# Tier-aware scan queues: run_compliance_scan is routed to one queue per subscription tier,
+# so a burst of trial scans never sits in front of an enterprise customer's scan. Workers
+# drain the queues they listen on in the order given to -Q (broker queue_order_strategy),
+# and the priority worker only listens on the paid tiers' queues (see Procfile).
+
+from django.core.cache import cache
+
+from .check_stats import STATS_TTL, percentile
+
+# Subscription tiers (FirmProfile.SUBSCRIPTION_CHOICES), highest priority first
+SUBSCRIPTION_TIERS = ("enterprise", "pro", "basic", "trial")
+DEFAULT_SUBSCRIPTION = "trial"
+# Subscription tier -> set of checks it buys (tasks.TIERS)
+SCAN_TIERS = {"enterprise": "enterprise", "pro": "pro", "basic": "free", "trial": "free"}
+
+WAIT_SAMPLES = 500  # most recent queue waits kept per tier
+
+
+def scan_queue(subscription_tier: str) -> str:
+    tier = (subscription_tier or "").lower()
+    return f"scans.{tier if tier in SUBSCRIPTION_TIERS else DEFAULT_SUBSCRIPTION}"
+
+
+SCAN_QUEUES = [scan_queue(tier) for tier in SUBSCRIPTION_TIERS]
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Celery router (CELERY_TASK_ROUTES): each scan goes to its firm's tier queue.
+
+    The caller passes the firm's tier as the task's subscription kwarg, so routing
+    needs no DB query; without it the scan goes to the lowest tier's queue.
+    """
+    if name != "scanner.tasks.run_compliance_scan":
+        return None
+    return {"queue": scan_queue((kwargs or {}).get("subscription"))}
+
+
+# === Queue wait (scan_date -> started_at) ===
+
+def _wait_key(tier):
+    return f"scanner:queue_wait:{tier}"
+
+
+def record_queue_wait(tier: str, seconds: float):
+    """Append one scan's wait for a worker (and a firm slot) to its tier's samples"""
+    try:
+        # Read-modify-write without a lock, like check_stats: a lost sample doesn't matter
+        samples = cache.get(_wait_key(tier), []) + [round(max(seconds, 0), 3)]
+        cache.set(_wait_key(tier), samples[-WAIT_SAMPLES:], STATS_TTL)
+    except Exception as e:
+        print(f"[Queue stats unavailable] {e}")
+
+
+def queue_wait_stats() -> dict:
+    """{tier: {"p50", "p95", "max", "samples"}} for the tiers with recorded waits"""
+    try:
+        found = cache.get_many([_wait_key(tier) for tier in SUBSCRIPTION_TIERS])
+    except Exception as e:
+        print(f"[Queue stats unavailable] {e}")
+        found = {}
+    stats = {}
+    for tier in SUBSCRIPTION_TIERS:
+        samples = found.get(_wait_key(tier))
+        if samples:
+            stats[tier] = {
+                "p50": percentile(samples, 50),
+                "p95": percentile(samples, 95),
+                "max": max(samples),
+                "samples": len(samples),
+            }
+    return stats
+
+
+def queue_depth(queue: str) -> int | None:
+    """Messages waiting in a broker queue (None if the broker can't be asked)"""
+    from core.celery import app
+    try:
+        with app.connection_for_read() as conn:
+            return conn.default_channel.queue_declare(queue=queue, passive=True).message_count
+    except Exception as e:
+        print(f"[Queue depth unavailable] {e}")
+        return None
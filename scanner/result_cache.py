@@ -0,0 +1,83 @@
+# scanner/result_cache.py
+# Cross-scan cache of individual check results (Redis, via the default Django cache)
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .scanner_tasks.registry import check_id
+
+HOUR = 60 * 60
+
+# Seconds a check's result stays valid for the same domain. Checks not listed
+# use DEFAULT_TTL; a TTL of 0 disables caching for that check.
+CHECK_TTLS = {
+    # Certificate / TLS data changes rarely
+    "encryption.check_ssl_tls": 24 * HOUR,
+    "owasp.check_crypto_failures": 24 * HOUR,
+    "hipaa.check_hipaa_encryption": 24 * HOUR,
+    # Response headers
+    "owasp.check_missing_security_headers": 1 * HOUR,
+    "owasp.check_outdated_software": 1 * HOUR,
+    "pcidss.check_pci_dss_logging": 1 * HOUR,
+    # Heavy external tools
+    "nist.run_nmap_vuln_scan": 6 * HOUR,
+    "owasp.run_nikto_scan": 6 * HOUR,
+}
+DEFAULT_TTL = getattr(settings, "SCANNER_RESULT_CACHE_TTL", 1 * HOUR)
+
+# Bump a check's version when its logic changes so stale results are ignored
+CHECK_VERSIONS = {
+    # v3: relative Sitemap entries resolved, /sitemap.xml fallback, empty sitemaps count
+    "gdpr.crawl_sitemap": 3,
+    # v3: whole-word keyword matching (keywords.py)
+    "gdpr.check_gdpr_dsar": 3,
+    "gdpr.check_gdpr_dpia": 3,
+    "gdpr.check_gdpr_retention": 3,
+    "gdpr.check_gdpr_dpo": 3,
+    # v3: banner markers matched anywhere in the markup
+    "gdpr.check_cookies": 3,
+    # v2: whole-word keyword matching
+    "gdpr.check_privacy_policy": 2,
+    "owasp.check_auth_failures": 2,
+}
+
+
+def normalize_domain(domain: str) -> str:
+    return domain.strip().lower().rstrip(".")
+
+
+def _ttl(cid):
+    return CHECK_TTLS.get(cid, DEFAULT_TTL)
+
+
+def _key(cid, domain):
+    return f"scanner:result:{cid}:{normalize_domain(domain)}:v{CHECK_VERSIONS.get(cid, 1)}"
+
+
+def get_cached_results(domain, selected_tests) -> dict:
+    """Return {idx: result} for every selected check with a live cached result"""
+    keys = {}
+    for idx, (test_name, test_func) in enumerate(selected_tests):
+        cid = check_id(test_func)
+        if _ttl(cid):
+            keys[_key(cid, domain)] = idx
+    try:
+        found = cache.get_many(list(keys))
+    except Exception as e:
+        print(f"[Result cache unavailable] {e}")
+        return {}
+    return {keys[key]: result for key, result in found.items()}
+
+
+def store_result(domain, test_func, result):
+    cid = check_id(test_func)
+    ttl = _ttl(cid)
+    # Errors are usually transient (timeouts, DNS hiccups) — never pin them
+    if not ttl or result.get("status") == "error" or result.get("cached") or result.get("reused_from"):
+        return
+    entry = dict(result, cached_at=timezone.now().isoformat())
+    try:
+        cache.set(_key(cid, domain), entry, ttl)
+    except Exception as e:
+        print(f"[Result cache unavailable] {e}")
@@ -0,0 +1,105 @@
+# scanner_tasks/aio.py
+# Async I/O primitives for `async def check_x(ctx)` checks
+
+import asyncio
+import socket
+import ssl
+from contextvars import copy_context
+
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+from django.core.cache import cache
+
+from .helpers import _fetch, _get_page
+from .politeness import apolite
+
+DEFAULT_TIMEOUT = 10
+DNS_MAX_TTL = 3600       # seconds an answer is shared, even if its TTL is longer
+DNS_NEGATIVE_TTL = 300   # seconds "no such record" is shared
+
+
+async def resolve(host: str, timeout: float = DEFAULT_TIMEOUT) -> list:
+    """A/AAAA lookup without blocking the loop; falls back to getaddrinfo (e.g. /etc/hosts)"""
+    addresses = []
+    for rdtype in ("A", "AAAA"):
+        try:
+            answer = await dns.asyncresolver.resolve(host, rdtype, lifetime=timeout)
+            addresses.extend(r.address for r in answer)
+        except dns.exception.DNSException:
+            pass
+    if not addresses:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    return addresses
+
+
+def _record_text(rdata) -> str:
+    # TXT/SPF data comes in 255-byte chunks that only mean something joined
+    if hasattr(rdata, "strings"):
+        return b"".join(rdata.strings).decode("utf-8", "replace")
+    return rdata.to_text()
+
+
+async def lookup(name: str, rdtype: str, timeout: float = DEFAULT_TIMEOUT) -> list:
+    """Sorted record texts for (name, rdtype); [] when the name or record doesn't exist.
+
+    Answers are shared by every scan through the Django cache for their own TTL (capped
+    at DNS_MAX_TTL), so a firm's domains on the same provider resolve once. Timeouts and
+    server failures raise dns.exception.DNSException and are not cached.
+    """
+    key = f"scanner:dns:{rdtype}:{name.lower().rstrip('.')}"
+    try:
+        cached = await _in_executor(cache.get, key)
+    except Exception:
+        cached = None
+    if cached is not None:
+        return cached
+    try:
+        answer = await dns.asyncresolver.resolve(name, rdtype, lifetime=timeout)
+        records, ttl = sorted(_record_text(r) for r in answer), min(answer.rrset.ttl, DNS_MAX_TTL)
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        records, ttl = [], DNS_NEGATIVE_TTL
+    if ttl > 0:
+        try:
+            await _in_executor(cache.set, key, records, ttl)
+        except Exception as e:
+            print(f"[DNS cache unavailable] {e}")
+    return records
+
+
+async def tls_handshake(host: str, port: int = 443, timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """Open a TLS connection on the loop and return protocol, cipher and the peer certificate(s)"""
+    context = ssl.create_default_context()
+    async with apolite(host):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context, server_hostname=host),
+            timeout,
+        )
+    try:
+        ssock = writer.get_extra_info("ssl_object")
+        # Python 3.13+ exposes the verified chain; older versions only give the leaf
+        get_chain = getattr(ssock, "get_verified_chain", None)
+        return {
+            "protocol": ssock.version(),
+            "cipher": ssock.cipher()[0],
+            "der_cert": ssock.getpeercert(binary_form=True),
+            "der_chain": [bytes(c) for c in get_chain()] if get_chain else [],
+        }
+    finally:
+        writer.close()
+
+
+async def _in_executor(func, *args):
+    # Keeps the active ScanContext so the per-scan fetch cache is shared with sync checks
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, copy_context().run, func, *args)
+
+
+async def fetch(url: str, method: str = "GET", allow_redirects: bool = True):
+    """HTTP through the pooled session and the scan's response cache"""
+    return await _in_executor(_fetch, url, method, allow_redirects)
+
+
+async def get_page(url: str):
+    return await _in_executor(_get_page, url)
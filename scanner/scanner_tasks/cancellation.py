@@ -0,0 +1,72 @@
+# scanner_tasks/cancellation.py
+# Cooperative scan cancellation: a per-scan Redis flag (via the default Django cache) and a
+# wall-clock deadline, polled by the scan runner, the heavy tools and the chord callback
+
+import time
+
+from django.core.cache import cache
+
+CANCEL_TTL = 24 * 60 * 60  # seconds a cancel request is remembered
+POLL_INTERVAL = 1.0        # seconds between flag reads for one token
+
+
+class ScanCancelled(Exception):
+    """The scan was cancelled or ran out of time; reason says which"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _key(scan_pk):
+    return f"scanner:cancel:{scan_pk}"
+
+
+def request_cancel(scan_pk):
+    """Ask every worker running this scan to stop at its next poll"""
+    try:
+        cache.set(_key(scan_pk), True, CANCEL_TTL)
+    except Exception as e:
+        print(f"[Cancel flag unavailable] {e}")
+
+
+class CancelToken:
+    """Polled cancellation state of one scan.
+
+    deadline is a time.time() timestamp (None for no budget), so the token can be rebuilt
+    from (scan_pk, deadline) in another worker. Cache errors read as "not cancelled".
+    """
+
+    def __init__(self, scan_pk, deadline: float | None = None):
+        self.scan_pk = scan_pk
+        self.deadline = deadline
+        self.reason = None
+        self._next_poll = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        if self.reason is None:
+            self._poll()
+        return self.reason is not None
+
+    def _poll(self):
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.reason = "time budget exhausted"
+            return
+        now = time.monotonic()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + POLL_INTERVAL
+        try:
+            if cache.get(_key(self.scan_pk)):
+                self.reason = "scan cancelled"
+        except Exception as e:
+            print(f"[Cancel flag unavailable] {e}")
+
+    def remaining(self) -> float | None:
+        """Seconds left in the time budget (None without one)"""
+        return None if self.deadline is None else max(0.0, self.deadline - time.time())
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise ScanCancelled(self.reason)
@@ -1,5 +1,8 @@
 # scanner_tasks/cis.py
 
+from .registry import check
+
+@check("CIS Lockout", tier="enterprise")
 def check_cis_benchmark_1_4(domain: str):
     return {
         "title": "Account Lockout (CIS)",
@@ -0,0 +1,135 @@
+# scanner_tasks/context.py
+
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("scan_context", default=None)
+# url -> why its body was cut short, for the bodies the running check read (engine.py)
+_truncated = ContextVar("scan_check_truncated", default=None)
+
+
+class ScanContext:
+    """Per-scan store shared by every check, so each resource is fetched once."""
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self.stats = {"requests": 0, "cache_hits": 0}
+        self.prefetched = False  # set once the prefetch stage is done
+        self.durations = {}      # stat id ("module.func" or "resource:name") -> seconds
+        self.validators = {}     # url -> {"etag", "last_modified", "hash"} from the previous scan
+        self.resources = {}      # prefetched resource name -> value (or the exception it raised)
+        self.fingerprints = {}   # prefetched resource name -> {"hash", "url", "etag", ...}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._values = {}
+        self._async_values = {}
+
+    def memo(self, key, factory):
+        """Return factory() once per key; errors are cached and re-raised too."""
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key in self._values:
+                self.count("cache_hits")
+            else:
+                try:
+                    self._values[key] = (factory(), None)
+                except Exception as e:
+                    self._values[key] = (None, e)
+        value, error = self._values[key]
+        if error is not None:
+            raise error
+        return value
+
+    async def amemo(self, key, factory):
+        """Async twin of memo(): concurrent awaiters share one task on the scan's event loop"""
+        if key in self._async_values:
+            self.count("cache_hits")
+        else:
+            self._async_values[key] = asyncio.ensure_future(factory())
+        return await self._async_values[key]
+
+    def aseed(self, key, value):
+        """seed() for amemo(): awaiting key returns value (call on the scan's event loop)"""
+        if key not in self._async_values:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            self._async_values[key] = future
+
+    def seed(self, key, value):
+        """Memoize a value obtained elsewhere (e.g. from another scan) unless key already has one"""
+        with self._lock:
+            self._key_locks.setdefault(key, threading.Lock())
+            self._values.setdefault(key, (value, None))
+
+    def started(self, key) -> bool:
+        """True once something has asked memo() for key (its value may still be in flight)"""
+        with self._lock:
+            return key in self._key_locks
+
+    def forget(self, *keys):
+        """Drop memoized values so the next read goes back to the network"""
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+    def conditional_headers(self, url: str) -> dict | None:
+        validator = self.validators.get(url)
+        if not validator:
+            return None
+        headers = {}
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+        return headers or None
+
+    def count(self, stat: str, n=1):
+        with self._lock:
+            self.stats[stat] = self.stats.get(stat, 0) + n
+
+    def fetch(self, method: str, url: str, fetcher, allow_redirects: bool = True):
+        """Fetch (method, url) once per scan and hand back the stored response."""
+        def _fetch():
+            self.count("requests")
+            if self.prefetched:
+                # A check did its own I/O: the resource is missing from its registry entry
+                self.count("late_requests")
+            return fetcher()
+        return self.memo(("http", method.upper(), url, allow_redirects), _fetch)
+
+
+def current_context():
+    return _current.get()
+
+
+@contextmanager
+def scan_context(domain: str):
+    ctx = ScanContext(domain)
+    token = _current.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def collect_truncated():
+    """Collect {url: reason} for the truncated bodies read inside the block"""
+    notes = {}
+    token = _truncated.set(notes)
+    try:
+        yield notes
+    finally:
+        _truncated.reset(token)
+
+
+def note_truncated(value):
+    """Called with every response or ParsedPage handed to a check"""
+    notes = _truncated.get()
+    reason = getattr(value, "truncated", None)
+    if notes is not None and isinstance(reason, str):
+        notes[getattr(value, "url", "")] = reason
+    return value
@@ -0,0 +1,307 @@
+# scanner_tasks/crawler.py
+# Bounded site crawler, seeded from the homepage and the sitemap(s). It honours robots.txt,
+# keeps a per-host cap on pages in flight (on top of the shared politeness limiter) and stops
+# at a page, depth, byte or time bound. Each page is streamed through the registered
+# watchers and then dropped, so a scan keeps what the checks asked for, not every page.
+
+import asyncio
+import hashlib
+import time
+import xml.etree.ElementTree as ET
+from contextvars import copy_context
+from urllib import robotparser
+from urllib.parse import parse_qsl, urldefrag, urlencode, urljoin, urlsplit, urlunsplit
+
+from django.conf import settings
+
+from . import keywords
+from .context import current_context
+from .helpers import ParsedPage, _fetch, _get_page
+from .sessions import USER_AGENT, get_session
+
+MAX_PAGES = int(getattr(settings, "SCANNER_CRAWL_MAX_PAGES", 50))
+MAX_DEPTH = int(getattr(settings, "SCANNER_CRAWL_MAX_DEPTH", 3))
+MAX_BYTES = int(getattr(settings, "SCANNER_CRAWL_MAX_BYTES", 5 * 1024 * 1024))
+TIME_BUDGET = float(getattr(settings, "SCANNER_CRAWL_TIME_BUDGET", 30))
+PER_HOST = int(getattr(settings, "SCANNER_CRAWL_PER_HOST", 4))  # pages in flight per host
+MAX_SITEMAPS = 5        # sitemap files read, index files included
+MAX_CRAWL_DELAY = 5     # seconds; a larger robots.txt Crawl-delay is capped
+SKIP_EXTENSIONS = (
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".css", ".js", ".json",
+    ".xml", ".zip", ".gz", ".mp3", ".mp4", ".woff", ".woff2", ".doc", ".docx", ".xls", ".xlsx",
+)
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+# Keyword signals (keywords.py) looked for in the text of every crawled page
+WATCHERS = []
+
+
+def watch(signal: str, terms: list):
+    """Have every crawl note which pages mention any of terms (read back with mentions())"""
+    keywords.register(signal, terms)
+    if signal not in WATCHERS:
+        WATCHERS.append(signal)
+
+
+def canonical_url(url: str) -> str | None:
+    """One spelling per page (None for links that aren't http(s) pages).
+
+    Drops the fragment, the default port, tracking parameters and a trailing slash;
+    lower-cases the host and sorts the query.
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return None
+    host = parts.hostname.rstrip(".")
+    if port and port != {"http": 80, "https": 443}[parts.scheme]:
+        host = f"{host}:{port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((parts.scheme, host, parts.path.rstrip("/") or "/", urlencode(query), ""))
+
+
+class SiteCrawl:
+    """What one crawl saw: the pages crawled and, per watched signal, the pages mentioning it"""
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self.urls = []
+        self.bytes = 0
+        self.depth = 0
+        self.robots_ok = False
+        self.sitemap_ok = False
+        self.sitemap_urls = 0
+        self.disallowed = 0
+        self.stopped = None  # "pages", "bytes" or "time" when a bound cut the crawl short
+        self.truncated = []  # pages whose body was cut off at the size cap (sessions.py)
+        self.signals = {signal: [] for signal in WATCHERS}
+        self._hashes = []
+
+    @property
+    def pages(self) -> int:
+        return len(self.urls)
+
+    @property
+    def content_hash(self) -> str:
+        """Changes when any crawled page does, or when a different set of pages was crawled"""
+        return hashlib.sha256("\n".join(sorted(self._hashes)).encode()).hexdigest()
+
+    def add(self, url: str, page: ParsedPage):
+        self.urls.append(url)
+        if page.truncated:
+            self.truncated.append(url)
+        self._hashes.append(f"{url} {page.content_hash}")
+        hits = page.hits
+        for signal in WATCHERS:
+            if keywords.found(hits, signal):
+                self.signals[signal].append(url)
+
+    def summary(self) -> dict:
+        """JSON-friendly record for ScanResult.raw_data"""
+        return {
+            "pages": self.pages,
+            "bytes": self.bytes,
+            "depth": self.depth,
+            "robots": self.robots_ok,
+            "sitemap": self.sitemap_ok,
+            "sitemap_urls": self.sitemap_urls,
+            "disallowed": self.disallowed,
+            "stopped": self.stopped,
+            "truncated": self.truncated,
+            "urls": self.urls,
+        }
+
+
+def mentions(domain: str, signal: str) -> list:
+    """Crawled pages that mention a watched signal ([] when there was no crawl)"""
+    from .resources import resource
+    try:
+        return resource("site", domain).signals.get(signal, [])
+    except Exception:
+        return []
+
+
+# === Robots and sitemaps ===
+
+def _robots(domain):
+    """(parser or None, whether robots.txt exists); a missing or broken file allows everything"""
+    try:
+        response = _fetch(f"https://{domain}/robots.txt")
+    except Exception:
+        return None, False
+    if response.status_code != 200:
+        return None, False
+    parser = robotparser.RobotFileParser(response.url or f"https://{domain}/robots.txt")
+    parser.parse(response.text.splitlines())
+    return parser, True
+
+
+def _listed_sitemaps(parser) -> list:
+    """Sitemap: entries of robots.txt as absolute urls (they may be given relative to it)"""
+    if parser is None:
+        return []
+    return list(dict.fromkeys(urljoin(parser.url, entry.strip()) for entry in parser.site_maps() or []))
+
+
+def _sitemap_locs(url):
+    """(page urls, nested sitemap urls) listed in one sitemap file; None if there is none"""
+    response = _fetch(url)
+    if response.status_code != 200:
+        return None
+    root = ET.fromstring(response.content)
+    kind = root.tag.rsplit("}", 1)[-1]
+    if kind not in ("urlset", "sitemapindex"):
+        return None  # e.g. a soft 404 page
+    locs = [el.text.strip() for el in root.iter() if el.tag.rsplit("}", 1)[-1] == "loc" and el.text]
+    if kind == "sitemapindex":
+        return [], locs
+    return locs, []
+
+
+def _sitemap_urls(crawl, sitemaps, fallback=None):
+    """Page urls from the sitemaps, following index files.
+
+    fallback (/sitemap.xml) is read when none of sitemaps could be parsed. A sitemap
+    that parses counts as present, even if it lists no pages.
+    """
+    pages, seen = [], set()
+
+    def _read(pending, limit):
+        while pending and len(seen) < limit and len(pages) < MAX_PAGES:
+            url = pending.pop(0)
+            if url in seen:
+                continue
+            seen.add(url)
+            try:
+                listed = _sitemap_locs(url)
+            except Exception:
+                continue
+            if listed is None:
+                continue
+            crawl.sitemap_ok = True
+            locs, nested = listed
+            pages.extend(locs)
+            pending.extend(nested)
+
+    _read(list(sitemaps), MAX_SITEMAPS)
+    if not crawl.sitemap_ok and fallback and fallback not in seen:
+        _read([fallback], len(seen) + MAX_SITEMAPS)
+    crawl.sitemap_urls = len(pages)
+    return pages[:MAX_PAGES]
+
+
+# === Pages ===
+
+def _fetch_page(url, shared=False):
+    """(final url, parsed page or None, bytes). Shared pages (the homepage) go through the
+    scan's memo and pages a check also reads are reused; the rest are not memoized, so
+    the scan does not hold on to their text."""
+    ctx = current_context()
+    if shared or ctx is not None and ctx.started(("page", url)):
+        page = _get_page(url)
+        # A 304 has no text to stream to the watchers, so that page is fetched again below
+        if page is None or not page.not_modified:
+            return url, page if page and page.ok else None, page.size if page else 0
+    if ctx is not None:
+        ctx.count("requests")
+    response = get_session().get(url)
+    if not response.ok or "html" not in response.headers.get("Content-Type", "text/html").lower():
+        return response.url, None, len(response.content or b"")
+    page = ParsedPage(response.url, response)
+    return response.url, page, page.size
+
+
+async def crawl_site(ctx) -> SiteCrawl:
+    """The scan's site crawl, done once and shared by every check that reads it"""
+    return await ctx.amemo(("site", ctx.domain), lambda: _crawl(ctx))
+
+
+async def _crawl(ctx) -> SiteCrawl:
+    """Breadth-first crawl of ctx.domain (and its www. twin) within the configured bounds"""
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + TIME_BUDGET
+    bare = ctx.domain.lower().removeprefix("www.")
+    hosts = {bare, f"www.{bare}"}
+    crawl = SiteCrawl(ctx.domain)
+
+    def _run(func, *args):
+        return loop.run_in_executor(None, copy_context().run, func, *args)
+
+    parser, crawl.robots_ok = await _run(_robots, ctx.domain)
+    delay = min(parser.crawl_delay(USER_AGENT) or 0, MAX_CRAWL_DELAY) if parser else 0
+    seeds = await _run(_sitemap_urls, crawl, _listed_sitemaps(parser), f"https://{ctx.domain}/sitemap.xml")
+
+    seen = set()
+    host_slots = {}
+
+    def _admit(url):
+        """url (without its fragment) if it is a new, allowed page of this site, else None"""
+        canonical = canonical_url(url)
+        if canonical is None or canonical in seen or urlsplit(canonical).hostname not in hosts:
+            return None
+        if urlsplit(canonical).path.lower().endswith(SKIP_EXTENSIONS):
+            return None
+        seen.add(canonical)
+        if parser and not parser.can_fetch(USER_AGENT, canonical):
+            crawl.disallowed += 1
+            return None
+        # Fetched as linked, so pages the checks already read come from the scan's memo
+        return urldefrag(url).url
+
+    homepage = f"https://{ctx.domain}"
+
+    async def _visit(url):
+        host = urlsplit(url).hostname
+        # Crawl-delay in robots.txt means one request at a time, spaced out
+        slots = host_slots.setdefault(host, asyncio.Semaphore(1 if delay else PER_HOST))
+        async with slots:
+            if crawl.bytes >= MAX_BYTES:
+                return url, None
+            try:
+                final_url, page, size = await _run(_fetch_page, url, url == homepage)
+            except Exception:
+                return url, None
+            crawl.bytes += size
+            if delay:
+                await asyncio.sleep(delay)
+        if urlsplit(final_url).hostname not in hosts:
+            return url, None
+        return url, page
+
+    level = [u for u in [_admit(homepage)] + [_admit(u) for u in seeds] if u]
+    depth = 0
+    while level and depth <= MAX_DEPTH:
+        if crawl.pages >= MAX_PAGES:
+            crawl.stopped = "pages"
+            break
+        crawl.depth = depth
+        tasks = [asyncio.ensure_future(_visit(url)) for url in level[:MAX_PAGES - crawl.pages]]
+        following = []
+        try:
+            for next_done in asyncio.as_completed(tasks, timeout=max(0, deadline - time.monotonic())):
+                url, page = await next_done
+                if page is None or crawl.pages >= MAX_PAGES:
+                    continue
+                crawl.add(url, page)
+                if depth < MAX_DEPTH:
+                    following.extend(u for u in (_admit(href) for _, href in page.anchors) if u)
+        except asyncio.TimeoutError:
+            crawl.stopped = "time"
+            break
+        finally:
+            for task in tasks:
+                task.cancel()
+        if crawl.bytes >= MAX_BYTES:
+            crawl.stopped = "bytes"
+            break
+        level = following
+        depth += 1
+
+    ctx.count("crawled_pages", crawl.pages)
+    return crawl
@@ -0,0 +1,216 @@
+# scanner_tasks/email_dns.py
+# Email authentication and DNS hardening: SPF, DMARC, DKIM, MX, CAA and DNSSEC.
+# Every record is looked up concurrently once per scan (aio.lookup caches across scans).
+
+import asyncio
+
+from .aio import lookup
+from .registry import check
+
+DNS_TIMEOUT = 5  # seconds per lookup
+
+# Selectors of the common mail providers; DKIM keys can't be listed, only guessed
+DKIM_SELECTORS = (
+    "default", "google", "selector1", "selector2", "k1", "k2", "mail", "dkim",
+    "s1", "s2", "smtp", "mandrill", "mxvault", "zoho",
+)
+
+
+def _mail_domain(domain):
+    # Mail and zone records live on the bare domain, not on the www. host
+    return domain.lower().removeprefix("www.")
+
+
+def _queries(domain):
+    base = _mail_domain(domain)
+    queries = [
+        ("TXT", base),
+        ("TXT", f"_dmarc.{base}"),
+        ("MX", base),
+        ("CAA", base),
+        ("DS", base),
+        ("DNSKEY", base),
+    ]
+    if domain.lower() != base:
+        queries.append(("CAA", domain.lower()))
+    queries += [("TXT", f"{selector}._domainkey.{base}") for selector in DKIM_SELECTORS]
+    return queries
+
+
+async def _lookup_all(domain):
+    queries = _queries(domain)
+    answers = await asyncio.gather(
+        *(lookup(name, rdtype, DNS_TIMEOUT) for rdtype, name in queries), return_exceptions=True
+    )
+    # None marks a lookup that failed (timeout, SERVFAIL) as opposed to "no records"
+    return {
+        f"{rdtype} {name}": None if isinstance(answer, Exception) else answer
+        for (rdtype, name), answer in zip(queries, answers)
+    }
+
+
+async def probe_dns(ctx) -> dict:
+    """{"RDTYPE name": [records] or None} for every lookup below, shared by every DNS check
+    (memoized under the "dns" resource's key, like probe_tls)"""
+    return await ctx.amemo(("resource", "dns"), lambda: _lookup_all(ctx.domain))
+
+
+def _records(records, rdtype, name):
+    answer = records.get(f"{rdtype} {name}")
+    if answer is None:
+        raise LookupError(f"DNS lookup failed: {rdtype} {name}")
+    return answer
+
+
+def _tag(record, tag):
+    """Value of tag=value in a DMARC/DKIM style record (None if absent)"""
+    for part in record.split(";"):
+        key, _, value = part.strip().partition("=")
+        if key.strip().lower() == tag:
+            return value.strip()
+    return None
+
+
+@check("Email: SPF", resources=("dns",))
+async def check_spf(ctx):
+    try:
+        base = _mail_domain(ctx.domain)
+        spf = [r for r in _records(await probe_dns(ctx), "TXT", base) if r.lower().startswith("v=spf1")]
+        if not spf:
+            status, details = "fail", "No SPF record"
+        elif len(spf) > 1:
+            status, details = "fail", f"{len(spf)} SPF records (receivers treat this as an error)"
+        else:
+            terms = spf[0].lower().split()
+            policy = next((t for t in terms if t.lstrip("+-~?") == "all"), None)
+            if policy in ("all", "+all"):
+                status = "fail"
+            elif policy in ("-all", "~all"):
+                status = "pass"
+            else:
+                status = "warn"
+            details = f"Policy: {policy or 'no all mechanism'} | {spf[0][:120]}"
+        return {
+            "title": "SPF Record",
+            "status": status,
+            "details": details,
+            "standard": "RFC 7208, NIST SP 800-177",
+            "risk_level": "high" if status == "fail" else "medium" if status == "warn" else "low",
+            "module": "Email",
+        }
+    except Exception as e:
+        return {"title": "SPF Record", "status": "error", "details": str(e), "module": "Email"}
+
+
+@check("Email: DMARC", resources=("dns",))
+async def check_dmarc(ctx):
+    try:
+        base = _mail_domain(ctx.domain)
+        dmarc = [r for r in _records(await probe_dns(ctx), "TXT", f"_dmarc.{base}") if r.lower().startswith("v=dmarc1")]
+        if not dmarc:
+            status, details = "fail", "No DMARC record"
+        else:
+            policy = (_tag(dmarc[0], "p") or "none").lower()
+            status = "pass" if policy in ("quarantine", "reject") else "warn"
+            reports = "Yes" if _tag(dmarc[0], "rua") else "No"
+            details = f"Policy: {policy} | Aggregate reports: {reports}"
+        return {
+            "title": "DMARC Policy",
+            "status": status,
+            "details": details,
+            "standard": "RFC 7489, NIST SP 800-177",
+            "risk_level": "high" if status == "fail" else "medium" if status == "warn" else "low",
+            "module": "Email",
+        }
+    except Exception as e:
+        return {"title": "DMARC Policy", "status": "error", "details": str(e), "module": "Email"}
+
+
+@check("Email: MX", resources=("dns",))
+async def check_mx(ctx):
+    try:
+        mx = _records(await probe_dns(ctx), "MX", _mail_domain(ctx.domain))
+        hosts = [r.split()[-1].rstrip(".") for r in mx]
+        if hosts == [""]:
+            status, details = "pass", "Null MX: domain accepts no mail"
+        else:
+            status = "pass" if hosts else "warn"
+            details = f"Mail servers: {', '.join(hosts)}" if hosts else "No MX records"
+        return {
+            "title": "Mail Servers (MX)",
+            "status": status,
+            "details": details,
+            "standard": "RFC 5321, RFC 7505",
+            "risk_level": "low",
+            "module": "Email",
+        }
+    except Exception as e:
+        return {"title": "Mail Servers (MX)", "status": "error", "details": str(e), "module": "Email"}
+
+
+@check("Email: DKIM", tier="pro", resources=("dns",))
+async def check_dkim(ctx):
+    try:
+        records = await probe_dns(ctx)
+        base = _mail_domain(ctx.domain)
+        found = [
+            selector for selector in DKIM_SELECTORS
+            if any(_tag(r, "p") for r in records.get(f"TXT {selector}._domainkey.{base}") or [])
+        ]
+        # Absence only means none of the common selectors is in use
+        status = "pass" if found else "warn"
+        return {
+            "title": "DKIM Keys",
+            "status": status,
+            "details": f"Selectors: {', '.join(found)}" if found else f"None of {len(DKIM_SELECTORS)} common selectors found",
+            "standard": "RFC 6376, NIST SP 800-177",
+            "risk_level": "medium" if status == "warn" else "low",
+            "module": "Email",
+        }
+    except Exception as e:
+        return {"title": "DKIM Keys", "status": "error", "details": str(e), "module": "Email"}
+
+
+@check("DNS: CAA", tier="pro", resources=("dns",))
+async def check_caa(ctx):
+    try:
+        records = await probe_dns(ctx)
+        # The closest name with CAA records governs issuance
+        caa = records.get(f"CAA {ctx.domain.lower()}") or _records(records, "CAA", _mail_domain(ctx.domain))
+        issuers = sorted({r.split(None, 2)[-1].strip('"') for r in caa if " issue " in f" {r} "})
+        status = "pass" if caa else "warn"
+        return {
+            "title": "CAA Record",
+            "status": status,
+            "details": f"Allowed CAs: {', '.join(issuers) or 'none'}" if caa else "Any CA may issue certificates",
+            "standard": "RFC 8659",
+            "risk_level": "low",
+            "module": "DNS",
+        }
+    except Exception as e:
+        return {"title": "CAA Record", "status": "error", "details": str(e), "module": "DNS"}
+
+
+@check("DNS: DNSSEC", tier="pro", resources=("dns",))
+async def check_dnssec(ctx):
+    try:
+        records = await probe_dns(ctx)
+        base = _mail_domain(ctx.domain)
+        ds, dnskey = _records(records, "DS", base), _records(records, "DNSKEY", base)
+        status = "pass" if ds and dnskey else "warn"
+        if ds and dnskey:
+            details = "Signed zone with DS at the parent"
+        elif dnskey:
+            details = "Zone has keys but no DS at the parent (chain of trust broken)"
+        else:
+            details = "Zone not signed"
+        return {
+            "title": "DNSSEC",
+            "status": status,
+            "details": details,
+            "standard": "RFC 4033, NIST SP 800-81",
+            "risk_level": "medium" if status == "warn" else "low",
+            "module": "DNS",
+        }
+    except Exception as e:
+        return {"title": "DNSSEC", "status": "error", "details": str(e), "module": "DNS"}
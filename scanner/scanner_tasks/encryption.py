@@ -1,27 +1,55 @@
 # scanner_tasks/encryption.py
 
-import socket
-import ssl
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
+from .aio import tls_handshake
+from .registry import check
 
-def check_ssl_tls(domain):
+
+def _load_cert(der):
+    return x509.load_der_x509_certificate(der, default_backend())
+
+
+async def _handshake_and_parse(domain):
+    handshake = await tls_handshake(domain)
+    cert = _load_cert(handshake["der_cert"])
+    try:
+        sans = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value.get_values_for_type(x509.DNSName)
+    except x509.ExtensionNotFound:
+        sans = []
+    chain = [_load_cert(der) for der in handshake["der_chain"]] or [cert]
+    return {
+        "protocol": handshake["protocol"],
+        "cipher": handshake["cipher"],
+        "subject": cert.subject.rfc4514_string(),
+        "issuer": cert.issuer.rfc4514_string(),
+        "chain": [c.subject.rfc4514_string() for c in chain],
+        "expiry": cert.not_valid_after_utc.date(),
+        "sans": sans,
+    }
+
+
+async def probe_tls(ctx) -> dict:
+    """TLS handshake + certificate parse, done once per scan and shared by every TLS check.
+
+    Memoized under the "tls" resource's key, which the prefetch stage seeds with a
+    result shared by a concurrent scan of the domain.
+    """
+    return await ctx.amemo(("resource", "tls"), lambda: _handshake_and_parse(ctx.domain))
+
+
+@check("SSL/TLS Check", resources=("tls",))
+async def check_ssl_tls(ctx):
     try:
-        context = ssl.create_default_context()
-        with socket.create_connection((domain, 443), timeout=10) as sock:
-            with context.wrap_socket(sock, server_hostname=domain) as ssock:
-                cert = ssock.getpeercert(binary_form=True)
-                x509_cert = x509.load_der_x509_certificate(cert, default_backend())
-                expiry = x509_cert.not_valid_after_utc.date()
-                protocol = ssock.version()
-                cipher = ssock.cipher()[0]
-                status = "pass" if protocol in ["TLSv1.3", "TLSv1.2"] and "RSA" not in cipher else "warn"
-                return {
-                    "title": "SSL/TLS",
-                    "status": status,
-                    "details": f"{protocol} | {cipher} | Expires: {expiry}",
-                    "standard": "PCI DSS Req 4.1",
-                    "module": "Encryption",
-                }
+        tls = await probe_tls(ctx)
+        protocol, cipher = tls["protocol"], tls["cipher"]
+        status = "pass" if protocol in ["TLSv1.3", "TLSv1.2"] and "RSA" not in cipher else "warn"
+        return {
+            "title": "SSL/TLS",
+            "status": status,
+            "details": f"{protocol} | {cipher} | Expires: {tls['expiry']}",
+            "standard": "PCI DSS Req 4.1",
+            "module": "Encryption",
+        }
     except Exception as e:
-        return {"title": "SSL/TLS", "status": "fail", "details": f"Error: {str(e)}", "module": "Encryption"}
\ No newline at end of file
+        return {"title": "SSL/TLS", "status": "fail", "details": f"Error: {str(e)}", "module": "Encryption"}
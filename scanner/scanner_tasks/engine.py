@@ -0,0 +1,159 @@
+# scanner_tasks/engine.py
+# Async scan runner: one event loop per scan, sync checks run through an executor adapter
+
+import asyncio
+import inspect
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from .cancellation import POLL_INTERVAL, ScanCancelled
+from .context import collect_truncated
+from .registry import check_id, required_resources
+from .resources import prefetch, refetch
+
+_DONE = object()
+
+
+def is_async_check(func) -> bool:
+    return inspect.iscoroutinefunction(func)
+
+
+def _with_truncated(result, truncated):
+    # A check that judged a cut-off page says so, since the missing part might have changed it
+    if not truncated or not isinstance(result, dict):
+        return result
+    notes = ", ".join(f"{url} ({reason})" for url, reason in sorted(truncated.items()))
+    details = f"{result['details']} | " if result.get("details") else ""
+    return dict(result, details=f"{details}Truncated: {notes}", truncated=sorted(truncated))
+
+
+def _timed(ctx, stat_id, func, *args):
+    # Runs on the executor thread, so time spent queued for a thread is not counted
+    started = time.monotonic()
+    try:
+        with collect_truncated() as truncated:
+            return _with_truncated(func(*args), truncated)
+    finally:
+        ctx.durations[stat_id] = time.monotonic() - started
+
+
+async def _run_check(ctx, test_name, test_func, semaphore):
+    stat_id = check_id(test_func)
+    try:
+        if is_async_check(test_func):
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    with collect_truncated() as truncated:
+                        return _with_truncated(await test_func(ctx), truncated)
+                finally:
+                    ctx.durations[stat_id] = time.monotonic() - started
+        # Legacy check(domain): the executor size bounds how many run at once
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, copy_context().run, _timed, ctx, stat_id, test_func, ctx.domain)
+    except Exception as e:
+        return {"title": test_name, "status": "error", "details": str(e)}
+
+
+async def run_checks(ctx, selected_tests, concurrency, on_result, async_concurrency=None, resources=(), reuse=None):
+    """Run every (test_name, test_func) concurrently; on_result(idx, name, result) as each finishes.
+
+    resources (registry names) are prefetched together first, so the checks mostly
+    evaluate data already in the scan context. reuse(ctx) may then return {idx: result}
+    for checks whose inputs are unchanged since the last scan; those are not run.
+    concurrency sizes the thread pool for sync checks and executor I/O;
+    async_concurrency caps native async checks on the loop.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="scan")
+    loop.set_default_executor(executor)
+    try:
+        await _run_all(ctx, selected_tests, concurrency, on_result, async_concurrency, resources, reuse)
+    except asyncio.CancelledError:
+        # Queued sync checks never start; those already on a thread finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+
+async def _run_all(ctx, selected_tests, concurrency, on_result, async_concurrency, resources, reuse):
+    if resources:
+        await prefetch(ctx, resources)
+
+    reused = reuse(ctx) if reuse else {}
+    for idx, result in reused.items():
+        on_result(idx, selected_tests[idx][0], result)
+    to_run = [(idx, test) for idx, test in enumerate(selected_tests) if idx not in reused]
+    # A 304 has no body: resources that checks still need are fetched again in full
+    stale = [
+        name for name in required_resources([test for _, test in to_run])
+        if ctx.fingerprints.get(name, {}).get("not_modified")
+    ]
+    if stale:
+        await refetch(ctx, stale)
+    ctx.prefetched = True
+    semaphore = asyncio.Semaphore(async_concurrency or concurrency)
+
+    async def _indexed(idx, test_name, test_func):
+        return idx, test_name, await _run_check(ctx, test_name, test_func, semaphore)
+
+    tasks = [
+        asyncio.create_task(_indexed(idx, test_name, test_func))
+        for idx, (test_name, test_func) in to_run
+    ]
+    for next_done in asyncio.as_completed(tasks):
+        on_result(*await next_done)
+
+
+def iter_results(ctx, selected_tests, concurrency, async_concurrency=None, resources=(), reuse=None, cancel=None):
+    """Drive run_checks on its own event loop and yield (idx, name, result) to the sync caller.
+
+    The loop lives on a helper thread so the Celery task thread stays free for ORM and
+    channel-layer calls, which Django refuses to make from inside a running loop.
+
+    cancel (a CancelToken) is polled after every result and at least once per
+    POLL_INTERVAL. Once it is set the loop's tasks are cancelled and ScanCancelled is
+    raised here straight away, without waiting for checks still on executor threads.
+    """
+    results = queue.Queue()
+    running = {}
+
+    async def _main():
+        running["loop"], running["task"] = asyncio.get_running_loop(), asyncio.current_task()
+        await run_checks(
+            ctx, selected_tests, concurrency, lambda *r: results.put(r), async_concurrency, resources, reuse
+        )
+
+    def _loop():
+        try:
+            asyncio.run(_main())
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            results.put(e)
+        finally:
+            results.put(_DONE)
+
+    # copy_context() hands the active ScanContext to the loop thread
+    thread = threading.Thread(target=copy_context().run, args=(_loop,), name="scan-loop", daemon=True)
+    thread.start()
+    while True:
+        try:
+            item = results.get(timeout=POLL_INTERVAL if cancel is not None else None)
+        except queue.Empty:
+            item = None
+        if item is _DONE:
+            break
+        if isinstance(item, BaseException):
+            raise item
+        if item is not None:
+            yield item
+        if cancel is not None and cancel.cancelled:
+            try:
+                running["loop"].call_soon_threadsafe(running["task"].cancel)
+            except (KeyError, RuntimeError):
+                pass  # the loop hasn't started yet or has already closed
+            raise ScanCancelled(cancel.reason)
+    thread.join()
@@ -1,23 +1,44 @@
 # scanner_tasks/gdpr.py
 
-from .helpers import _find_link, _fetch_page_text
-import requests
+from . import keywords
+from .crawler import mentions, watch
+from .helpers import _find_link, _get_page, _page_hits
+from .registry import check
+from .resources import resource
 import urllib3
 
+DSAR_TERMS = ["dsar", "data subject access request"]
+DPIA_TERMS = ["dpia", "data protection impact assessment"]
+RETENTION_TERMS = ["retention period", "data will be deleted"]
+DPO_TERMS = ["data protection officer", "dpo"]
+
+# The crawler notes which pages mention these, so the checks see the whole site
+watch("dsar", DSAR_TERMS)
+watch("dpia", DPIA_TERMS)
+watch("retention", RETENTION_TERMS)
+watch("dpo", DPO_TERMS)
+PRIVACY_GDPR = keywords.register("privacy_gdpr", ["gdpr", "controller", "erase", "dpo"])
+PRIVACY_CCPA = keywords.register("privacy_ccpa", ["ccpa", "california"])
+
+def _mentioned_on(pages):
+    return f" | Mentioned on {len(pages)} crawled page(s)" if pages else ""
+
+@check("GDPR: DSAR", resources=("homepage", "site"))
 def check_gdpr_dsar(domain: str):
     url = _find_link(domain, ["dsar", "data subject", "access my data"])
-    text = _fetch_page_text(f"https://{domain}")
-    found = any(k in text for k in ["dsar", "data subject access request"])
+    pages = mentions(domain, "dsar")
+    found = keywords.found(_page_hits(f"https://{domain}"), "dsar") or bool(pages)
     status = "pass" if found or url else "fail"
     return {
         "title": "DSAR Endpoint (GDPR Art. 15)",
         "status": status,
-        "details": f"DSAR page: {'Found' if url else 'Missing'}",
+        "details": f"DSAR page: {'Found' if url else 'Missing'}{_mentioned_on(pages)}",
         "standard": "GDPR Art. 15",
         "risk_level": "high" if status == "fail" else "low",
         "module": "GDPR",
     }
 
+@check("GDPR: DPIA", resources=("homepage", "privacy_policy", "site"))
 def check_gdpr_dpia(domain: str):
     policy_url = _find_link(domain, ["privacy policy", "privacy"])
     if not policy_url:
@@ -29,18 +50,19 @@ def check_gdpr_dpia(domain: str):
             "risk_level": "high",
             "module": "GDPR",
         }
-    text = _fetch_page_text(policy_url)
-    found = any(p in text for p in ["dpia", "data protection impact assessment"])
+    pages = mentions(domain, "dpia")
+    found = keywords.found(_page_hits(policy_url), "dpia") or bool(pages)
     status = "pass" if found else "warn"
     return {
         "title": "DPIA Mentioned (GDPR Art. 35)",
         "status": status,
-        "details": f"DPIA reference: {'Found' if found else 'Missing'}",
+        "details": f"DPIA reference: {'Found' if found else 'Missing'}{_mentioned_on(pages)}",
         "standard": "GDPR Art. 35",
         "risk_level": "high" if status == "warn" else "low",
         "module": "GDPR",
     }
 
+@check("GDPR: Retention", resources=("homepage", "privacy_policy", "site"))
 def check_gdpr_retention(domain: str):
     policy_url = _find_link(domain, ["privacy policy"])
     if not policy_url:
@@ -52,18 +74,19 @@ def check_gdpr_retention(domain: str):
             "risk_level": "high",
             "module": "GDPR",
         }
-    text = _fetch_page_text(policy_url)
-    found = any(p in text for p in ["retention period", "data will be deleted"])
+    pages = mentions(domain, "retention")
+    found = keywords.found(_page_hits(policy_url), "retention") or bool(pages)
     status = "pass" if found else "warn"
     return {
         "title": "Data Retention Policy",
         "status": status,
-        "details": f"Retention clause: {'Present' if found else 'Missing'}",
+        "details": f"Retention clause: {'Present' if found else 'Missing'}{_mentioned_on(pages)}",
         "standard": "GDPR Art. 5(1)(e)",
         "risk_level": "high" if status == "warn" else "low",
         "module": "GDPR",
     }
 
+@check("GDPR: DPO", resources=("homepage", "privacy_policy", "site"))
 def check_gdpr_dpo(domain: str):
     policy_url = _find_link(domain, ["privacy", "contact"])
     if not policy_url:
@@ -75,62 +98,66 @@ def check_gdpr_dpo(domain: str):
             "risk_level": "high",
             "module": "GDPR",
         }
-    text = _fetch_page_text(policy_url)
-    found = any(p in text for p in ["data protection officer", "dpo"])
+    pages = mentions(domain, "dpo")
+    found = keywords.found(_page_hits(policy_url), "dpo") or bool(pages)
     status = "pass" if found else "warn"
     return {
         "title": "DPO Appointed",
         "status": status,
-        "details": f"DPO contact: {'Found' if found else 'Not mentioned'}",
+        "details": f"DPO contact: {'Found' if found else 'Not mentioned'}{_mentioned_on(pages)}",
         "standard": "GDPR Art. 37",
         "risk_level": "medium",
         "module": "GDPR",
     }
 
+@check("Sitemap & Robots", resources=("site",))
 def crawl_sitemap(domain):
     try:
-        sitemap_ok = requests.head(f"https://{domain}/sitemap.xml", timeout=10, verify=True).status_code == 200
-        robots_ok = requests.head(f"https://{domain}/robots.txt", timeout=10, verify=True).status_code == 200
-        status = "pass" if sitemap_ok and robots_ok else "warn"
+        site = resource("site", domain)
+        status = "pass" if site.sitemap_ok and site.robots_ok else "warn"
         return {
             "title": "Sitemap & Robots",
             "status": status,
-            "details": f"Sitemap: {'OK' if sitemap_ok else 'Missing'} | Robots: {'OK' if robots_ok else 'Missing'}",
+            "details": (
+                f"Sitemap: {'OK' if site.sitemap_ok else 'Missing'} | Robots: {'OK' if site.robots_ok else 'Missing'}"
+                f" | Crawled: {site.pages} page(s)"
+            ),
             "standard": "GDPR Art. 35",
             "module": "GDPR",
         }
     except:
         return {"title": "Sitemap", "status": "warn", "details": "Not accessible", "module": "GDPR"}
 
+@check("Cookie Consent", resources=("homepage",))
 def check_cookies(domain):
-    try:
-        response = requests.get(f"https://{domain}", timeout=10, verify=True)
-        banner = any(x in response.text.lower() for x in ["cookie", "consent"])
-        status = "pass" if banner else "fail"
-        return {
-            "title": "Cookie Consent",
-            "status": status,
-            "details": f"Banner: {'Detected' if banner else 'Missing'}",
-            "standard": "GDPR Art. 7",
-            "risk_level": "high" if not banner else "low",
-            "module": "GDPR",
-        }
-    except:
+    page = _get_page(f"https://{domain}")
+    if page is None:
         return {"title": "Cookies", "status": "fail", "details": "Site down", "module": "GDPR"}
+    banner = page.cookie_banner
+    status = "pass" if banner else "fail"
+    return {
+        "title": "Cookie Consent",
+        "status": status,
+        "details": f"Banner: {'Detected' if banner else 'Missing'}",
+        "standard": "GDPR Art. 7",
+        "risk_level": "high" if not banner else "low",
+        "module": "GDPR",
+    }
 
+@check("Privacy Policy", resources=("homepage", "privacy_policy"))
 def check_privacy_policy(domain):
     try:
         policy_url = _find_link(domain, ["privacy", "policy"])
         if not policy_url:
             return {"title": "Privacy Policy", "status": "fail", "details": "Not found", "module": "GDPR"}
-        text = _fetch_page_text(policy_url)
-        gdpr_score = sum(1 for k in ['gdpr', 'controller', 'erase', 'dpo'] if k in text)
-        ccpa = any(k in text for k in ['ccpa', 'california'])
+        hits = _page_hits(policy_url)
+        gdpr_score = keywords.count(hits, PRIVACY_GDPR)
+        ccpa = keywords.found(hits, PRIVACY_CCPA)
         status = "pass" if gdpr_score >= 2 and ccpa else "warn"
         return {
             "title": "Privacy Policy",
             "status": status,
-            "details": f"GDPR: {gdpr_score}/4 | CCPA: {'Yes' if ccpa else 'No'}",
+            "details": f"GDPR: {gdpr_score}/{len(keywords.SIGNALS[PRIVACY_GDPR])} | CCPA: {'Yes' if ccpa else 'No'}",
             "standard": "GDPR, CCPA",
             "module": "GDPR",
         }
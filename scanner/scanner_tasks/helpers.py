@@ -1,13 +1,22 @@
 # scanner_tasks/helpers.py
 
-import requests
+import hashlib
 import urllib3
 from bs4 import BeautifulSoup
+from functools import cached_property
 from urllib.parse import urljoin
+from . import keywords
+from .context import current_context, note_truncated
+from .sessions import get_session
 
 SCANNER_API_URL = "https://api.complylaw-scanner.com/v1/scan"
 SCANNER_API_KEY = "your-api-key-here"
 
+# Looked for anywhere in the raw markup of a page (ids, classes, script names), so
+# cookie_notice, cookieNotice and consent-banner all count; consent managers are named
+# in their scripts. Not a keywords.py signal: those match whole words in the visible text.
+COOKIE_BANNER = ("cookie", "consent", "onetrust", "usercentrics", "didomi")
+
 # Optional: suppress warnings only if you want to ignore SSL issues
 # urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -16,44 +25,101 @@ def connect_to_external_scanner(domain: str):
         return None
     try:
         payload = {"domain": domain, "api_key": SCANNER_API_KEY}
-        resp = requests.post(SCANNER_API_URL, json=payload, timeout=10, verify=True)
+        resp = get_session().post(SCANNER_API_URL, json=payload)
         if resp.status_code == 200:
             return resp.json()
     except Exception:
         pass
     return None
 
-def _fetch_page_text(url: str, timeout: int = 10) -> str:
-    """Fetch page text safely with SSL verification"""
-    try:
-        r = requests.get(url, timeout=timeout, allow_redirects=True, verify=True)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
+def _fetch(url: str, method: str = "GET", allow_redirects: bool = True):
+    """Fetch a URL once per scan; inside a scan context the response is shared by all checks"""
+    def _do():
+        # Conditional GET when the last scan of this domain left validators for the URL
+        headers = ctx.conditional_headers(url) if ctx is not None and method.upper() == "GET" else None
+        return get_session().request(method, url, allow_redirects=allow_redirects, headers=headers)
+    ctx = current_context()
+    if ctx is None:
+        return _do()
+    return note_truncated(ctx.fetch(method, url, _do, allow_redirects=allow_redirects))
+
+class ParsedPage:
+    """One HTML document parsed once: links, scripts, forms and visible text"""
+
+    def __init__(self, url: str, response):
+        self.url = url
+        self.status_code = response.status_code
+        self.ok = response.ok
+        # Validators and a body hash let the next scan send a conditional GET
+        self.not_modified = response.status_code == 304
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        self.content_hash = hashlib.sha256(response.content or b"").hexdigest()
+        self.size = len(response.content or b"")
+        self.truncated = getattr(response, "truncated", None)  # set by sessions.read_bounded()
+        html = response.text
+        # Banner scripts usually live in <script>, so look at the raw markup
+        markup = html.lower()
+        self.cookie_banner = any(marker in markup for marker in COOKIE_BANNER)
+
+        soup = BeautifulSoup(html, "html.parser")
+        self.anchors, self.script_srcs, self.forms = [], [], []
+        for tag in soup.find_all(["a", "script", "form"]):
+            if tag.name == "a" and tag.get("href"):
+                self.anchors.append((tag.get_text(strip=True).lower(), urljoin(url, tag["href"])))
+            elif tag.name == "script" and tag.get("src"):
+                self.script_srcs.append(tag["src"])
+            elif tag.name == "form":
+                self.forms.append(tag.get("action", ""))
+
         for tag in soup(["script", "style", "nav", "footer"]):
             tag.decompose()
-        return soup.get_text(separator=" ").lower()
+        self.text = soup.get_text(separator=" ").lower()
+
+    @cached_property
+    def hits(self) -> frozenset:
+        """Registered keyword terms in the page text (keywords.py), matched once for every check"""
+        return keywords.scan(self.text)
+
+    def find_link(self, keywords: list) -> str | None:
+        for text, href in self.anchors:
+            if any(k in text for k in keywords):
+                return href
+        return None
+
+def _get_page(url: str) -> ParsedPage | None:
+    """Fetch and parse a page once per scan; None if it could not be fetched"""
+    def _parse():
+        return ParsedPage(url, _fetch(url))
+    try:
+        ctx = current_context()
+        return _parse() if ctx is None else note_truncated(ctx.memo(("page", url), _parse))
     except Exception:
-        return ""
+        return None
+
+def _page_hits(url: str) -> frozenset:
+    """Keyword hits of a page (empty if it could not be fetched)"""
+    page = _get_page(url)
+    return page.hits if page and page.ok else frozenset()
+
+def _fetch_page_text(url: str) -> str:
+    """Fetch page text safely with SSL verification"""
+    page = _get_page(url)
+    return page.text if page and page.ok else ""
 
 def _find_link(domain: str, keywords: list, base_url: str | None = None) -> str | None:
     """Find first <a> link containing any of the keywords"""
     if not base_url:
         base_url = f"https://{domain}"
-    try:
-        r = requests.get(base_url, timeout=10, allow_redirects=True, verify=True)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
-        for a in soup.find_all("a", href=True):
-            if any(k in a.get_text(strip=True).lower() for k in keywords):
-                return urljoin(base_url, a["href"])
-    except Exception:
-        pass
-    return None
+    page = _get_page(base_url)
+    if not page or not page.ok:
+        return None
+    return page.find_link(keywords)
 
 def _get_headers(domain: str):
     """Return headers with SSL verification"""
     try:
-        r = requests.head(f"https://{domain}", timeout=10, allow_redirects=True, verify=True)
+        r = _fetch(f"https://{domain}", method="HEAD")
         return r.headers
     except:
         return {}
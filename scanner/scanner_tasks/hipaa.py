@@ -1,22 +1,22 @@
 # scanner_tasks/hipaa.py
 
 from .encryption import check_ssl_tls
-import requests
+from .helpers import _get_page
+from .registry import check
 import urllib3
-from bs4 import BeautifulSoup
 
-def check_hipaa_encryption(domain: str):
-    result = check_ssl_tls(domain)
+@check("HIPAA Encryption", tier="enterprise", resources=("tls",))
+async def check_hipaa_encryption(ctx):
+    result = await check_ssl_tls(ctx)
     result["module"] = "HIPAA"
     result["standard"] = "HIPAA §164.312"
     return result
 
+@check("HIPAA Forms", tier="enterprise", resources=("homepage",))
 def check_forms(domain):
     try:
-        response = requests.get(f"https://{domain}", timeout=10, verify=True)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        forms = soup.find_all('form')
-        encrypted = all(f.get('action', '').startswith('https') for f in forms if f.get('action'))
+        forms = _get_page(f"https://{domain}").forms
+        encrypted = all(action.startswith('https') for action in forms if action)
         status = "pass" if encrypted else "fail"
         return {
             "title": "Data Forms",
@@ -1,7 +1,9 @@
 # scanner_tasks/iso27001.py
 
 from .helpers import _find_link, _fetch_page_text
+from .registry import check
 
+@check("ISO 27001 Access", tier="pro", resources=("homepage", "terms"))
 def check_iso27001_access_control(domain: str):
     policy_url = _find_link(domain, ["terms", "aup"])
     if not policy_url:
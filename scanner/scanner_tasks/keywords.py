@@ -0,0 +1,62 @@
+# scanner_tasks/keywords.py
+# Keyword signals for the text checks. Every check module registers its terms at import,
+# and each page is matched against all of them once (ParsedPage.hits); the checks and the
+# crawler read that hit set instead of searching the text again. Matching is on whole
+# words, so "dpo" no longer matches inside another word, and a trailing "s" is accepted.
+
+# signal -> terms (lower case, single-spaced)
+SIGNALS = {}
+
+_terms = ()  # every registered term, longest first, for the SIGNALS in _terms_for
+_terms_for = None
+
+
+def register(signal: str, terms: list) -> str:
+    """Add a signal (or replace its terms); returns the signal name"""
+    SIGNALS[signal] = tuple(dict.fromkeys(" ".join(t.lower().split()) for t in terms))
+    return signal
+
+
+def _all_terms():
+    global _terms, _terms_for
+    registered = tuple(SIGNALS.items())
+    if _terms_for != registered:
+        _terms = tuple(sorted({t for terms in SIGNALS.values() for t in terms}, key=len, reverse=True))
+        _terms_for = registered
+    return _terms
+
+
+def _is_word_char(text, i):
+    return 0 <= i < len(text) and (text[i].isalnum() or text[i] == "_")
+
+
+def _occurs(text, term):
+    # str.find is a C-speed scan; word boundaries are only checked where the term occurs
+    start = text.find(term)
+    while start != -1:
+        end = start + len(term)
+        if end < len(text) and text[end] == "s" and not _is_word_char(text, end + 1):
+            end += 1
+        if not _is_word_char(text, start - 1) and not _is_word_char(text, end):
+            return True
+        start = text.find(term, start + 1)
+    return False
+
+
+def scan(text: str) -> frozenset:
+    """Every registered term found in text (lower case) as whole words"""
+    if not text or not SIGNALS:
+        return frozenset()
+    # Phrases may be split over lines or padded in the markup
+    text = " ".join(text.split())
+    return frozenset(term for term in _all_terms() if _occurs(text, term))
+
+
+def found(hits: frozenset, signal: str) -> bool:
+    """Whether scan() hits include any term of signal"""
+    return any(term in hits for term in SIGNALS.get(signal, ()))
+
+
+def count(hits: frozenset, signal: str) -> int:
+    """How many distinct terms of signal scan() found"""
+    return sum(term in hits for term in SIGNALS.get(signal, ()))
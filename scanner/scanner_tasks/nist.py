@@ -1,15 +1,16 @@
 # scanner_tasks/nist.py
 
-import nmap
-import requests
+from xml.etree import ElementTree
+from .helpers import _get_page
+from .tools import stream_tool
+from .registry import check
 import urllib3
-from bs4 import BeautifulSoup
 
+@check("Third-Party Scripts", resources=("homepage",))
 def check_third_party_scripts(domain):
     try:
-        response = requests.get(f"https://{domain}", timeout=10, verify=True)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        external = [s['src'] for s in soup.find_all('script', src=True) if domain not in s['src']]
+        scripts = _get_page(f"https://{domain}").script_srcs
+        external = [src for src in scripts if domain not in src]
         status = "warn" if len(external) > 8 else "pass"
         return {
             "title": "Third-Party Scripts",
@@ -21,27 +22,54 @@ def check_third_party_scripts(domain):
     except:
         return {"title": "Scripts", "status": "error", "details": "Failed", "module": "Supply Chain"}
 
-def run_nmap_vuln_scan(domain):
+NMAP_TIMEOUT = 600  # seconds, whole run
+
+@check("Nmap Vuln Scan", tier="enterprise", cost="heavy")
+def run_nmap_vuln_scan(domain, on_progress=None, should_stop=None):
+    """nmap vuln scripts with XML streamed to stdout and parsed as it arrives.
+
+    on_progress(percent, message) is called for nmap's task progress and for each
+    CVE finding; on timeout (or once should_stop() is true) the findings seen so far
+    are still reported.
+    """
+    on_progress = on_progress or (lambda percent, message: None)
+    vulns = []
+    parser = ElementTree.XMLPullParser(events=("end",))
+
+    def _on_line(line):
+        parser.feed(line)
+        for _, elem in parser.read_events():
+            if elem.tag == "taskprogress":
+                on_progress(float(elem.get("percent", 0)), f"{elem.get('task', 'Scanning')} {elem.get('percent')}%")
+            elif elem.tag == "port":
+                port = int(elem.get("portid"))
+                for script in elem.findall("script"):
+                    out = script.get("output", "")
+                    if 'CVE' in out:
+                        vulns.append({"cve": script.get("id"), "port": port, "details": out})
+                        on_progress(None, f"{len(vulns)} CVEs found (port {port})")
+                elem.clear()
+
+    cut_short = False
     try:
-        nm = nmap.PortScanner()
-        nm.scan(domain, arguments='--top-ports 100 -sV --script vuln')
-        vulns = []
-        for host in nm.all_hosts():
-            for proto in nm[host].all_protocols():
-                for port in nm[host][proto].keys():
-                    if 'script' in nm[host][proto][port]:
-                        for script, out in nm[host][proto][port]['script'].items():
-                            if 'CVE' in out:
-                                vulns.append({"cve": script, "port": port, "details": out})
-        status = "fail" if vulns else "pass"
-        return {
-            "title": "Nmap Vulnerabilities",
-            "status": status,
-            "details": f"{len(vulns)} CVEs",
-            "standard": "NIST",
-            "risk_level": "high" if vulns else "low",
-            "vulnerabilities": vulns,
-            "module": "Vulnerability",
-        }
-    except:
-        return {"title": "Nmap", "status": "error", "details": "Failed", "module": "Vulnerability"}
\ No newline at end of file
+        cmd = ['nmap', '--top-ports', '100', '-sV', '--script', 'vuln', '--host-timeout', f'{NMAP_TIMEOUT}s',
+               '--stats-every', '10s', '-oX', '-', domain]
+        returncode, stderr, cut_short = stream_tool(cmd, timeout=NMAP_TIMEOUT + 30, on_line=_on_line, should_stop=should_stop)
+        if returncode != 0 and not cut_short and not vulns:
+            return {"title": "Nmap", "status": "error", "details": "Failed", "module": "Vulnerability"}
+    except Exception:
+        # Timeouts / soft time limits land here too: keep whatever was streamed so far
+        if not vulns:
+            return {"title": "Nmap", "status": "error", "details": "Failed", "module": "Vulnerability"}
+        cut_short = True
+    status = "fail" if vulns else "warn" if cut_short else "pass"
+    partial = " (partial: run was cut short)" if cut_short else ""
+    return {
+        "title": "Nmap Vulnerabilities",
+        "status": status,
+        "details": f"{len(vulns)} CVEs{partial}",
+        "standard": "NIST",
+        "risk_level": "high" if vulns else "low",
+        "vulnerabilities": vulns,
+        "module": "Vulnerability",
+    }
@@ -1,15 +1,23 @@
 # scanner_tasks/owasp.py
 
-import requests
 import urllib3
-from .helpers import _get_headers, _find_link, _fetch_page_text
+from . import keywords
+from .helpers import _find_link, _page_hits
 from .encryption import check_ssl_tls
-import subprocess
+from .politeness import HOST_LIMIT
+from .registry import check
+from .resources import resource
+from .tools import stream_tool
 import json
+import os
+import tempfile
 
+MFA_HINTS = keywords.register("mfa", ["mfa", "2fa", "two-factor", "two-factor authentication", "multi-factor"])
+
+@check("OWASP A01: Access Control", resources=("admin",))
 def check_broken_access_control(domain: str):
     try:
-        resp = requests.get(f"https://{domain}/admin", timeout=10, verify=True, allow_redirects=False)
+        resp = resource("admin", domain)
         status = "fail" if resp.status_code in [200, 301, 302] else "pass"
         return {
             "title": "Admin Endpoint Exposure (A01)",
@@ -22,8 +30,9 @@ def check_broken_access_control(domain: str):
     except:
         return {"title": "Access Control", "status": "pass", "details": "/admin not found", "module": "OWASP"}
 
-def check_crypto_failures(domain: str):
-    result = check_ssl_tls(domain)
+@check("OWASP A02: Crypto", resources=("tls",))
+async def check_crypto_failures(ctx):
+    result = await check_ssl_tls(ctx)
     if result["status"] in ["warn", "fail"]:
         result.update({
             "title": "Weak TLS (A02)",
@@ -33,29 +42,26 @@ def check_crypto_failures(domain: str):
         })
     return result
 
+@check("OWASP A03: Injection", resources=("sqli_probes",))
 def check_sql_injection(domain: str):
-    payloads = ["' OR '1'='1", "1; DROP TABLE users--"]
-    vulnerable = False
-    for p in payloads:
-        try:
-            r = requests.get(f"https://{domain}/search?q={p}", timeout=8, verify=True)
-            if any(err in r.text.lower() for err in ["sql", "syntax"]):
-                vulnerable = True
-                break
-        except:
-            pass
+    responses = resource("sqli_probes", domain)
+    vulnerable = any(
+        r is not None and any(err in r.text.lower() for err in ["sql", "syntax"])
+        for r in responses
+    )
     status = "fail" if vulnerable else "pass"
     return {
         "title": "SQL Injection (A03)",
         "status": status,
-        "details": f"Tested {len(payloads)} payloads",
+        "details": f"Tested {len(responses)} payloads",
         "standard": "OWASP A03:2021",
         "risk_level": "high" if vulnerable else "low",
         "module": "OWASP",
     }
 
+@check("OWASP A04: Headers", resources=("headers",))
 def check_missing_security_headers(domain: str):
-    headers = _get_headers(domain)
+    headers = resource("headers", domain)
     required = ["Content-Security-Policy", "X-Frame-Options", "X-Content-Type-Options"]
     missing = [h for h in required if h not in headers]
     status = "fail" if missing else "pass"
@@ -68,9 +74,10 @@ def check_missing_security_headers(domain: str):
         "module": "OWASP",
     }
 
+@check("OWASP A05: Misconfig", resources=("phpinfo",))
 def check_security_misconfig(domain: str):
     try:
-        resp = requests.get(f"https://{domain}/phpinfo.php", timeout=10, verify=True)
+        resp = resource("phpinfo", domain)
         if resp.status_code == 200 and "phpinfo()" in resp.text:
             return {
                 "title": "PHP Info Exposure (A05)",
@@ -84,8 +91,9 @@ def check_security_misconfig(domain: str):
         pass
     return {"title": "Misconfig", "status": "pass", "details": "No exposure", "module": "OWASP"}
 
+@check("OWASP A06: Outdated", resources=("headers",))
 def check_outdated_software(domain: str):
-    headers = _get_headers(domain)
+    headers = resource("headers", domain)
     server = headers.get("Server", "").lower()
     powered = headers.get("X-Powered-By", "").lower()
     outdated = []
@@ -103,12 +111,12 @@ def check_outdated_software(domain: str):
         "module": "OWASP",
     }
 
+@check("OWASP A07: Auth", resources=("homepage", "login"))
 def check_auth_failures(domain: str):
     login_url = _find_link(domain, ["login", "sign in"])
     if not login_url:
         return {"title": "Login Not Found (A07)", "status": "warn", "details": "No login", "module": "OWASP"}
-    text = _fetch_page_text(login_url)
-    weak = not any(p in text for p in ["mfa", "2fa", "two-factor"])
+    weak = not keywords.found(_page_hits(login_url), MFA_HINTS)
     status = "warn" if weak else "pass"
     return {
         "title": "Weak Auth (A07)",
@@ -119,12 +127,14 @@ def check_auth_failures(domain: str):
         "module": "OWASP",
     }
 
+@check("OWASP A08: Integrity", tier="pro")
 def check_integrity_failures(domain: str):
     return {"title": "Integrity (A08)", "status": "pass", "details": "No untrusted JS", "module": "OWASP"}
 
+@check("OWASP A09: Logging", tier="pro", resources=("error_log",))
 def check_logging_monitoring(domain: str):
     try:
-        r = requests.get(f"https://{domain}/error.log", timeout=10, verify=True)
+        r = resource("error_log", domain)
         if r.status_code == 200:
             return {
                 "title": "Error Log Exposure (A09)",
@@ -138,26 +148,67 @@ def check_logging_monitoring(domain: str):
         pass
     return {"title": "Logging", "status": "pass", "details": "No leaks", "module": "OWASP"}
 
+@check("OWASP A10: SSRF", tier="pro")
 def check_ssrf(domain: str):
     return {"title": "SSRF (A10)", "status": "pass", "details": "Blocked", "module": "OWASP"}
 
-def run_nikto_scan(domain):
+NIKTO_TIMEOUT = 120  # seconds
+
+def _load_nikto_report(path):
+    with open(path) as f:
+        data = json.load(f)
+    # nikto writes either one object or a list with one object per host
+    if isinstance(data, list):
+        data = data[0] if data else {}
+    return data.get('vulnerabilities', [])
+
+@check("Nikto Scan", tier="pro", cost="heavy")
+def run_nikto_scan(domain, on_progress=None, should_stop=None):
+    """nikto with its console output streamed: each '+ ' line is a finding as it appears.
+
+    The JSON report is authoritative when nikto finishes; if it is cut short (timeout, or
+    should_stop() turning true) the streamed findings are reported instead.
+    """
+    on_progress = on_progress or (lambda percent, message: None)
+    streamed = []
+
+    def _on_line(line):
+        line = line.strip()
+        if line.startswith("+ ") and ":" in line and not line.startswith("+ Target"):
+            streamed.append({"msg": line[2:]})
+            on_progress(None, f"{len(streamed)} issues found")
+
+    fd, report_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
     try:
-        cmd = ['nikto', '-h', f"https://{domain}", '-Format', 'json', '-output', '-']
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        if result.returncode == 0:
-            data = json.loads(result.stdout)
-            vulns = data.get('vulnerabilities', [])
-            status = "fail" if vulns else "pass"
-            return {
-                "title": "Nikto Web Vulns",
-                "status": status,
-                "details": f"{len(vulns)} issues",
-                "standard": "OWASP",
-                "risk_level": "high" if vulns else "low",
-                "vulnerabilities": vulns,
-                "module": "Vulnerability",
-            }
-    except:
-        pass
-    return {"title": "Nikto", "status": "error", "details": "Failed", "module": "Vulnerability"}
\ No newline at end of file
+        cmd = ['nikto', '-h', f"https://{domain}", '-Format', 'json', '-output', report_path]
+        if HOST_LIMIT[0] > 0:
+            # Nikto opens its own connections; pace it to the same per-host request rate
+            cmd += ['-Pause', f"{1 / HOST_LIMIT[0]:.2f}"]
+        returncode, stderr, cut_short = stream_tool(cmd, timeout=NIKTO_TIMEOUT, on_line=_on_line, should_stop=should_stop)
+        vulns = streamed
+        if not cut_short:
+            try:
+                vulns = _load_nikto_report(report_path)
+            except (OSError, ValueError):
+                if returncode != 0:
+                    vulns = None
+    except Exception:
+        # Timeouts / soft time limits land here too: keep whatever was streamed so far
+        vulns, cut_short = (streamed, True) if streamed else (None, False)
+    finally:
+        os.remove(report_path)
+
+    if vulns is None:
+        return {"title": "Nikto", "status": "error", "details": "Failed", "module": "Vulnerability"}
+    status = "fail" if vulns else "warn" if cut_short else "pass"
+    partial = " (partial: run was cut short)" if cut_short else ""
+    return {
+        "title": "Nikto Web Vulns",
+        "status": status,
+        "details": f"{len(vulns)} issues{partial}",
+        "standard": "OWASP",
+        "risk_level": "high" if vulns else "low",
+        "vulnerabilities": vulns,
+        "module": "Vulnerability",
+    }
@@ -1,9 +1,11 @@
 # scanner_tasks/pcidss.py
 
-from .helpers import _get_headers
+from .registry import check
+from .resources import resource
 
+@check("PCI DSS Headers", tier="pro", resources=("headers",))
 def check_pci_dss_logging(domain: str):
-    headers = _get_headers(domain)
+    headers = resource("headers", domain)
     leaked = any(k in headers.get("Server", "") for k in ["Apache", "nginx", "IIS"])
     status = "fail" if leaked else "pass"
     return {
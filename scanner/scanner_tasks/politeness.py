@@ -0,0 +1,201 @@
+# scanner_tasks/politeness.py
+# Per-target politeness limiter shared by every worker: a Redis token bucket plus an
+# in-flight cap, keyed by target host and by its resolved IP
+
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import copy_context
+from urllib.parse import urlsplit
+
+import redis
+from django.conf import settings
+
+from .context import current_context
+
+# (requests per second, burst, max in flight); rps 0 disables the limit
+HOST_LIMIT = (
+    float(getattr(settings, "SCANNER_POLITE_RPS", 5)),
+    int(getattr(settings, "SCANNER_POLITE_BURST", 10)),
+    int(getattr(settings, "SCANNER_POLITE_MAX_IN_FLIGHT", 4)),
+)
+# Many unrelated sites share a CDN/hosting IP, so the IP limit is looser than the host one
+IP_LIMIT = (
+    float(getattr(settings, "SCANNER_POLITE_IP_RPS", 20)),
+    int(getattr(settings, "SCANNER_POLITE_IP_BURST", 40)),
+    int(getattr(settings, "SCANNER_POLITE_IP_MAX_IN_FLIGHT", 16)),
+)
+MAX_WAIT = float(getattr(settings, "SCANNER_POLITE_MAX_WAIT", 60))  # then go ahead anyway
+LEASE_TTL = 30          # seconds an in-flight slot survives a worker that died mid-request
+DNS_TTL = 300           # seconds a host -> IP mapping is reused
+REDIS_RETRY_AFTER = 30  # seconds to run unthrottled after Redis errors
+
+# KEYS: n bucket keys, then n in-flight keys
+# ARGV: n, now, lease id, lease ttl, then (rate, burst, max_in_flight) per key
+# Returns "0" once every bucket had a token and every in-flight set had room
+# (all are taken atomically), otherwise the seconds to wait before asking again.
+_ACQUIRE = """
+local n = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local lease, lease_ttl = ARGV[3], tonumber(ARGV[4])
+local wait, levels = 0, {}
+for i = 1, n do
+    local rate = tonumber(ARGV[3 + i * 3 - 1])
+    local burst = tonumber(ARGV[3 + i * 3])
+    local max_in_flight = tonumber(ARGV[3 + i * 3 + 1])
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+    redis.call('ZREMRANGEBYSCORE', KEYS[n + i], '-inf', now)
+    if redis.call('ZCARD', KEYS[n + i]) >= max_in_flight then
+        wait = math.max(wait, 0.05)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i = 1, n do
+    local rate = tonumber(ARGV[3 + i * 3 - 1])
+    local burst = tonumber(ARGV[3 + i * 3])
+    redis.call('HSET', KEYS[i], 'tokens', tostring(levels[i] - 1), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[i], math.ceil(burst / rate) + 1)
+    redis.call('ZADD', KEYS[n + i], now + lease_ttl, lease)
+    redis.call('EXPIRE', KEYS[n + i], lease_ttl + 1)
+end
+return "0"
+"""
+
+_client = None
+_client_pid = None
+_script = None
+_disabled_until = 0.0
+_lock = threading.Lock()
+_ips = {}
+
+
+def _redis():
+    """One client per worker process (recreated after a fork)"""
+    global _client, _client_pid, _script
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = redis.from_url(settings.REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+            _script = _client.register_script(_ACQUIRE)
+            _client_pid = os.getpid()
+    return _client, _script
+
+
+def _redis_failed(e):
+    global _disabled_until
+    if time.monotonic() >= _disabled_until:
+        print(f"[Politeness limiter unavailable] {e}")
+    _disabled_until = time.monotonic() + REDIS_RETRY_AFTER
+
+
+def _resolve_ip(host):
+    now = time.monotonic()
+    cached = _ips.get(host)
+    if cached and cached[1] > now:
+        return cached[0]
+    try:
+        ip = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)[0][4][0]
+    except (socket.gaierror, UnicodeError, IndexError):
+        ip = None
+    _ips[host] = (ip, now + DNS_TTL)
+    return ip
+
+
+def _limits(host):
+    limits = []
+    if HOST_LIMIT[0] > 0:
+        limits.append((f"host:{host}", HOST_LIMIT))
+    ip = _resolve_ip(host) if IP_LIMIT[0] > 0 else None
+    if ip:
+        limits.append((f"ip:{ip}", IP_LIMIT))
+    return limits
+
+
+def acquire(host: str):
+    """Block until host (and its IP) may take another request; returns a lease for release().
+
+    Redis errors fail open: the scan runs unthrottled rather than failing its checks.
+    """
+    host = (host or "").lower().rstrip(".")
+    limits = _limits(host) if host and time.monotonic() >= _disabled_until else []
+    if not limits:
+        return None
+
+    lease = uuid.uuid4().hex
+    keys = [f"scanner:polite:bucket:{name}" for name, _ in limits]
+    keys += [f"scanner:polite:inflight:{name}" for name, _ in limits]
+    args = [len(limits), 0, lease, LEASE_TTL]
+    for _, (rate, burst, max_in_flight) in limits:
+        args += [rate, max(burst, 1), max(max_in_flight, 1)]
+
+    started, slept = time.monotonic(), False
+    try:
+        client, script = _redis()
+        while True:
+            args[1] = time.time()
+            wait = float(script(keys=keys, args=args, client=client))
+            if not wait:
+                break
+            if time.monotonic() - started + wait > MAX_WAIT:
+                print(f"[Politeness] gave up waiting for {host} after {MAX_WAIT}s")
+                keys = None
+                break
+            time.sleep(wait)
+            slept = True
+    except redis.RedisError as e:
+        _redis_failed(e)
+        keys = None
+
+    ctx = current_context()
+    if ctx is not None and slept:
+        ctx.count("polite_waits")
+        ctx.count("polite_wait_ms", int((time.monotonic() - started) * 1000))
+    return (lease, keys[len(limits):]) if keys else None
+
+
+def release(lease):
+    if lease is None:
+        return
+    lease_id, inflight_keys = lease
+    try:
+        client, _ = _redis()
+        with client.pipeline(transaction=False) as pipe:
+            for key in inflight_keys:
+                pipe.zrem(key, lease_id)
+            pipe.execute()
+    except redis.RedisError as e:
+        _redis_failed(e)
+
+
+@contextmanager
+def polite(url_or_host: str):
+    """Hold a politeness slot for the target of url_or_host while the block runs"""
+    host = urlsplit(url_or_host).hostname if "://" in url_or_host else url_or_host
+    lease = acquire(host)
+    try:
+        yield
+    finally:
+        release(lease)
+
+
+@asynccontextmanager
+async def apolite(host: str):
+    """polite() for coroutines: waiting happens on an executor thread, never on the loop"""
+    loop = asyncio.get_running_loop()
+    lease = await loop.run_in_executor(None, copy_context().run, acquire, host)
+    try:
+        yield
+    finally:
+        await loop.run_in_executor(None, release, lease)
@@ -0,0 +1,71 @@
+# scanner_tasks/registry.py
+# Declarative check registry: each check states its tier, cost class and the resources it reads
+
+TIER_ORDER = ("free", "pro", "enterprise")
+COSTS = ("light", "heavy")  # heavy checks run on their own Celery queue
+# Report order within a tier (checks from other modules sort last)
+MODULE_ORDER = (
+    "gdpr", "owasp", "encryption", "email_dns", "nist", "iso27001", "pcidss", "hipaa", "soc2", "cis",
+)
+
+CHECKS = {}
+
+
+def check_id(test_func) -> str:
+    return f"{test_func.__module__.rsplit('.', 1)[-1]}.{test_func.__name__}"
+
+
+class Check:
+    """One registered check: func is either check(domain) or async check(ctx)"""
+
+    def __init__(self, func, name: str, tier: str, cost: str, resources: tuple):
+        if tier not in TIER_ORDER:
+            raise ValueError(f"Unknown tier {tier!r} for {name}")
+        if cost not in COSTS:
+            raise ValueError(f"Unknown cost class {cost!r} for {name}")
+        self.id = check_id(func)
+        self.func = func
+        self.name = name
+        self.tier = tier
+        self.cost = cost
+        self.resources = tuple(resources)
+
+    @property
+    def sort_key(self):
+        module = self.id.split(".", 1)[0]
+        module_rank = MODULE_ORDER.index(module) if module in MODULE_ORDER else len(MODULE_ORDER)
+        return TIER_ORDER.index(self.tier), module_rank, self.func.__code__.co_firstlineno
+
+
+def check(name: str, tier: str = "free", cost: str = "light", resources: tuple = ()):
+    """Register a check function; it is returned unchanged so it can still be called directly"""
+    def _register(func):
+        entry = Check(func, name, tier, cost, resources)
+        CHECKS[entry.id] = entry
+        return func
+    return _register
+
+
+def get_check(test_func) -> Check | None:
+    return CHECKS.get(check_id(test_func))
+
+
+def tier_tests(tier: str) -> list:
+    """(name, func) for every check the tier includes, in report order"""
+    rank = TIER_ORDER.index(tier)
+    return [
+        (c.name, c.func)
+        for c in sorted(CHECKS.values(), key=lambda c: c.sort_key)
+        if TIER_ORDER.index(c.tier) <= rank
+    ]
+
+
+def required_resources(selected_tests) -> list:
+    """Distinct resources needed by the given (name, func) checks, in first-seen order"""
+    names = []
+    for _, test_func in selected_tests:
+        entry = get_check(test_func)
+        for resource in entry.resources if entry else ():
+            if resource not in names:
+                names.append(resource)
+    return names
@@ -0,0 +1,207 @@
+# scanner_tasks/resources.py
+# Network resources that checks declare in the registry. The prefetch stage fetches every
+# distinct resource of a scan concurrently, so checks evaluate data already in the ScanContext.
+
+import asyncio
+import hashlib
+import inspect
+import json
+import time
+from collections.abc import Mapping
+from contextvars import copy_context
+from urllib.parse import urlencode
+
+import requests
+
+from .context import current_context, note_truncated, scan_context
+from .crawler import SiteCrawl, crawl_site
+from .email_dns import probe_dns
+from .encryption import probe_tls
+from .helpers import ParsedPage, _fetch, _find_link, _get_headers, _get_page
+from .single_flight import arun_once, run_once
+
+SQLI_PAYLOADS = ["' OR '1'='1", "1; DROP TABLE users--"]
+
+# Static pages worth a conditional GET on the next scan (the homepage is always fetched
+# in full because the other pages are found through its links)
+CONDITIONAL_RESOURCES = ("privacy_policy", "terms", "login")
+# Attack-style probes: checks reading these are re-run on every scan, never reused
+ACTIVE_RESOURCES = ("admin", "phpinfo", "error_log", "sqli_probes")
+# Seconds a scan may hold a resource's single-flight lease (the crawl is the slowest)
+FLIGHT_LEASE_TTL = 120
+# Per-response headers that say nothing about how the site is configured
+VOLATILE_HEADERS = {
+    "date", "age", "expires", "set-cookie", "etag", "last-modified", "content-length",
+    "cf-ray", "x-request-id", "x-amz-cf-id", "x-served-by", "x-cache", "x-cache-hits",
+    "x-timer", "report-to", "nel", "server-timing",
+}
+
+
+def _linked_page(keywords):
+    def _fetch_linked(domain):
+        url = _find_link(domain, keywords)
+        return _get_page(url) if url else None
+    return _fetch_linked
+
+
+def _probe(path, method="GET", allow_redirects=True):
+    return lambda domain: _fetch(f"https://{domain}{path}", method=method, allow_redirects=allow_redirects)
+
+
+def _sqli_probes(domain):
+    """Response per payload (None where the request failed)"""
+    responses = []
+    for payload in SQLI_PAYLOADS:
+        try:
+            responses.append(_fetch(f"https://{domain}/search?{urlencode({'q': payload})}"))
+        except Exception:
+            responses.append(None)
+    return responses
+
+
+# name -> fetcher(domain), or async fetcher(ctx) for loop-native probes
+RESOURCES = {
+    "homepage": lambda domain: _get_page(f"https://{domain}"),
+    "headers": _get_headers,
+    "tls": probe_tls,
+    "dns": probe_dns,
+    "site": crawl_site,
+    "privacy_policy": _linked_page(["privacy policy", "privacy"]),
+    "terms": _linked_page(["terms", "aup"]),
+    "login": _linked_page(["login", "sign in"]),
+    "admin": _probe("/admin", allow_redirects=False),
+    "phpinfo": _probe("/phpinfo.php"),
+    "error_log": _probe("/error.log"),
+    "sqli_probes": _sqli_probes,
+}
+
+
+def resource(name: str, domain: str):
+    """A resource's value, fetched at most once per scan; fetch errors are re-raised.
+
+    Async resources are read from the prefetch stage (or fetched on a private loop
+    when called outside a scan).
+    """
+    fetcher = RESOURCES[name]
+    ctx = current_context()
+    if inspect.iscoroutinefunction(fetcher):
+        if ctx is None:
+            with scan_context(domain) as ctx:
+                return asyncio.run(fetcher(ctx))
+        if name not in ctx.resources:
+            raise LookupError(f"Resource {name!r} was not prefetched")
+        if isinstance(ctx.resources[name], BaseException):
+            raise ctx.resources[name]
+        return ctx.resources[name]
+    if ctx is None:
+        return fetcher(domain)
+
+    def _fetch_shared():
+        # Concurrent scans of the domain share one fetch (single_flight.py)
+        value = run_once(_flight_key(ctx, name), lambda: fetcher(domain), FLIGHT_LEASE_TTL)
+        if isinstance(value, ParsedPage):
+            # Possibly fetched by another scan: checks reading it via _get_page() reuse it too
+            ctx.seed(("page", value.url), value)
+        return value
+    return note_truncated(ctx.memo(("resource", name), _fetch_shared))
+
+
+def _flight_key(ctx, name):
+    key = f"resource:{name}:{ctx.domain.lower()}"
+    if name in CONDITIONAL_RESOURCES and ctx.validators:
+        # A scan sending conditional GETs may get a bodiless 304, which is no use to other scans
+        validators = json.dumps(ctx.validators, sort_keys=True, default=str)
+        key += f":{hashlib.sha256(validators.encode()).hexdigest()[:16]}"
+    return key
+
+
+async def prefetch(ctx, names) -> None:
+    """Fetch the named resources concurrently on the scan's loop, in the order given.
+
+    Errors are not raised here: they stay memoized in the context and surface in the
+    checks that read the resource, exactly as if the check had fetched it itself.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+
+    def _timed(name):
+        fetch_started = time.monotonic()
+        try:
+            return resource(name, ctx.domain)
+        finally:
+            ctx.durations[f"resource:{name}"] = time.monotonic() - fetch_started
+
+    async def _one(name):
+        if inspect.iscoroutinefunction(RESOURCES[name]):
+            fetch_started = time.monotonic()
+            try:
+                value = await arun_once(_flight_key(ctx, name), lambda: RESOURCES[name](ctx), FLIGHT_LEASE_TTL)
+                # Possibly probed by another scan: the checks' probe_tls()/probe_dns() reuse it
+                ctx.aseed(("resource", name), value)
+                return value
+            finally:
+                ctx.durations[f"resource:{name}"] = time.monotonic() - fetch_started
+        return await loop.run_in_executor(None, copy_context().run, _timed, name)
+
+    values = await asyncio.gather(*(_one(name) for name in names), return_exceptions=True)
+    for name, value in zip(names, values):
+        ctx.resources[name] = value
+        ctx.fingerprints[name] = fingerprint(ctx, value)
+        if ctx.fingerprints[name].get("not_modified"):
+            ctx.count("not_modified")
+    ctx.count("resources", len(names))
+    ctx.count("prefetch_ms", int((time.monotonic() - started) * 1000))
+
+
+async def refetch(ctx, names) -> None:
+    """Fetch resources again without validators: a 304 has no body for the checks that re-run"""
+    for name in names:
+        url = ctx.fingerprints[name]["url"]
+        ctx.validators.pop(url, None)
+        ctx.forget(("resource", name), ("page", url), ("http", "GET", url, True))
+    await prefetch(ctx, names)
+
+
+# === Fingerprints: a hash of everything a check can read from a resource ===
+
+def _stable_headers(headers):
+    return sorted((k.lower(), v) for k, v in headers.items() if k.lower() not in VOLATILE_HEADERS)
+
+
+def _canonical(value):
+    if isinstance(value, BaseException):
+        return {"error": type(value).__name__}
+    if isinstance(value, ParsedPage):
+        return {"url": value.url, "status": value.status_code, "body": value.content_hash}
+    if isinstance(value, SiteCrawl):
+        return {"robots": value.robots_ok, "sitemap": value.sitemap_ok, "pages": value.content_hash}
+    if isinstance(value, requests.Response):
+        return {
+            "url": value.url,
+            "status": value.status_code,
+            "headers": _stable_headers(value.headers),
+            "body": hashlib.sha256(value.content or b"").hexdigest(),
+        }
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, Mapping):
+        return _stable_headers(value)
+    return value
+
+
+def fingerprint(ctx, value) -> dict:
+    """{"hash": ...}; pages also carry the url and validators for the next scan's conditional GET"""
+    if not isinstance(value, ParsedPage):
+        return {"hash": hashlib.sha256(json.dumps(_canonical(value), default=str).encode()).hexdigest()}
+    previous = ctx.validators.get(value.url) or {}
+    if value.not_modified:
+        digest = previous.get("hash")
+    else:
+        digest = hashlib.sha256(json.dumps(_canonical(value)).encode()).hexdigest()
+    return {
+        "hash": digest,
+        "url": value.url,
+        "etag": value.etag or previous.get("etag"),
+        "last_modified": value.last_modified or previous.get("last_modified"),
+        "not_modified": value.not_modified,
+    }
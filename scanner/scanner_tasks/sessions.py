@@ -0,0 +1,161 @@
+# scanner_tasks/sessions.py
+
+import os
+import threading
+import time
+import zlib
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from urllib3.util.retry import Retry
+
+from .context import current_context
+from .politeness import polite
+
+USER_AGENT = "ComplyLawScanner/1.0 (+https://complylaw-v1.onrender.com)"
+DEFAULT_TIMEOUT = (5, 10)   # (connect, read) seconds
+POOL_HOSTS = 20             # distinct hosts kept in the pool cache
+POOL_SIZE = 10              # keep-alive connections per host
+
+# Response bodies are streamed and cut off at a cap per Content-Type (first match wins)
+MAX_BODY_BYTES = int(getattr(settings, "SCANNER_MAX_BODY_BYTES", 2 * 1024 * 1024))
+BODY_LIMITS = (
+    ("html", MAX_BODY_BYTES),
+    ("xml", MAX_BODY_BYTES),
+    ("json", MAX_BODY_BYTES // 2),
+    ("javascript", MAX_BODY_BYTES // 2),
+    ("text/", MAX_BODY_BYTES // 2),
+)
+OTHER_BODY_LIMIT = 256 * 1024   # images, PDFs, anything else the checks don't read
+BODY_READ_TIMEOUT = 30          # seconds for a whole body, however slowly it trickles in
+MAX_DECOMPRESSION_RATIO = 100   # decoded/encoded; beyond that (past 1 MB) it is a bomb
+BOMB_MIN_BYTES = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# Only encodings whose decoder output can be bounded; brotli's can't (the whole bomb is
+# inflated before it could be cut), so br is neither asked for nor decoded
+ACCEPT_ENCODING = "gzip, deflate"
+ZLIB_ENCODINGS = ("gzip", "x-gzip", "deflate")
+
+
+def body_limit(content_type: str) -> int:
+    content_type = (content_type or "").lower()
+    return next((cap for fragment, cap in BODY_LIMITS if fragment in content_type), OTHER_BODY_LIMIT)
+
+
+class _Decoder:
+    """Incremental Content-Encoding decoder that never produces more than asked for"""
+
+    def __init__(self, encoding):
+        # wbits + 32 accepts both gzip and zlib headers
+        self._zlib = zlib.decompressobj(zlib.MAX_WBITS | 32) if encoding in ZLIB_ENCODINGS else None
+        # Anything else we didn't ask for (br, zstd, ...) is not decoded at all
+        self.supported = self._zlib is not None or encoding in ("", "identity")
+
+    def decode(self, chunk: bytes, max_length: int) -> bytes:
+        if self._zlib is not None:
+            return self._zlib.decompress(chunk, max_length)
+        return chunk[:max_length]
+
+
+def read_bounded(response):
+    """Read a streamed response's body up to its cap, decoding as it goes.
+
+    Sets response.content as requests would, plus response.truncated: None for a
+    complete body, else why it was cut short ("size limit", "decompression ratio",
+    "read time limit" or "bad encoding", which includes an encoding we didn't ask for).
+    """
+    limit = body_limit(response.headers.get("Content-Type"))
+    decoder = _Decoder(response.headers.get("Content-Encoding", "").strip().lower())
+    body, received = bytearray(), 0
+    truncated = None if decoder.supported else "bad encoding"
+    deadline = time.monotonic() + BODY_READ_TIMEOUT
+    try:
+        for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False) if not truncated else ():
+            received += len(chunk)
+            try:
+                body += decoder.decode(chunk, limit + 1 - len(body))
+            except zlib.error:
+                truncated = "bad encoding"
+                break
+            if len(body) > limit:
+                truncated = "size limit"
+            elif len(body) > BOMB_MIN_BYTES and len(body) > received * MAX_DECOMPRESSION_RATIO:
+                truncated = "decompression ratio"
+            elif time.monotonic() > deadline:
+                truncated = "read time limit"
+            if truncated:
+                break
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except ReadTimeoutError as e:
+        raise requests.exceptions.ConnectionError(e)
+    finally:
+        if truncated:
+            # The rest of the body is never read, so the connection can't go back to the pool
+            response.raw.close()
+        response.raw.release_conn()
+    response._content = bytes(body[:limit])
+    response._content_consumed = True
+    response.truncated = truncated
+    if truncated:
+        ctx = current_context()
+        if ctx is not None:
+            ctx.count("truncated_bodies")
+    return response
+
+
+class BoundedAdapter(HTTPAdapter):
+    """Streams every body through read_bounded() unless the caller asked for stream=True.
+
+    Each hop holds one politeness slot for its target while it is sent and its body read.
+    This is the adapter, not Session.send: requests follows redirects by calling
+    Session.send from inside Session.send, so a slot taken there is held by every hop
+    at once and same-host redirects block each other.
+    """
+
+    def send(self, request, stream=False, **kwargs):
+        with polite(request.url):
+            response = super().send(request, stream=True, **kwargs)
+            if not stream:
+                read_bounded(response)
+        return response
+
+
+class ScannerSession(requests.Session):
+    """requests.Session with per-host keep-alive pools, retries, default timeouts and politeness limits"""
+
+    def __init__(self):
+        super().__init__()
+        self.headers["User-Agent"] = USER_AGENT
+        self.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        retry = Retry(
+            total=2,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+            raise_on_status=False,
+        )
+        adapter = BoundedAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        kwargs.setdefault("verify", True)
+        return super().request(method, url, **kwargs)
+
+
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+
+
+def get_session() -> ScannerSession:
+    """One shared session per worker process (recreated after a fork)"""
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = ScannerSession()
+            _session_pid = os.getpid()
+    return _session
@@ -0,0 +1,117 @@
+# scanner_tasks/single_flight.py
+# Single-flight probes across workers: the first scan that needs a probe of a domain takes
+# a Redis lease (via the default Django cache) and runs it; concurrent scans of the same
+# domain wait for the published result instead of probing the target again
+
+import asyncio
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .context import current_context
+
+RESULT_TTL = 60        # seconds a published result is served to scans that arrive late
+POLL_INTERVAL = 0.25   # seconds between checks while another worker holds the lease
+MISSING = object()
+
+
+def _keys(key):
+    return f"scanner:flight:lease:{key}", f"scanner:flight:result:{key}"
+
+
+def published(key):
+    """The result another worker published for key, or MISSING"""
+    return cache.get(_keys(key)[1], MISSING)
+
+
+def try_lead(key, lease_ttl: int) -> str | None:
+    """Take the lease for key; returns a token for publish()/release(), or None if taken"""
+    token = uuid.uuid4().hex
+    return token if cache.add(_keys(key)[0], token, lease_ttl) else None
+
+
+def release(key, token):
+    lease_key = _keys(key)[0]
+    try:
+        # Not atomic, but a lease that expired and was re-taken in between is only cut short
+        if cache.get(lease_key) == token:
+            cache.delete(lease_key)
+    except Exception as e:
+        print(f"[Single-flight unavailable] {e}")
+
+
+def publish(key, token, value, ttl: int = RESULT_TTL):
+    """Share value with the waiting workers and give up the lease"""
+    try:
+        cache.set(_keys(key)[1], value, ttl)
+    except Exception as e:
+        print(f"[Single-flight unavailable] {e}")
+    release(key, token)
+
+
+def _coalesced():
+    ctx = current_context()
+    if ctx is not None:
+        ctx.count("coalesced")
+
+
+def run_once(key: str, compute, lease_ttl: int, result_ttl: int = RESULT_TTL):
+    """compute() at most once at a time across workers, sharing its result.
+
+    Waits up to lease_ttl for a leader; a leader that fails publishes nothing, so a
+    waiter takes the lease and computes. Cache errors fall back to computing locally.
+    """
+    deadline = time.monotonic() + lease_ttl
+    try:
+        while True:
+            value = published(key)
+            if value is not MISSING:
+                _coalesced()
+                return value
+            token = try_lead(key, lease_ttl)
+            if token is not None:
+                break
+            if time.monotonic() >= deadline:
+                return compute()
+            time.sleep(POLL_INTERVAL)
+    except Exception as e:
+        print(f"[Single-flight unavailable] {e}")
+        return compute()
+
+    try:
+        value = compute()
+    except BaseException:
+        release(key, token)
+        raise
+    publish(key, token, value, result_ttl)
+    return value
+
+
+async def arun_once(key: str, compute, lease_ttl: int, result_ttl: int = RESULT_TTL):
+    """run_once() for a coroutine factory; cache calls go to a thread, never block the loop"""
+    deadline = time.monotonic() + lease_ttl
+    try:
+        while True:
+            value = await asyncio.to_thread(published, key)
+            if value is not MISSING:
+                _coalesced()
+                return value
+            token = await asyncio.to_thread(try_lead, key, lease_ttl)
+            if token is not None:
+                break
+            if time.monotonic() >= deadline:
+                return await compute()
+            await asyncio.sleep(POLL_INTERVAL)
+    except Exception as e:
+        print(f"[Single-flight unavailable] {e}")
+        return await compute()
+
+    try:
+        value = await compute()
+    except BaseException:
+        # Called directly: on cancellation the scan's executor may already be shut down
+        release(key, token)
+        raise
+    await asyncio.to_thread(publish, key, token, value, result_ttl)
+    return value
@@ -1,5 +1,8 @@
 # scanner_tasks/soc2.py
 
+from .registry import check
+
+@check("SOC 2 Access", tier="enterprise")
 def check_soc2_access_reviews(domain: str):
     return {
         "title": "Access Reviews (SOC 2)",
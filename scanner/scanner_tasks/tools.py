@@ -0,0 +1,56 @@
+# scanner_tasks/tools.py
+# Running external scanners (nmap, nikto) with hard timeouts and streamed output
+
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+STOP_POLL_INTERVAL = 1.0  # seconds between should_stop() calls
+
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def stream_tool(cmd: list, timeout: int, on_line, should_stop=None):
+    """Run cmd in its own process group and hand each stdout line to on_line as it arrives.
+
+    On timeout, once should_stop() returns True, or on any interruption (e.g. a Celery
+    soft time limit) the whole group is killed so no nmap/nikto children are left behind;
+    whatever on_line already saw is kept by the caller. Returns (returncode, stderr, timed_out).
+    """
+    with tempfile.TemporaryFile(mode="w+") as stderr:
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=stderr, text=True, bufsize=1, start_new_session=True
+        )
+        expired, finished = threading.Event(), threading.Event()
+        deadline = time.monotonic() + timeout
+
+        def _watch():
+            while not finished.wait(STOP_POLL_INTERVAL if should_stop else max(0, deadline - time.monotonic())):
+                if time.monotonic() >= deadline or (should_stop and should_stop()):
+                    expired.set()
+                    _kill_group(proc)
+                    return
+
+        watchdog = threading.Thread(target=_watch, daemon=True)
+        watchdog.start()
+        try:
+            for line in proc.stdout:
+                on_line(line)
+            proc.wait()
+        except BaseException:
+            _kill_group(proc)
+            proc.wait()
+            raise
+        finally:
+            finished.set()
+            proc.stdout.close()
+        stderr.seek(0)
+        return proc.returncode, stderr.read(), expired.is_set()
@@ -0,0 +1,132 @@
+# scanner/scheduling.py
+# Recurring scans. Each schedule runs once per day/week at a fixed slot derived from a hash
+# of its firm and domain, so schedules are spread evenly over the period instead of all
+# starting at midnight, and a domain is rescanned at the same time every period.
+# Celery beat calls dispatch_due() every minute (CELERY_BEAT_SCHEDULE); due scans are held
+# back while their tier's queue is already full and start on a later tick, oldest first.
+
+import hashlib
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ScanResult, ScanSchedule
+from .queues import DEFAULT_SUBSCRIPTION, scan_queue, queue_depth
+
+PERIODS = {"daily": timedelta(days=1), "weekly": timedelta(days=7)}
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# No scheduled scan is started while this many scans already wait in the tier's queue
+MAX_QUEUE_DEPTH = getattr(settings, "SCANNER_SCHEDULE_MAX_QUEUE_DEPTH", 10)
+# Scheduled scans started per tick, all tiers together
+MAX_PER_TICK = getattr(settings, "SCANNER_SCHEDULE_MAX_PER_TICK", 20)
+
+
+def slot_offset(firm_id, domain: str, frequency: str) -> timedelta:
+    """Where in its period the schedule runs: the same for the same firm and domain"""
+    period = PERIODS.get(frequency, PERIODS["daily"])
+    digest = hashlib.sha256(f"{firm_id}:{domain}".encode()).digest()
+    return timedelta(seconds=int.from_bytes(digest[:8], "big") % int(period.total_seconds()))
+
+
+def next_slot(schedule, after=None):
+    """The schedule's first slot strictly after `after` (default now); missed slots are skipped"""
+    after = after or timezone.now()
+    period = PERIODS.get(schedule.frequency, PERIODS["daily"])
+    offset = slot_offset(schedule.firm_id, schedule.domain, schedule.frequency)
+    periods = (after - EPOCH - offset) // period + 1
+    return EPOCH + offset + periods * period
+
+
+def save_schedule(firm, user, domain: str, frequency: str) -> ScanSchedule:
+    """Create or change the schedule of a domain; frequency "off" disables it"""
+    schedule, created = ScanSchedule.objects.get_or_create(firm=firm, domain=domain, defaults={"user": user})
+    if frequency in PERIODS:
+        # An unchanged active schedule keeps its slot; anything else starts from the next one
+        if created or not schedule.enabled or schedule.frequency != frequency:
+            schedule.frequency = frequency
+            schedule.next_run_at = next_slot(schedule)
+        schedule.enabled = True
+        schedule.user = user or schedule.user
+    else:
+        schedule.enabled = False
+    schedule.save()
+    return schedule
+
+
+def _waiting(tier: str) -> int:
+    """Scans waiting in the tier's queue; the PENDING scans in the DB if the broker can't tell"""
+    depth = queue_depth(scan_queue(tier))
+    if depth is None:
+        depth = ScanResult.objects.filter(status='PENDING', firm__subscription_tier=tier).count()
+    return depth
+
+
+def _start(schedule, now):
+    """Move the schedule to its next slot and queue its scan; None if nothing was queued"""
+    from .tasks import run_compliance_scan
+
+    subscription = schedule.firm.subscription_tier
+    with transaction.atomic():
+        # Re-check under the lock: an overlapping tick may have started this run already
+        schedule = ScanSchedule.objects.select_for_update().filter(
+            pk=schedule.pk, enabled=True, next_run_at__lte=now
+        ).first()
+        if schedule is None:
+            return None
+        schedule.next_run_at = next_slot(schedule, now)
+        schedule.last_run_at = now
+        schedule.deferrals = 0
+        schedule.save(update_fields=['next_run_at', 'last_run_at', 'deferrals'])
+
+        # A scan of the domain that is already queued or running covers this run
+        if ScanResult.objects.filter(
+            firm_id=schedule.firm_id, domain=schedule.domain, status__in=['PENDING', 'RUNNING']
+        ).exists():
+            return None
+
+        scan = ScanResult.objects.create(
+            firm_id=schedule.firm_id,
+            user_id=schedule.user_id,
+            schedule=schedule,
+            domain=schedule.domain,
+            status='PENDING',
+            scan_id=str(uuid.uuid4())[:8],
+        )
+        transaction.on_commit(lambda: run_compliance_scan.delay(scan.pk, subscription=subscription))
+    return scan
+
+
+def dispatch_due(now=None) -> dict:
+    """Start the due scheduled scans the queues have room for; the rest wait for a later tick"""
+    now = now or timezone.now()
+    due = (
+        ScanSchedule.objects.filter(enabled=True, next_run_at__lte=now)
+        .select_related('firm')
+        .order_by('next_run_at')
+    )
+
+    headroom = {}  # tier -> scans that may still be queued this tick
+    started, deferred = 0, []
+    for schedule in due.iterator():
+        if started >= MAX_PER_TICK:
+            deferred.append(schedule.pk)
+            continue
+        tier = (schedule.firm.subscription_tier or DEFAULT_SUBSCRIPTION).lower()
+        if tier not in headroom:
+            headroom[tier] = MAX_QUEUE_DEPTH - _waiting(tier)
+        if headroom[tier] <= 0:
+            deferred.append(schedule.pk)
+            continue
+        if _start(schedule, now) is not None:
+            started += 1
+            headroom[tier] -= 1
+
+    if deferred:
+        ScanSchedule.objects.filter(pk__in=deferred).update(deferrals=F('deferrals') + 1)
+        print(f"[Scheduled scans] {len(deferred)} deferred, queues full: {headroom}")
+    return {"started": started, "deferred": len(deferred)}
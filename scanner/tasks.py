@@ -6,72 +6,37 @@ import time
 import random
 import requests
 import urllib3
-from celery import shared_task
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from celery import shared_task, chord
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
 from django.contrib.messages import get_messages
 from django.contrib.sessions.models import Session
 
 from .scanner_tasks.helpers import connect_to_external_scanner
-from .scanner_tasks.gdpr import (
-    check_gdpr_dsar, check_gdpr_dpia, check_gdpr_retention, check_gdpr_dpo,
-    crawl_sitemap, check_cookies, check_privacy_policy
+from .scanner_tasks.cancellation import CancelToken, ScanCancelled
+from .scanner_tasks.context import scan_context
+from .scanner_tasks import single_flight
+from .scanner_tasks.crawler import SiteCrawl
+from .scanner_tasks.engine import iter_results
+from .result_cache import get_cached_results, store_result, check_id, normalize_domain
+from .check_stats import estimate_durations, record_durations, longest_first
+from .incremental import load_baseline, snapshot, STATE_KEY as INCREMENTAL_STATE_KEY
+from .queues import SCAN_TIERS, DEFAULT_SUBSCRIPTION, record_queue_wait
+from .scheduling import dispatch_due
+from .deltas import record_delta
+from .batches import claim_slot, scan_finished, start_all_waiting_scans
+from . import progress as scan_progress
+# Importing the check modules registers their checks (scanner_tasks/registry.py)
+from .scanner_tasks import (  # noqa: F401
+    gdpr, owasp, encryption, email_dns, nist, iso27001, pcidss, hipaa, soc2, cis
 )
-from .scanner_tasks.owasp import (
-    check_broken_access_control, check_crypto_failures, check_sql_injection,
-    check_missing_security_headers, check_security_misconfig, check_outdated_software,
-    check_auth_failures, check_integrity_failures, check_logging_monitoring, check_ssrf,
-    run_nikto_scan
-)
-from .scanner_tasks.iso27001 import check_iso27001_access_control
-from .scanner_tasks.pcidss import check_pci_dss_logging
-from .scanner_tasks.hipaa import check_hipaa_encryption, check_forms
-from .scanner_tasks.soc2 import check_soc2_access_reviews
-from .scanner_tasks.cis import check_cis_benchmark_1_4
-from .scanner_tasks.nist import check_third_party_scripts, run_nmap_vuln_scan
-from .scanner_tasks.encryption import check_ssl_tls
-
-
-# === TIERS (same as before) ===
-gdpr_tests = [
-    ("GDPR: DSAR", check_gdpr_dsar),
-    ("GDPR: DPIA", check_gdpr_dpia),
-    ("GDPR: Retention", check_gdpr_retention),
-    ("GDPR: DPO", check_gdpr_dpo),
-    ("Sitemap & Robots", crawl_sitemap),
-    ("Cookie Consent", check_cookies),
-    ("Privacy Policy", check_privacy_policy),
-]
-
-owasp_tests = [
-    ("OWASP A01: Access Control", check_broken_access_control),
-    ("OWASP A02: Crypto", check_crypto_failures),
-    ("OWASP A03: Injection", check_sql_injection),
-    ("OWASP A04: Headers", check_missing_security_headers),
-    ("OWASP A05: Misconfig", check_security_misconfig),
-    ("OWASP A06: Outdated", check_outdated_software),
-    ("OWASP A07: Auth", check_auth_failures),
-    ("OWASP A08: Integrity", check_integrity_failures),
-    ("OWASP A09: Logging", check_logging_monitoring),
-    ("OWASP A10: SSRF", check_ssrf),
-    ("Nikto Scan", run_nikto_scan),
-]
-
-basic_security_tests = [
-    ("SSL/TLS Check", check_ssl_tls),
-    ("Third-Party Scripts", check_third_party_scripts),
-]
-
-iso27001_tests = [("ISO 27001 Access", check_iso27001_access_control)]
-pcidss_tests = [("PCI DSS Headers", check_pci_dss_logging)]
-hipaa_tests = [("HIPAA Encryption", check_hipaa_encryption), ("HIPAA Forms", check_forms)]
-soc2_tests = [("SOC 2 Access", check_soc2_access_reviews)]
-cis_tests = [("CIS Lockout", check_cis_benchmark_1_4)]
-nmap_tests = [("Nmap Vuln Scan", run_nmap_vuln_scan)]
-
-FREE_TESTS = gdpr_tests + owasp_tests[:7] + basic_security_tests
-PRO_TESTS = FREE_TESTS + owasp_tests[7:] + iso27001_tests + pcidss_tests
-ENTERPRISE_TESTS = PRO_TESTS + hipaa_tests + soc2_tests + cis_tests + nmap_tests
+from .scanner_tasks.registry import CHECKS, tier_tests, required_resources
+
+
+# === TIERS (derived from the check registry; each tier includes the ones below it) ===
+FREE_TESTS = tier_tests("free")
+PRO_TESTS = tier_tests("pro")
+ENTERPRISE_TESTS = tier_tests("enterprise")
 #FREE_TESTS=ENTERPRISE_TESTS
 
 TIERS = {
@@ -80,45 +45,87 @@ TIERS = {
     "enterprise": ENTERPRISE_TESTS,
 }
 
+# Threads per scan for sync checks, and async checks in flight on the scan's event loop
+SCAN_CONCURRENCY = getattr(settings, "SCANNER_MAX_WORKERS", 6)
+SCAN_ASYNC_CONCURRENCY = getattr(settings, "SCANNER_ASYNC_CONCURRENCY", 50)
+
+# Long-running external tools: dispatched to their own queue (CELERY_TASK_ROUTES)
+# so they never hold the slots that serve the fast HTTP checks
+HEAVY_CHECKS = {cid: c.func for cid, c in CHECKS.items() if c.cost == "heavy"}
+# Test name -> check id, for results that come back from the heavy queue by name
+CHECK_IDS = {c.name: cid for cid, c in CHECKS.items()}
+HEAVY_SOFT_TIME_LIMIT = getattr(settings, "SCANNER_HEAVY_TIME_LIMIT", 900)
+# A scan whose nmap/nikto run is already in flight for another scan of the same domain
+# waits for that result, retrying every HEAVY_FLIGHT_RETRY_DELAY seconds
+HEAVY_FLIGHT_RETRY_DELAY = 30
+HEAVY_FLIGHT_RESULT_TTL = 15 * 60
+
+# Wall-clock budget (seconds) per tier, counted from when the scan gets its firm slot;
+# at the deadline outstanding checks are abandoned and the scan finishes with what it has
+SCAN_TIME_BUDGETS = {
+    "free": getattr(settings, "SCANNER_TIME_BUDGET_FREE", 300),
+    "pro": getattr(settings, "SCANNER_TIME_BUDGET_PRO", 900),
+    "enterprise": getattr(settings, "SCANNER_TIME_BUDGET_ENTERPRISE", 1800),
+}
+
 
 @shared_task(bind=True)
-def run_compliance_scan(self, scan_id):
+def run_compliance_scan(self, scan_id, force_refresh=False, tier=None, subscription=None):
+    """Run one scan; tier, if given, overrides the user's subscription tier (benchmarks).
+
+    subscription is the firm's tier as the caller knew it, read only by the queue router.
+    """
     try:
         scan = ScanResult.objects.select_for_update().get(pk=scan_id)
     except ScanResult.DoesNotExist:
         return "Scan not found"
+    if scan.status == 'CANCELLED':
+        return "Scan cancelled"
 
-    domain = scan.domain.strip().lower().replace("https://", "").replace("http://", "").split("/")[0]
+    domain = _scan_domain(scan)
 
-    # Get user tier
-    try:
-        user_tier = scan.user.profile.subscription_tier.lower() if hasattr(scan, 'user') and hasattr(scan.user, 'profile') else 'free'
-    except:
-        user_tier = 'free'
+    # Wait for a free firm slot so one big portfolio can't take every worker; a scan that
+    # has to wait is queued again by batches.start_waiting_scans() when a slot frees up
+    claimed = claim_slot(scan, force_refresh=force_refresh, tier=tier)
+    if claimed is None:
+        return "Scan no longer pending"
+    if not claimed:
+        return "Waiting for a firm slot"
+
+    # Checks the firm's subscription pays for
+    subscription = (scan.firm.subscription_tier or DEFAULT_SUBSCRIPTION).lower()
+    user_tier = tier or SCAN_TIERS.get(subscription, 'free')
+
+    # Time from the scan request to a worker (and firm slot) picking it up, per tier
+    queue_wait = (scan.started_at - scan.scan_date).total_seconds()
+    record_queue_wait(subscription, queue_wait)
 
     selected_tests = TIERS.get(user_tier, FREE_TESTS)
+    budget = SCAN_TIME_BUDGETS.get(user_tier, SCAN_TIME_BUDGETS["free"])
+    cancel = CancelToken(scan.pk, deadline=time.time() + budget)
 
     # Initialize
-    scan.status = 'RUNNING'
     scan.progress = 0
     scan.current_step = "Starting scan..."
     #scan.scan_log = f"[{timezone.now():%H:%M:%S}] Scan started for {domain}\n"
     #scan.save(update_fields=['status', 'progress', 'current_step'])
-    scan.save(update_fields=['status', 'progress', 'current_step', 'scan_log'])
+    # Not status: a cancel may already have replaced RUNNING
+    scan.save(update_fields=['progress', 'current_step', 'scan_log'])
 
     # Use a list to collect logs → write only 2–3 times total
-    log_buffer = [f"[{timezone.now():%H:%M:%S}] Scan started → {domain} ({user_tier.capitalize()} Tier)"]
+    log_buffer = [
+        f"[{timezone.now():%H:%M:%S}] Scan started → {domain} ({user_tier.capitalize()} Tier) "
+        f"after {queue_wait:.1f}s in the {subscription} queue"
+    ]
 
-    channel_layer = get_channel_layer()
     raw_data = {
         "findings": [],
         "recommendations": [],
         "scanned_urls": 0,
         "issues_found": 0,
-        "vulnerabilities": []
+        "vulnerabilities": [],
+        "queue_wait": round(queue_wait, 3),
     }
-    findings, breach_alerts, checklist = [], [], {}
-
     total_tests = len(selected_tests)
     progress_per_test = 90 / max(total_tests, 1)
 
@@ -126,21 +133,237 @@ def run_compliance_scan(self, scan_id):
     external_results = connect_to_external_scanner(domain)
     _update_scan(scan, progress=5, step="Connecting...", log_buffer=log_buffer)
 
-    for idx, (test_name, test_func) in enumerate(selected_tests):
-        progress = min(95, 5 + int((idx + 1) * progress_per_test))
+    results = [None] * total_tests
+    done = 0
 
-        _update_scan(scan, progress=progress, step=test_name, log_buffer=log_buffer)
+    def _record(idx, result, note=""):
+        nonlocal done
+        # The check id makes the result's finding fingerprint (deltas.py)
+        results[idx] = dict(result, check=check_id(selected_tests[idx][1]))
+        done += 1
+        progress = min(95, 5 + int(done * progress_per_test))
 
+        # Log result as each check finishes
+        test_name = selected_tests[idx][0]
+        status = result.get("status", "error").upper()
+        log_buffer.append(f"[{timezone.now():%H:%M:%S}] [{progress}%] {test_name}: {status}{note}")
+        _update_scan(scan, progress=progress, step=f"{test_name}: {status}{note}", log_buffer=log_buffer)
+
+    # Reuse results another scan of this domain produced within each check's TTL
+    cached = {} if force_refresh else get_cached_results(domain, selected_tests)
+    for idx, result in sorted(cached.items()):
+        _record(idx, dict(result, cached=True), note=" (cached)")
+    raw_data["cached_checks"] = [selected_tests[idx][0] for idx in sorted(cached)]
+
+    pending = [idx for idx in range(total_tests) if idx not in cached]
+
+    # Start the slowest checks and resources first (history from earlier runs) so the
+    # short ones pack around them instead of the longest one starting last
+    resource_names = required_resources([selected_tests[idx] for idx in pending])
+    stat_ids = [check_id(selected_tests[idx][1]) for idx in pending] + [f"resource:{n}" for n in resource_names]
+    estimates = estimate_durations(domain, stat_ids, costs={cid: CHECKS[cid].cost for cid in stat_ids if cid in CHECKS})
+    pending = longest_first(pending, lambda idx: check_id(selected_tests[idx][1]), estimates)
+
+    heavy = [idx for idx in pending if check_id(selected_tests[idx][1]) in HEAVY_CHECKS]
+    light = [idx for idx in pending if idx not in heavy]
+    # Incremental rescan: conditional GETs for the last scan's pages, and its passive
+    # results reused wherever every input is byte-identical
+    baseline = None if force_refresh else load_baseline(scan)
+    with scan_context(domain) as ctx:
+        light_tests = [selected_tests[idx] for idx in light]
+        resources = longest_first(required_resources(light_tests), lambda name: f"resource:{name}", estimates)
+        if baseline:
+            ctx.validators = baseline.validators()
+        checks = iter_results(
+            ctx, light_tests, SCAN_CONCURRENCY, SCAN_ASYNC_CONCURRENCY, resources=resources,
+            reuse=(lambda ctx: baseline.reusable(ctx, light_tests)) if baseline else None,
+            cancel=cancel,
+        )
         try:
-            result = test_func(domain)
-        except Exception as e:
-            result = {"title": test_name, "status": "error", "details": str(e)}
+            for run_idx, test_name, result in checks:
+                idx = light[run_idx]
+                store_result(domain, selected_tests[idx][1], result)
+                _record(idx, result, note=f" (reused from scan {result['reused_from']})" if result.get("reused_from") else "")
+        except ScanCancelled:
+            log_buffer.append(f"[{timezone.now():%H:%M:%S}] Stopping: {_stop_reason(cancel, budget)}")
+        raw_data[INCREMENTAL_STATE_KEY] = snapshot(
+            ctx, light_tests, {run_idx: results[idx] or {} for run_idx, idx in enumerate(light)}, baseline
+        )
+        site = ctx.resources.get("site")
+    if isinstance(site, SiteCrawl):
+        raw_data["scanned_urls"] = site.pages
+        raw_data["crawl"] = site.summary()
+        log_buffer.append(
+            f"[{timezone.now():%H:%M:%S}] Crawl: {site.pages} pages, {site.bytes // 1024} KB, depth {site.depth}, "
+            f"{site.disallowed} disallowed by robots.txt" + (f" (stopped at the {site.stopped} limit)" if site.stopped else "")
+        )
+    elif baseline and baseline.crawl:
+        # Every check that reads the site came from the result cache: report the crawl they used
+        raw_data["crawl"] = dict(baseline.crawl, reused_from=baseline.crawl.get("reused_from") or baseline.scan_id)
+        raw_data["scanned_urls"] = raw_data["crawl"].get("pages", 0)
+    raw_data["reused_checks"] = [selected_tests[idx][0] for idx in light if (results[idx] or {}).get("reused_from")]
+
+    log_buffer.append(
+        f"[{timezone.now():%H:%M:%S}] HTTP: {ctx.stats['requests']} requests, {ctx.stats['cache_hits']} reused, "
+        f"{len(cached)} checks from cache, {ctx.stats.get('polite_wait_ms', 0) / 1000:.1f}s politeness wait, "
+        f"{ctx.stats.get('truncated_bodies', 0)} bodies truncated"
+    )
+    log_buffer.append(
+        f"[{timezone.now():%H:%M:%S}] Prefetch: {ctx.stats.get('resources', 0)} resources in "
+        f"{ctx.stats.get('prefetch_ms', 0) / 1000:.1f}s, {ctx.stats.get('not_modified', 0)} not modified, "
+        f"{len(raw_data['reused_checks'])} checks reused, {ctx.stats.get('coalesced', 0)} shared with concurrent scans, "
+        f"{ctx.stats.get('late_requests', 0)} late requests"
+    )
+    raw_data["telemetry"] = dict(ctx.stats, durations={k: round(v, 3) for k, v in ctx.durations.items()})
+    slowest = sorted(ctx.durations.items(), key=lambda item: -item[1])[:3]
+    if slowest:
+        log_buffer.append(f"[{timezone.now():%H:%M:%S}] Slowest: " + ", ".join(f"{k} {v:.1f}s" for k, v in slowest))
+    record_durations(domain, ctx.durations)
+
+    if cancel.cancelled:
+        # Nothing else is started; the scan finishes with the results it has
+        _skip_unfinished(selected_tests, results, raw_data, _stop_reason(cancel, budget))
+        _finalize_scan(scan, domain, results, log_buffer, raw_data, external_results)
+        return
+
+    if heavy:
+        # Heavy tools finish on the heavy queue; the chord callback merges them and finalizes
+        heavy_tests = [[idx, selected_tests[idx][0]] for idx in heavy]
+        names = ", ".join(name for _, name in heavy_tests)
+        log_buffer.append(f"[{timezone.now():%H:%M:%S}] Queued deep scans: {names}")
+        _update_scan(scan, progress=95, step=f"Deep scans running ({names})...", log_buffer=log_buffer)
+        scan.scan_log = "\n".join(log_buffer[-100:])
+        scan.save(update_fields=['scan_log', 'progress', 'current_step'])
+        # The chord callback finishes the scan, maybe in another worker
+        scan_progress.close(scan)
+        chord(
+            run_heavy_check.s(scan_id, domain, check_id(selected_tests[idx][1]), selected_tests[idx][0], cancel.deadline)
+            for idx in heavy
+        )(finalize_compliance_scan.s(scan_id, results, heavy_tests, log_buffer, raw_data, external_results))
+        return
+
+    _finalize_scan(scan, domain, results, log_buffer, raw_data, external_results)
+
+
+@shared_task(bind=True, soft_time_limit=HEAVY_SOFT_TIME_LIMIT, time_limit=HEAVY_SOFT_TIME_LIMIT + 60)
+def run_heavy_check(self, scan_id, domain, check, test_name=None, deadline=None):
+    """Run one nmap/nikto check on the heavy queue. Never raises, so the chord always completes.
+
+    The tool is killed (keeping its partial findings) when the scan is cancelled or its
+    deadline passes; it is not started at all if that already happened.
+    """
+    test_func = HEAVY_CHECKS[check]
+    test_name = test_name or check
+    cancel = CancelToken(scan_id, deadline)
+    if cancel.cancelled:
+        return dict(_skipped(test_name, cancel.reason), stopped=cancel.reason)
+
+    # One run per tool and domain at a time, whichever scans want it (single_flight.py)
+    flight = f"heavy:{check}:{normalize_domain(domain)}"
+    try:
+        shared, token = single_flight.published(flight), None
+        if shared is single_flight.MISSING:
+            token = single_flight.try_lead(flight, HEAVY_SOFT_TIME_LIMIT + 60)
+    except Exception as e:
+        print(f"[Single-flight unavailable] {e}")
+        shared, token = single_flight.MISSING, ""
+    if shared is not single_flight.MISSING:
+        return shared
+    if token is None:
+        # Wait for the other run's result without holding a heavy worker
+        raise self.retry(countdown=HEAVY_FLIGHT_RETRY_DELAY, max_retries=None)
+
+    scan = ScanResult.objects.filter(pk=scan_id).first()
+    # Tools can emit many lines per second; the publisher keeps the latest within its limits
+    publisher = scan_progress.ProgressPublisher(scan) if scan else None
+
+    def _progress(percent, message):
+        if publisher is not None:
+            publisher.update(scan.progress, f"{test_name}: {message}")
+
+    started = time.monotonic()
+    try:
+        result = test_func(domain, on_progress=_progress, should_stop=lambda: cancel.cancelled)
+    except SoftTimeLimitExceeded:
+        result = {"title": test_name, "status": "error", "details": f"Time limit ({HEAVY_SOFT_TIME_LIMIT}s) exceeded"}
+    except Exception as e:
+        result = {"title": test_name, "status": "error", "details": str(e)}
+    finally:
+        if publisher is not None:
+            # The tool's last update may still be held back by the publisher's rate limit
+            publisher.flush()
+    if cancel.reason or result.get("status") == "error":
+        # Nothing worth sharing: a waiting scan takes the lease and runs the tool itself
+        if token:
+            single_flight.release(flight, token)
+        if cancel.reason:
+            # Cut short on purpose: keep the partial findings for this scan only
+            return dict(result, stopped=cancel.reason)
+    elif token:
+        single_flight.publish(flight, token, result, HEAVY_FLIGHT_RESULT_TTL)
+    record_durations(domain, {check: time.monotonic() - started})
+    store_result(domain, test_func, result)
+    return result
+
+
+@shared_task
+def finalize_compliance_scan(heavy_results, scan_id, results, heavy_tests, log_buffer, raw_data, external_results):
+    """Chord callback: merge heavy check results into the parent scan and finish it"""
+    try:
+        scan = ScanResult.objects.get(pk=scan_id)
+    except ScanResult.DoesNotExist:
+        return "Scan not found"
 
-        # Log result
+    stopped = None
+    for (idx, test_name), result in zip(heavy_tests, heavy_results):
+        stopped = result.pop("stopped", None) or stopped
+        results[idx] = dict(result, check=CHECK_IDS.get(test_name))
         status = result.get("status", "error").upper()
-        log_buffer.append(f"[{timezone.now():%H:%M:%S}] [{progress}%] {test_name}: {status}")
+        log_buffer.append(f"[{timezone.now():%H:%M:%S}] [95%] {test_name}: {status}")
+    if stopped:
+        log_buffer.append(f"[{timezone.now():%H:%M:%S}] Stopping: {stopped}")
+        raw_data["partial"] = {"reason": stopped, "skipped": [r["title"] for r in heavy_results if r.get("skipped")]}
+
+    _finalize_scan(scan, _scan_domain(scan), results, log_buffer, raw_data, external_results)
+
+
+@shared_task
+def dispatch_scheduled_scans():
+    """Celery beat, every minute: start the recurring scans that are due (scheduling.py),
+    and any waiting scans whose firm has a free slot no finishing scan handed on (batches.py)"""
+    return dict(dispatch_due(), waiting_started=start_all_waiting_scans())
+
+
+MESSAGE_VERBS = {'COMPLETED': "completed", 'PARTIAL': "stopped early", 'CANCELLED': "cancelled"}
+
+
+def _stop_reason(cancel, budget):
+    return f"time budget of {budget}s exhausted" if cancel.reason == "time budget exhausted" else cancel.reason
+
+
+def _skipped(test_name, reason):
+    return {"title": test_name, "status": "error", "details": f"Not run: {reason}", "skipped": True}
 
-        # Collect findings
+
+def _skip_unfinished(selected_tests, results, raw_data, reason):
+    """Fill in checks that never finished and record that the scan's results are partial"""
+    skipped = []
+    for idx, (test_name, _) in enumerate(selected_tests):
+        if results[idx] is None:
+            results[idx] = _skipped(test_name, reason)
+            skipped.append(test_name)
+    raw_data["partial"] = {"reason": reason, "skipped": skipped}
+
+
+def _scan_domain(scan):
+    return scan.domain.strip().lower().replace("https://", "").replace("http://", "").split("/")[0]
+
+
+def _finalize_scan(scan, domain, results, log_buffer, raw_data, external_results):
+    breach_alerts, checklist = [], {}
+
+    # Collect findings in TIERS order so reports stay stable between runs
+    for result in results:
         if not external_results:
             if result.get("status") in ["fail", "warn"]:
                 raw_data["findings"].append(result)
@@ -156,15 +379,21 @@ def run_compliance_scan(self, scan_id):
             if "cookie" in title:
                 checklist['cookie_banner'] = result["status"] == "pass"
 
-        time.sleep(0.4)
-
     # === Finalize ===
     _update_scan(scan, progress=98, step="Generating report...", log_buffer=log_buffer)
 
+    # A cancel that arrived while the scan ran wins: never overwrite it with COMPLETED
+    cancelled = ScanResult.objects.filter(pk=scan.pk, status='CANCELLED').exists()
+    # Checks that never ran are not passes, so a scan that stopped early gets no grade
+    partial = cancelled or bool(raw_data.get("partial"))
+
     if external_results:
         scan.grade = external_results.get("grade", "C")
         scan.risk_score = external_results.get("risk_score", 45.0)
         raw_data.update(external_results)
+    elif partial:
+        scan.grade = None
+        scan.risk_score = None
     else:
         fails = sum(1 for x in raw_data["findings"] if x["status"] == "fail")
         warns = sum(1 for x in raw_data["findings"] if x["status"] == "warn")
@@ -172,17 +401,31 @@ def run_compliance_scan(self, scan_id):
         scan.grade = "A" if score >= 90 else "B" if score >= 75 else "C" if score >= 60 else "D"
         scan.risk_score = round(100 - score + random.uniform(1, 4), 1)
 
+    status = 'CANCELLED' if cancelled else 'PARTIAL' if partial else 'COMPLETED'
+
     # Final log + save
-    log_buffer.append(f"[COMPLETE] Grade: {scan.grade} | Risk: {scan.risk_score}% | Issues: {len(raw_data['findings'])}")
+    if scan.grade:
+        verdict = f"Grade: {scan.grade} | Risk: {scan.risk_score}%"
+    else:
+        verdict = f"Not graded: {len(raw_data.get('partial', {}).get('skipped', []))} checks not run"
+    log_buffer.append(f"[{'COMPLETE' if status == 'COMPLETED' else status}] {verdict} | Issues: {len(raw_data['findings'])}")
     scan.scan_log = "\n".join(log_buffer[-100:])  # Keep last 100 lines
     scan.set_raw_data(raw_data)
     scan.set_breach_alerts(breach_alerts)
     scan.set_checklist_status(checklist)
     scan.recommendations = generate_recommendations(raw_data["findings"])
-    scan.status = 'COMPLETED'
+    # New / resolved / changed findings since the last completed scan of the domain
+    try:
+        record_delta(scan, raw_data["findings"] if external_results else results)
+    except Exception as e:
+        print(f"[Scan delta failed] {e}")
+    scan.status = status
     scan.completed_at = timezone.now()
     scan.progress = 100
-    scan.current_step = "Complete!"
+    scan.current_step = {
+        'CANCELLED': "Cancelled (partial results)",
+        'PARTIAL': "Stopped early (partial results, not graded)",
+    }.get(status, "Complete!")
 
     scan.save()
     
@@ -190,66 +433,43 @@ def run_compliance_scan(self, scan_id):
     # Send beautiful live toast: "abc.com scan completed!"
     # === Final Notification ===
     if scan.user: # Check if user exists before accessing .id
-        try:
-            async_to_sync(get_channel_layer().group_send)(
-                f"user_{scan.user.id}",
-                {
-                    "type": "scan_notification",
-                    "message": f"{domain} scan completed!",
-                    "grade": scan.grade,
-                    "risk_score": round(scan.risk_score, 1),
-                    "scan_id": scan.id
-                }
-            )
-        except Exception as e:
-            print(f"[Notification failed] {e}")
+        scan_progress.send(
+            f"user_{scan.user.id}",
+            {
+                "type": "scan_notification",
+                "message": f"{domain} scan {MESSAGE_VERBS[status]}!",
+                "grade": scan.grade,
+                "risk_score": round(scan.risk_score, 1) if scan.risk_score is not None else None,
+                "scan_id": scan.id
+            }
+        )
     
     # This MUST run regardless of the notification succeeding
     _send_ws_complete(scan)
+    scan_finished(scan)
 
 
-# === HELPER: Safe update (only 4–6 DB writes total!) ===
+# === HELPER: Live progress (coalesced and rate-limited, see progress.py) ===
 # scanner/tasks.py
 
 def _update_scan(scan, progress, step, log_buffer):
-    scan.progress = progress
-    scan.current_step = step
-    scan.save(update_fields=['progress', 'current_step'])
-    
-    try:
-        async_to_sync(get_channel_layer().group_send)(
-            f"scan_{scan.scan_id}",  # FIX: Use scan_id (UUID), not id (PK)
-            {
-                "type": "scan_update", # FIX: Use underscore to match consumer method
-                "progress": progress,
-                "step": step,
-                "status": "RUNNING"
-            }
-        )
-    except Exception as e:
-        print(f"WS Error: {e}")
+    scan_progress.publisher(scan).update(progress, step)
 
 def _send_ws_complete(scan):
-    try:
+    # Delivered after any update still queued, so the page never ends on a stale state
+    scan_progress.close(scan, messages=[
         # Pushes the 100% update first
-        async_to_sync(get_channel_layer().group_send)(
-            f"scan_{scan.scan_id}", # FIX: Use scan_id (UUID)
-            {
-                "type": "scan_update",
-                "progress": 100,
-                "step": "Scan Complete!",
-                "status": "COMPLETED",
-                "grade": scan.grade,
-                "risk_score": scan.risk_score
-            }
-        )
+        {
+            "type": "scan_update",
+            "progress": 100,
+            "step": {"COMPLETED": "Scan Complete!", "PARTIAL": "Scan Stopped Early"}.get(scan.status, "Scan Cancelled"),
+            "status": scan.status,
+            "grade": scan.grade,
+            "risk_score": scan.risk_score
+        },
         # Triggers the HTMX reload/modal
-        async_to_sync(get_channel_layer().group_send)(
-            f"scan_{scan.scan_id}", # FIX: Use scan_id (UUID)
-            {"type": "scan_complete_trigger"}
-        )
-    except Exception as e:
-        print(f"WS Finalize Error: {e}")
+        {"type": "scan_complete_trigger"},
+    ])
 
 
 
@@ -1,3 +1,771 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from reports.models import ComplianceReport
+from users.models import FirmProfile, UserAccount
+
+from . import batches, deltas, incremental, queues, result_cache, scheduling, tasks, views
+from .models import ScanResult, ScanSchedule
+from .scanner_tasks import cancellation, crawler, encryption, engine, helpers, keywords, registry, resources, sessions
+from .scanner_tasks.context import scan_context
+from .scanner_tasks.registry import CHECKS
+
+
+def make_firm(name="firm"):
+    user = UserAccount.objects.create(username=name, email=f"{name}@example.test")
+    firm = FirmProfile.objects.create(
+        user=user, firm_name=name, email=f"{name}@example.test", domain=f"{name}.example.test", phone=None
+    )
+    user.firm = firm
+    user.save(update_fields=["firm"])
+    return user, firm
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """path -> (status, headers, body) from the server's routes"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        status, headers, body = self.server.routes.get(self.path, (404, {}, b""))
+        self.send_response(status)
+        for name, value in dict({"Content-Length": str(len(body))}, **headers).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@contextmanager
+def stub_server(routes):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.routes = routes
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def raw_data(**extra):
+    return dict({"findings": [], "recommendations": [], "scanned_urls": 0, "issues_found": 0, "vulnerabilities": []}, **extra)
+
+
+@mock.patch("scanner.tasks._update_scan")
+@mock.patch("scanner.tasks.scan_progress.close")
+@mock.patch("scanner.tasks.scan_progress.send")
+@mock.patch("reports.models.ComplianceReport.generate_pdf")
+class FinalizeScanTests(TestCase):
+    def setUp(self):
+        self.user, self.firm = make_firm()
+        self.scan = ScanResult.objects.create(firm=self.firm, domain="example.com", status="RUNNING")
+
+    def finalize(self, results, data):
+        tasks._finalize_scan(self.scan, "example.com", results, [], data, None)
+        self.scan.refresh_from_db()
+
+    def test_full_scan_is_graded(self, *mocks):
+        self.finalize([{"title": "TLS", "status": "pass", "check": "encryption.tls"}], raw_data())
+        self.assertEqual(self.scan.status, "COMPLETED")
+        self.assertEqual(self.scan.grade, "A")
+        self.assertTrue(ComplianceReport.objects.filter(scan=self.scan).exists())
+
+    def test_skipped_checks_are_not_passes(self, *mocks):
+        results, data = [None, None], raw_data()
+        tasks._skip_unfinished([("TLS", None), ("Headers", None)], results, data, "time budget of 1s exhausted")
+        self.finalize(results, data)
+        self.assertEqual(self.scan.status, "PARTIAL")
+        self.assertIsNone(self.scan.grade)
+        self.assertIsNone(self.scan.risk_score)
+        self.assertFalse(ComplianceReport.objects.filter(scan=self.scan).exists())
+
+    def test_cancelled_scan_is_not_graded(self, *mocks):
+        ScanResult.objects.filter(pk=self.scan.pk).update(status="CANCELLED")
+        self.finalize([{"title": "TLS", "status": "pass"}], raw_data())
+        self.assertEqual(self.scan.status, "CANCELLED")
+        self.assertIsNone(self.scan.grade)
+        self.assertFalse(ComplianceReport.objects.filter(scan=self.scan).exists())
+
+
+@mock.patch("scanner.tasks.run_compliance_scan.delay")
+class FirmSlotTests(TestCase):
+    def setUp(self):
+        self.user, self.firm = make_firm()
+
+    def fill_slots(self):
+        running = []
+        for n in range(batches.FIRM_MAX_CONCURRENT_SCANS):
+            scan = ScanResult.objects.create(firm=self.firm, domain=f"busy{n}.com")
+            batches.claim_slot(scan)
+            running.append(scan)
+        return running
+
+    def test_claim_marks_pending_scan_running(self, delay):
+        scan = ScanResult.objects.create(firm=self.firm, domain="example.com")
+        self.assertTrue(batches.claim_slot(scan))
+        scan.refresh_from_db()
+        self.assertEqual(scan.status, "RUNNING")
+        self.assertIsNotNone(scan.started_at)
+
+    def test_claim_keeps_a_cancel_that_arrived_after_the_read(self, delay):
+        scan = ScanResult.objects.create(firm=self.firm, domain="example.com")
+        ScanResult.objects.filter(pk=scan.pk).update(status="CANCELLED")
+        self.assertIsNone(batches.claim_slot(scan))
+        scan.refresh_from_db()
+        self.assertEqual(scan.status, "CANCELLED")
+
+    def test_a_scan_without_a_slot_waits_without_a_task(self, delay):
+        self.fill_slots()
+        scan = ScanResult.objects.create(firm=self.firm, domain="example.com")
+        self.assertFalse(batches.claim_slot(scan, force_refresh=True, tier=None))
+        scan.refresh_from_db()
+        self.assertEqual(scan.status, "PENDING")
+        self.assertIsNone(scan.queued_at)
+        self.assertEqual(scan.run_options, {"force_refresh": True, "tier": None})
+        delay.assert_not_called()
+
+    def test_a_finishing_scan_starts_the_oldest_waiting_one(self, delay):
+        running = self.fill_slots()
+        waiting = [ScanResult.objects.create(firm=self.firm, domain=f"wait{n}.com", queued_at=None) for n in range(2)]
+        ScanResult.objects.filter(pk=waiting[0].pk).update(run_options={"force_refresh": True})
+        ScanResult.objects.filter(pk=running[0].pk).update(status="COMPLETED")
+        with self.captureOnCommitCallbacks(execute=True):
+            batches.scan_finished(running[0])
+        delay.assert_called_once_with(waiting[0].pk, subscription="trial", force_refresh=True)
+        self.assertEqual(ScanResult.objects.filter(status="PENDING", queued_at__isnull=True).count(), 1)
+
+    def test_portfolio_queues_only_the_free_slots(self, delay):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                "/scanner/batch/", '{"domains": ["a.com", "b.com", "c.com", "d.com", "e.com"]}',
+                content_type="application/json",
+            )
+        self.assertEqual(delay.call_count, batches.FIRM_MAX_CONCURRENT_SCANS)
+        self.assertEqual(ScanResult.objects.filter(status="PENDING", queued_at__isnull=True).count(),
+                         5 - batches.FIRM_MAX_CONCURRENT_SCANS)
+
+    def test_run_returns_instead_of_retrying_when_the_firm_is_full(self, delay):
+        self.fill_slots()
+        scan = ScanResult.objects.create(firm=self.firm, domain="example.com")
+        self.assertEqual(tasks.run_compliance_scan(scan.pk), "Waiting for a firm slot")
+
+
+class PolitenessSlotTests(SimpleTestCase):
+    def test_redirect_hops_take_one_slot_at_a_time(self):
+        held, most = [0], [0]
+
+        @contextmanager
+        def counting_polite(url):
+            held[0] += 1
+            most[0] = max(most[0], held[0])
+            try:
+                yield
+            finally:
+                held[0] -= 1
+
+        routes = {
+            "/old": (301, {"Location": "/new/"}, b""),
+            "/new/": (301, {"Location": "/new"}, b""),
+            "/new": (200, {"Content-Type": "text/html"}, b"<html>ok</html>"),
+        }
+        with stub_server(routes) as base, mock.patch.object(sessions, "polite", counting_polite):
+            response = sessions.ScannerSession().get(f"{base}/old")
+        self.assertEqual(response.text, "<html>ok</html>")
+        self.assertEqual(len(response.history), 2)
+        self.assertEqual(most[0], 1)
+        self.assertEqual(held[0], 0)
+
+
+class DomainInputTests(TestCase):
+    def test_clean_domain_keeps_the_host_as_entered(self):
+        self.assertEqual(views.clean_domain(" https://WWW.Firm.com/contact "), "www.firm.com")
+        self.assertEqual(views.clean_domain("firm.com."), "firm.com")
+        self.assertEqual(views._parse_domains("www.firm.com, firm.com\nhttp://www.firm.com/"), ["www.firm.com", "firm.com"])
+
+    @mock.patch("scanner.tasks.run_compliance_scan.delay")
+    @mock.patch("scanner.views.run_compliance_scan")
+    def test_single_and_bulk_scans_store_the_same_domain(self, *mocks):
+        user, firm = make_firm()
+        self.client.force_login(user)
+        self.client.post("/scanner/run/", {"domain": "WWW.Firm.com"})
+        ScanResult.objects.update(status="COMPLETED")
+        self.client.post("/scanner/batch/", '{"domains": ["www.firm.com"]}', content_type="application/json")
+        self.assertEqual(ScanResult.objects.count(), 2)
+        self.assertEqual(set(ScanResult.objects.values_list("domain", flat=True)), {"www.firm.com"})
+
+
+@mock.patch("reports.models.ComplianceReport.generate_pdf", mock.Mock())
+class IncrementalStateTests(TestCase):
+    def setUp(self):
+        self.user, self.firm = make_firm()
+        spf = CHECKS["email_dns.check_spf"]
+        self.tests = [(spf.name, spf.func)]
+        self.state = {
+            "resources": {"dns": {"hash": "abc"}},
+            "checks": {"email_dns.check_spf": {"inputs": {"dns": "abc"}, "result": {"status": "pass"}, "version": 1}},
+        }
+
+    def completed(self, state, status="COMPLETED"):
+        scan = ScanResult(firm=self.firm, domain="example.com", status=status, completed_at=timezone.now())
+        scan.set_raw_data({incremental.STATE_KEY: state})
+        scan.save()
+        return scan
+
+    def test_cached_rescan_carries_the_previous_state_forward(self):
+        baseline = incremental.Baseline("prev", self.state)
+        ctx = mock.Mock(fingerprints={})
+        state = incremental.snapshot(ctx, self.tests, {0: {"status": "pass", "cached": True}}, baseline)
+        self.assertEqual(state, self.state)
+
+    def test_a_check_that_ran_replaces_its_carried_result(self):
+        baseline = incremental.Baseline("prev", self.state)
+        ctx = mock.Mock(fingerprints={})
+        state = incremental.snapshot(ctx, self.tests, {0: {"status": "error"}}, baseline)
+        self.assertEqual(state["checks"], {})
+        self.assertEqual(state["resources"], self.state["resources"])
+
+    def test_baseline_skips_scans_without_state(self):
+        older = self.completed(self.state)
+        self.completed({"resources": {}, "checks": {}})
+        self.completed(self.state, status="PARTIAL")
+        scan = ScanResult.objects.create(firm=self.firm, domain="example.com")
+        baseline = incremental.load_baseline(scan)
+        self.assertEqual(baseline.scan_id, str(older.scan_id))
+        self.assertEqual(baseline.validators(), {})
+
+
+def response(status=200, body=b""):
+    return mock.Mock(status_code=status, content=body)
+
+
+SITEMAP = b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">%s</urlset>'
+
+
+class CrawlerTests(SimpleTestCase):
+    def test_canonical_url(self):
+        self.assertEqual(
+            crawler.canonical_url("https://Example.com:443/a/?utm_source=x&b=2&a=1#top"),
+            "https://example.com/a?a=1&b=2",
+        )
+        self.assertEqual(crawler.canonical_url("http://example.com:8080"), "http://example.com:8080/")
+        self.assertIsNone(crawler.canonical_url("mailto:office@example.com"))
+
+    def test_relative_sitemap_entries_resolve_against_robots_txt(self):
+        parser = crawler.robotparser.RobotFileParser("https://example.com/robots.txt")
+        parser.parse(["User-agent: *", "Sitemap: /sitemap.xml", "Sitemap: https://cdn.example.com/map.xml"])
+        self.assertEqual(
+            crawler._listed_sitemaps(parser),
+            ["https://example.com/sitemap.xml", "https://cdn.example.com/map.xml"],
+        )
+        self.assertEqual(crawler._listed_sitemaps(None), [])
+
+    def test_sitemap_index_is_followed(self):
+        files = {
+            "https://example.com/index.xml": response(body=b'<sitemapindex><sitemap><loc>https://example.com/pages.xml</loc></sitemap></sitemapindex>'),
+            "https://example.com/pages.xml": response(body=SITEMAP % b"<url><loc>https://example.com/a</loc></url>"),
+        }
+        crawl = crawler.SiteCrawl("example.com")
+        with mock.patch.object(crawler, "_fetch", files.get):
+            pages = crawler._sitemap_urls(crawl, ["https://example.com/index.xml"])
+        self.assertEqual(pages, ["https://example.com/a"])
+        self.assertTrue(crawl.sitemap_ok)
+
+    def test_falls_back_to_sitemap_xml_when_listed_ones_fail(self):
+        files = {
+            "https://example.com/missing.xml": response(404),
+            "https://example.com/sitemap.xml": response(body=SITEMAP % b""),
+        }
+        crawl = crawler.SiteCrawl("example.com")
+        with mock.patch.object(crawler, "_fetch", files.get):
+            pages = crawler._sitemap_urls(crawl, ["https://example.com/missing.xml"], "https://example.com/sitemap.xml")
+        self.assertEqual(pages, [])
+        # Empty, but there is one
+        self.assertTrue(crawl.sitemap_ok)
+
+    def test_no_sitemap(self):
+        crawl = crawler.SiteCrawl("example.com")
+        with mock.patch.object(crawler, "_fetch", lambda url: response(200, b"<html>soft 404</html>")):
+            crawler._sitemap_urls(crawl, [], "https://example.com/sitemap.xml")
+        self.assertFalse(crawl.sitemap_ok)
+
+
+@mock.patch("reports.models.ComplianceReport.generate_pdf", mock.Mock())
+class ScannedUrlsTests(TestCase):
+    def test_scan_without_a_crawl_reports_the_previous_scans_pages(self):
+        user, firm = make_firm()
+        previous = ScanResult(firm=firm, domain="example.com", status="COMPLETED")
+        previous.set_raw_data({"crawl": {"pages": 1, "urls": ["https://example.com/"]}})
+        previous.save()
+        scan = ScanResult(firm=firm, domain="example.com", status="COMPLETED", previous_scan=previous)
+        scan.set_raw_data({})
+        scan.save()
+        self.assertEqual(scan.get_scanned_urls(), ["https://example.com/"])
+
+
+def finding(check, status, risk_level="High"):
+    return {"check": check, "title": check.upper(), "standard": "ABA", "status": status, "risk_level": risk_level}
+
+
+class DeltaTests(SimpleTestCase):
+    def test_fingerprint_follows_the_check_not_the_title(self):
+        self.assertEqual(
+            deltas.fingerprint({"check": "encryption.tls", "title": "TLS 1.0 enabled"}),
+            deltas.fingerprint({"check": "encryption.tls", "title": "TLS OK"}),
+        )
+        self.assertNotEqual(
+            deltas.fingerprint({"title": "Privacy Policy", "standard": "ABA"}),
+            deltas.fingerprint({"title": "Privacy Policy", "standard": "GDPR"}),
+        )
+
+    def test_compare(self):
+        before = deltas.finding_index([
+            finding("a", "fail"), finding("b", "fail"), finding("c", "warn", "Low"), finding("d", "fail"), finding("e", "pass"),
+        ])
+        after = deltas.finding_index([
+            finding("a", "fail"), finding("b", "pass"), finding("c", "fail", "High"), finding("e", "warn"),
+            {"check": "f", "title": "F", "status": "error"},
+        ])
+        delta = deltas.compare(before, after)
+        titles = {key: [item["title"] for item in delta[key]] for key in ("new", "resolved", "changed", "unverified")}
+        self.assertEqual(titles, {"new": ["E"], "resolved": ["B"], "changed": ["C"], "unverified": ["D"]})
+        self.assertEqual(delta["changed"][0]["was"], {"status": "warn", "risk_level": "Low"})
+        self.assertEqual(delta["unchanged"], 1)
+
+
+@mock.patch("reports.models.ComplianceReport.generate_pdf", mock.Mock())
+class RecordDeltaTests(TestCase):
+    def test_index_and_delta_are_stored_encrypted(self):
+        user, firm = make_firm()
+        first = ScanResult.objects.create(firm=firm, domain="example.com", status="RUNNING")
+        deltas.record_delta(first, [finding("encryption.tls", "fail")])
+        first.status, first.completed_at = "COMPLETED", timezone.now()
+        first.save()
+        self.assertIsNone(first.delta)
+
+        second = ScanResult.objects.create(firm=firm, domain="example.com", status="RUNNING")
+        deltas.record_delta(second, [finding("encryption.tls", "pass")])
+        second.save()
+        second.refresh_from_db()
+        self.assertEqual(second.previous_scan_id, first.pk)
+        self.assertEqual([item["title"] for item in second.delta["resolved"]], ["ENCRYPTION.TLS"])
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT _finding_index, _delta FROM scanner_scanresult WHERE id = %s", [second.pk])
+            index, delta = cursor.fetchone()
+        self.assertNotIn("ENCRYPTION.TLS", index + delta)
+
+
+class KeywordTests(SimpleTestCase):
+    def setUp(self):
+        signals = mock.patch.dict(keywords.SIGNALS, clear=True)
+        signals.start()
+        self.addCleanup(signals.stop)
+        keywords.register("dpo", ["DPO", "data  protection officer"])
+
+    def test_whole_words_and_plurals(self):
+        self.assertEqual(keywords.scan("contact our dpo"), {"dpo"})
+        self.assertEqual(keywords.scan("our data protection\n officers"), {"data protection officer"})
+        self.assertEqual(keywords.scan("the dpos"), {"dpo"})
+        self.assertEqual(keywords.scan("adpo dpo_x dposs"), frozenset())
+
+    def test_found_and_count(self):
+        hits = keywords.scan("dpo and data protection officer")
+        self.assertTrue(keywords.found(hits, "dpo"))
+        self.assertEqual(keywords.count(hits, "dpo"), 2)
+        self.assertFalse(keywords.found(hits, "unknown"))
+
+
+class CookieBannerTests(SimpleTestCase):
+    def page(self, html):
+        return helpers.ParsedPage("https://example.com/", mock.Mock(
+            status_code=200, ok=True, headers={}, content=html.encode(), text=html, truncated=None,
+        ))
+
+    def test_banner_markers_in_the_markup(self):
+        for html in (
+            '<div id="cookie_notice"></div>',
+            '<div class="cookieNotice"></div>',
+            '<section class="consent_banner"></section>',
+            '<script src="https://cdn.cookielaw.org/otSDKStub.js" data-domain="onetrust"></script>',
+        ):
+            self.assertTrue(self.page(html).cookie_banner, html)
+
+    def test_no_banner(self):
+        self.assertFalse(self.page("<html><body><p>Welcome</p></body></html>").cookie_banner)
+
+
+class ScheduleSlotTests(SimpleTestCase):
+    def schedule(self, domain="example.com", frequency="daily", firm_id=1):
+        return mock.Mock(firm_id=firm_id, domain=domain, frequency=frequency)
+
+    def test_slot_is_stable_and_inside_the_period(self):
+        offset = scheduling.slot_offset(1, "example.com", "weekly")
+        self.assertEqual(offset, scheduling.slot_offset(1, "example.com", "weekly"))
+        self.assertLess(offset, scheduling.PERIODS["weekly"])
+        self.assertLess(scheduling.slot_offset(1, "example.com", "daily"), scheduling.PERIODS["daily"])
+
+    def test_slots_are_spread_over_the_period(self):
+        hours = {scheduling.slot_offset(1, f"firm{n}.com", "daily").seconds // 3600 for n in range(200)}
+        self.assertGreater(len(hours), 18)
+
+    def test_next_slot_is_strictly_after_and_one_period_apart(self):
+        schedule = self.schedule()
+        now = timezone.now()
+        slot = scheduling.next_slot(schedule, now)
+        self.assertGreater(slot, now)
+        self.assertLessEqual(slot - now, scheduling.PERIODS["daily"])
+        # At the slot itself the next one is a period later
+        self.assertEqual(scheduling.next_slot(schedule, slot), slot + scheduling.PERIODS["daily"])
+        self.assertEqual((slot - scheduling.EPOCH) % scheduling.PERIODS["daily"],
+                         scheduling.slot_offset(1, "example.com", "daily"))
+
+
+class ReadBoundedTests(SimpleTestCase):
+    def get(self, headers, body):
+        with stub_server({"/": (200, headers, body)}) as base, mock.patch.object(sessions, "polite", nullcontext):
+            return sessions.ScannerSession().get(f"{base}/")
+
+    def test_complete_body(self):
+        response = self.get({"Content-Type": "text/html"}, b"<html>ok</html>")
+        self.assertEqual(response.content, b"<html>ok</html>")
+        self.assertIsNone(response.truncated)
+
+    def test_body_is_cut_at_the_size_limit(self):
+        with mock.patch.object(sessions, "BODY_LIMITS", (("html", 1000),)):
+            response = self.get({"Content-Type": "text/html"}, b"x" * 5000)
+        self.assertEqual(len(response.content), 1000)
+        self.assertEqual(response.truncated, "size limit")
+
+    def test_decompression_bomb_is_stopped(self):
+        bomb = gzip.compress(b"\0" * (4 * 1024 * 1024))
+        # Under a cap large enough that the size limit doesn't stop it first
+        with mock.patch.object(sessions, "BODY_LIMITS", (("html", 8 * 1024 * 1024),)):
+            response = self.get({"Content-Type": "text/html", "Content-Encoding": "gzip"}, bomb)
+        self.assertEqual(response.truncated, "decompression ratio")
+
+    def test_brotli_is_not_asked_for_or_inflated(self):
+        self.assertNotIn("br", sessions.ScannerSession().headers["Accept-Encoding"])
+        try:
+            import brotli
+            bomb = brotli.compress(b"\0" * (64 * 1024 * 1024))
+        except ImportError:
+            bomb = bytes(632)
+        response = self.get({"Content-Type": "text/html", "Content-Encoding": "br"}, bomb)
+        self.assertEqual(response.truncated, "bad encoding")
+        self.assertEqual(response.content, b"")
+
+    def test_bad_encoding(self):
+        response = self.get({"Content-Type": "text/html", "Content-Encoding": "gzip"}, b"not gzip at all")
+        self.assertEqual(response.truncated, "bad encoding")
+
+
+class ProbeCoalescingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_a_concurrent_scan_reuses_the_shared_handshake(self):
+        handshakes = []
+
+        async def handshake(domain):
+            handshakes.append(domain)
+            return {"protocol": "TLSv1.3", "cipher": "TLS_AES_256_GCM_SHA384", "expiry": "2030-01-01"}
+
+        async def scan():
+            with scan_context("example.com") as ctx:
+                await resources.prefetch(ctx, ["tls"])
+                return ctx, await encryption.check_ssl_tls(ctx)
+
+        with mock.patch.object(encryption, "_handshake_and_parse", handshake):
+            first, first_result = asyncio.run(scan())
+            second, second_result = asyncio.run(scan())
+        self.assertEqual(len(handshakes), 1)
+        self.assertEqual(second.stats.get("coalesced"), 1)
+        self.assertEqual(first_result, second_result)
+        self.assertEqual(second_result["status"], "pass")
+
+
+def fake_tool(domain, on_progress=None, should_stop=None):
+    on_progress(10, "started")
+    on_progress(50, "half way")
+    raise RuntimeError("tool crashed")
+
+
+fake_tool.__module__ = "scanner.scanner_tasks.tools"
+
+
+@mock.patch.dict(tasks.HEAVY_CHECKS, {"tools.fake_tool": fake_tool})
+@mock.patch("scanner.progress.ProgressPublisher._publish", mock.Mock())
+class HeavyCheckTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user, self.firm = make_firm()
+        self.scan = ScanResult.objects.create(firm=self.firm, domain="example.com", status="RUNNING")
+
+    def test_failed_tool_is_reported_under_its_check_name(self):
+        result = tasks.run_heavy_check(self.scan.pk, "example.com", "tools.fake_tool", "Fake Tool")
+        self.assertEqual(result, {"title": "Fake Tool", "status": "error", "details": "tool crashed"})
+
+    def test_last_progress_update_is_written(self):
+        tasks.run_heavy_check(self.scan.pk, "example.com", "tools.fake_tool", "Fake Tool")
+        self.scan.refresh_from_db()
+        self.assertEqual(self.scan.current_step, "Fake Tool: half way")
+
+
+class ScanRoutingTests(TestCase):
+    def route(self, **kwargs):
+        return queues.route_task("scanner.tasks.run_compliance_scan", (1,), kwargs, {})
+
+    def test_scan_goes_to_the_queue_of_the_tier_it_was_sent_with(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.route(subscription="ENTERPRISE"), {"queue": "scans.enterprise"})
+            self.assertEqual(self.route(subscription="pro", force_refresh=True), {"queue": "scans.pro"})
+        self.assertEqual(self.route(), {"queue": "scans.trial"})
+        self.assertEqual(self.route(subscription="gold"), {"queue": "scans.trial"})
+        self.assertIsNone(queues.route_task("scanner.tasks.run_heavy_check", (1,), {}, {}))
+
+    @mock.patch("scanner.tasks.run_compliance_scan.delay")
+    def test_single_scans_are_sent_with_the_firms_tier(self, delay):
+        user, firm = make_firm()
+        FirmProfile.objects.filter(pk=firm.pk).update(subscription_tier="pro")
+        user.refresh_from_db()
+        self.client.force_login(user)
+        self.client.post("/scanner/run/", {"domain": "example.com"})
+        scan = ScanResult.objects.get()
+        delay.assert_called_once_with(scan.pk, force_refresh=False, subscription="pro")
+
+    @mock.patch("scanner.scheduling.queue_depth", mock.Mock(return_value=0))
+    @mock.patch("scanner.tasks.run_compliance_scan.delay")
+    def test_scheduled_scans_are_sent_with_the_firms_tier(self, delay):
+        user, firm = make_firm()
+        FirmProfile.objects.filter(pk=firm.pk).update(subscription_tier="enterprise")
+        ScanSchedule.objects.create(firm=firm, user=user, domain="example.com", next_run_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(scheduling.dispatch_due()["started"], 1)
+        delay.assert_called_once_with(ScanResult.objects.get().pk, subscription="enterprise")
+
+
+def run_engine(tests, concurrency=4, **kwargs):
+    with scan_context("example.com") as ctx:
+        results = {idx: result for idx, name, result in engine.iter_results(ctx, tests, concurrency, **kwargs)}
+    return ctx, [results[idx] for idx in range(len(tests))]
+
+
+class EngineTests(SimpleTestCase):
+    def test_sync_checks_run_concurrently(self):
+        # Each check waits for the other two: run one after another, they would time out
+        barrier = threading.Barrier(3, timeout=5)
+
+        def meeting(domain):
+            barrier.wait()
+            return {"title": domain, "status": "pass"}
+
+        ctx, results = run_engine([("A", meeting), ("B", meeting), ("C", meeting)], concurrency=3)
+        self.assertEqual([r["status"] for r in results], ["pass"] * 3)
+
+    def test_a_failing_check_becomes_an_error_result(self):
+        def broken(domain):
+            raise ValueError("no route to host")
+
+        def fine(domain):
+            return {"title": "Fine", "status": "pass"}
+
+        ctx, results = run_engine([("Broken", broken), ("Fine", fine)])
+        self.assertEqual(results[0], {"title": "Broken", "status": "error", "details": "no route to host"})
+        self.assertEqual(results[1]["status"], "pass")
+        self.assertIn(tasks.check_id(broken), ctx.durations)
+
+
+class AsyncEngineTests(SimpleTestCase):
+    def test_async_checks_run_on_the_loop_within_their_cap(self):
+        running, most = [0], [0]
+
+        async def probe(ctx):
+            running[0] += 1
+            most[0] = max(most[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+            return {"title": ctx.domain, "status": "pass"}
+
+        def legacy(domain):
+            return {"title": domain, "status": "warn"}
+
+        tests = [(f"Probe {n}", probe) for n in range(6)] + [("Legacy", legacy)]
+        ctx, results = run_engine(tests, concurrency=4, async_concurrency=2)
+        self.assertEqual([r["status"] for r in results], ["pass"] * 6 + ["warn"])
+        self.assertEqual(results[0]["title"], "example.com")
+        self.assertEqual(most[0], 2)
+
+    def test_async_check_errors_become_error_results(self):
+        async def broken(ctx):
+            raise TimeoutError("handshake timed out")
+
+        ctx, results = run_engine([("TLS", broken)])
+        self.assertEqual(results[0], {"title": "TLS", "status": "error", "details": "handshake timed out"})
+
+
+def headers_check(domain):
+    return {"title": "Headers", "status": "warn"}
+
+
+def tls_check(domain):
+    return {"title": "TLS", "status": "pass"}
+
+
+headers_check.__module__ = tls_check.__module__ = "scanner.scanner_tasks.owasp"
+
+
+class ResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.tests = [("Headers", headers_check), ("TLS", tls_check)]
+
+    def test_results_are_reused_for_the_same_domain(self):
+        result_cache.store_result("Example.com.", headers_check, {"title": "Headers", "status": "warn"})
+        cached = result_cache.get_cached_results("example.com", self.tests)
+        self.assertEqual(list(cached), [0])
+        self.assertEqual(cached[0]["status"], "warn")
+        self.assertIn("cached_at", cached[0])
+        self.assertEqual(result_cache.get_cached_results("other.com", self.tests), {})
+
+    def test_errors_and_reused_results_are_not_stored(self):
+        result_cache.store_result("example.com", headers_check, {"title": "Headers", "status": "error"})
+        result_cache.store_result("example.com", tls_check, {"title": "TLS", "status": "pass", "cached": True})
+        self.assertEqual(result_cache.get_cached_results("example.com", self.tests), {})
+
+    def test_a_new_check_version_ignores_older_results(self):
+        result_cache.store_result("example.com", headers_check, {"title": "Headers", "status": "warn"})
+        result_cache.store_result("example.com", tls_check, {"title": "TLS", "status": "pass"})
+        with mock.patch.dict(result_cache.CHECK_VERSIONS, {"owasp.headers_check": 2}):
+            self.assertEqual(list(result_cache.get_cached_results("example.com", self.tests)), [1])
+            result_cache.store_result("example.com", headers_check, {"title": "Headers", "status": "pass"})
+            self.assertEqual(result_cache.get_cached_results("example.com", self.tests)[0]["status"], "pass")
+
+    def test_a_zero_ttl_disables_caching(self):
+        with mock.patch.dict(result_cache.CHECK_TTLS, {"owasp.tls_check": 0}):
+            result_cache.store_result("example.com", tls_check, {"title": "TLS", "status": "pass"})
+            self.assertEqual(result_cache.get_cached_results("example.com", self.tests), {})
+
+
+class RegistryTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for patcher in (mock.patch.dict(registry.CHECKS), mock.patch.dict(resources.RESOURCES)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_tiers_include_the_checks_of_lower_tiers(self):
+        registry.CHECKS.clear()
+
+        @registry.check("Basic", resources=("homepage",))
+        def basic(domain):
+            pass
+
+        @registry.check("Deep", tier="pro", resources=("homepage", "tls"))
+        def deep(domain):
+            pass
+
+        self.assertEqual(registry.tier_tests("free"), [("Basic", basic)])
+        self.assertEqual(registry.tier_tests("pro"), [("Basic", basic), ("Deep", deep)])
+        self.assertEqual(registry.required_resources(registry.tier_tests("pro")), ["homepage", "tls"])
+        with self.assertRaises(ValueError):
+            registry.check("Odd", tier="gold")(lambda domain: None)
+
+    def test_a_shared_resource_is_fetched_once_before_the_checks(self):
+        fetched = []
+        resources.RESOURCES["fake_page"] = lambda domain: fetched.append(domain) or {"title": "Home"}
+
+        @registry.check("First", resources=("fake_page",))
+        def first(domain):
+            return {"title": "First", "status": "pass", "details": resources.resource("fake_page", domain)["title"]}
+
+        @registry.check("Second", resources=("fake_page",))
+        def second(domain):
+            return {"title": "Second", "status": "pass", "details": resources.resource("fake_page", domain)["title"]}
+
+        tests = [("First", first), ("Second", second)]
+        ctx, results = run_engine(tests, resources=registry.required_resources(tests))
+        self.assertEqual(fetched, ["example.com"])
+        self.assertEqual([r["details"] for r in results], ["Home", "Home"])
+        self.assertIn("fake_page", ctx.fingerprints)
+
+
+RELEASE = threading.Event()
+
+
+def slow_check(domain):
+    RELEASE.wait(10)
+    return {"title": "Slow", "status": "pass"}
+
+
+def cancelling_check(domain):
+    # What CancelScanView does while the scan runs
+    scan = ScanResult.objects.get(domain=domain)
+    ScanResult.objects.filter(pk=scan.pk).update(status="CANCELLED")
+    cancellation.request_cancel(scan.pk)
+    return {"title": "Quick", "status": "fail", "risk_level": "high"}
+
+
+def quick_check(domain):
+    return {"title": "Quick", "status": "pass"}
+
+
+slow_check.__module__ = cancelling_check.__module__ = quick_check.__module__ = "scanner.scanner_tasks.cis"
+
+
+@mock.patch("scanner.tasks._update_scan")
+@mock.patch("scanner.tasks.scan_progress.close")
+@mock.patch("scanner.tasks.scan_progress.send")
+@mock.patch("reports.models.ComplianceReport.generate_pdf")
+class ScanCancellationTests(TransactionTestCase):
+    # Checks run on executor threads, which only see committed rows
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        RELEASE.clear()
+        self.addCleanup(RELEASE.set)
+        self.user, self.firm = make_firm()
+        self.scan = ScanResult.objects.create(firm=self.firm, domain="example.com")
+
+    def run_scan(self, tests):
+        with mock.patch.dict(tasks.TIERS, {"free": tests}):
+            started = time.monotonic()
+            tasks.run_compliance_scan(self.scan.pk)
+            elapsed = time.monotonic() - started
+        self.scan.refresh_from_db()
+        return elapsed
+
+    def test_cancel_mid_scan_stops_without_a_grade(self, *mocks):
+        elapsed = self.run_scan([("Slow", slow_check), ("Quick", cancelling_check)])
+        self.assertLess(elapsed, 5)  # did not wait for the slow check
+        self.assertEqual(self.scan.status, "CANCELLED")
+        self.assertIsNone(self.scan.grade)
+        self.assertIsNone(self.scan.risk_score)
+        self.assertFalse(ComplianceReport.objects.filter(scan=self.scan).exists())
+        raw = self.scan.raw_data
+        self.assertEqual(raw["partial"]["skipped"], ["Slow"])
+        self.assertEqual([f["title"] for f in raw["findings"]], ["Quick"])
+
+    def test_time_budget_leaves_a_partial_scan(self, *mocks):
+        with mock.patch.dict(tasks.SCAN_TIME_BUDGETS, {"free": 0.5}):
+            elapsed = self.run_scan([("Slow", slow_check), ("Quick", quick_check)])
+        self.assertLess(elapsed, 5)
+        self.assertEqual(self.scan.status, "PARTIAL")
+        self.assertIsNone(self.scan.grade)
+        self.assertFalse(ComplianceReport.objects.filter(scan=self.scan).exists())
+        self.assertIn("time budget", self.scan.raw_data["partial"]["reason"])
@@ -17,11 +17,22 @@ urlpatterns = [
     path('run/', views.StartScanView.as_view(), name='run_scan'),
     path('run/modal/', views.RunScanModalView.as_view(), name='run_modal'),
 
+    # Portfolio (bulk) scans
+    path('batch/', views.BulkScanView.as_view(), name='bulk_scan'),
+    path('batch/modal/', views.BulkScanModalView.as_view(), name='bulk_modal'),
+    path('batch/<str:batch_id>/', views.batch_status, name='batch_status'),
+    path('batch/<str:batch_id>/partial/', views.batch_status_partial, name='batch_status_partial'),
+    path('batch/<str:batch_id>/api/', views.batch_status_api, name='batch_status_api'),
+
+    # Recurring scans
+    path('schedules/', views.ScheduleView.as_view(), name='schedules'),
+
     # --- ALL SCAN DETAILS AND ACTIONS UPDATED TO STRING-BASED ID ---
     
     # Details & Progress
     path('scan/<str:scan_id>/', views.scan_status, name='scan_status'),
     path('scan/<str:scan_id>/partial/', views.scan_status_partial, name='scan_status_partial'),
+    path('scan/<str:scan_id>/changes/', views.scan_changes_api, name='scan_changes_api'),
 
     # PDF Generation
     path('scan/<str:scan_id>/pdf/', views.generate_pdf, name='pdf'),
@@ -13,6 +13,7 @@ from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils.timezone import now
 from django.core.files.base import ContentFile
+from django.db.models import Count
 import json
 import uuid
 import re
@@ -20,14 +21,29 @@ import io
 from weasyprint import HTML
 
 from core.mixins import FirmRequiredMixin
-from .models import ScanResult
+
+from .models import ScanResult, ScanBatch, ScanSchedule
 from .tasks import run_compliance_scan
+from .batches import WAITING_STEP, finish_batch_if_done, scan_finished, start_waiting_scans
+from .scheduling import PERIODS, save_schedule
+from .scanner_tasks.cancellation import request_cancel
 from reports.models import ComplianceReport, ReportVerification
 from reports.utils import calculate_sha256_bytes
 
 # Alias for convenience if needed by legacy code
 Scan = ScanResult
 
+DOMAIN_RE = re.compile(r'^[a-z0-9-]+(\.[a-z0-9-]+)*\.[a-z]{2,}$')
+BATCH_MAX_DOMAINS = getattr(settings, 'SCANNER_BATCH_MAX_DOMAINS', 500)
+
+def clean_domain(raw):
+    """The host the user entered, lower-cased, without scheme, path or trailing dot.
+
+    Every entry point (single, bulk, schedules) stores ScanResult.domain this way, so
+    baselines, deltas and schedules keyed on the domain line up. www. is kept.
+    """
+    return raw.strip().lower().replace("https://", "").replace("http://", "").split("/")[0].rstrip(".")
+
 # === HELPER / UTILITY VIEWS ===
 
 def checklist_modal_view(request, scan_id):
@@ -87,12 +103,12 @@ class RunScanModalView(LoginRequiredMixin, TemplateView):
 @method_decorator(ratelimit(key='user', rate='20/h', method='POST', block=True), name='dispatch')
 class StartScanView(LoginRequiredMixin, View):
     def post(self, request):
-        domain = request.POST.get('domain', '').strip().lower()
+        domain = clean_domain(request.POST.get('domain', ''))
         if not domain:
             messages.error(request, "Please enter a domain.")
             return redirect('scanner:scan_list')
 
-        if not re.match(r'^[a-z0-9-]+(\.[a-z0-9-]+)*\.[a-z]{2,}$', domain):
+        if not DOMAIN_RE.match(domain):
             messages.error(request, "Invalid domain format.")
             return redirect('scanner:scan_list')
 
@@ -111,13 +127,221 @@ class StartScanView(LoginRequiredMixin, View):
             scan_id=str(uuid.uuid4())[:8]
         )
         
-        run_compliance_scan.delay(scan.pk)
+        run_compliance_scan.delay(
+            scan.pk,
+            force_refresh=request.POST.get('force_refresh') == 'on',
+            subscription=request.user.firm.subscription_tier,
+        )
         messages.success(request, f"Scan started for {domain}", extra_tags="scan_started")
         
         if request.htmx:
             return HttpResponseLocation(reverse('scanner:scan_status', args=[scan.scan_id]))
         return redirect('scanner:dashboard')
 
+# === BULK (PORTFOLIO) SCAN ===
+class BulkScanModalView(LoginRequiredMixin, TemplateView):
+    template_name = 'scanner/partials/bulk_scan_modal.html'
+
+    def get(self, request, *args, **kwargs):
+        if request.htmx:
+            return super().get(request, *args, **kwargs)
+        return redirect('scanner:scan_list')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['max_domains'] = BATCH_MAX_DOMAINS
+        return context
+
+
+def _parse_domains(raw):
+    """Split pasted text / CSV into normalized domains, keeping first-seen order"""
+    domains = []
+    for item in re.split(r'[\s,;]+', raw):
+        domain = clean_domain(item)
+        if domain:
+            domains.append(domain)
+    return list(dict.fromkeys(domains))
+
+
+@method_decorator(ratelimit(key='user', rate='5/h', method='POST', block=True), name='dispatch')
+class BulkScanView(FirmRequiredMixin, View):
+    """Start one scan per domain (form textarea/file upload, or JSON {"domains": [...]})"""
+
+    def post(self, request):
+        is_api = request.content_type == 'application/json'
+        if is_api:
+            try:
+                payload = json.loads(request.body or b"{}")
+            except ValueError:
+                return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+            raw = payload.get('domains') or []
+            raw = "\n".join(raw) if isinstance(raw, list) else str(raw)
+        else:
+            raw = request.POST.get('domains', '')
+            upload = request.FILES.get('domains_file')
+            if upload:
+                raw += "\n" + upload.read().decode('utf-8', errors='ignore')
+
+        domains = _parse_domains(raw)
+        invalid = [d for d in domains if not DOMAIN_RE.match(d)]
+        domains = [d for d in domains if DOMAIN_RE.match(d)]
+
+        error = None
+        if not domains:
+            error = "Please provide at least one valid domain."
+        elif len(domains) > BATCH_MAX_DOMAINS:
+            error = f"A portfolio scan is limited to {BATCH_MAX_DOMAINS} domains."
+        if error:
+            if is_api:
+                return JsonResponse({'error': error, 'invalid': invalid}, status=400)
+            messages.error(request, error)
+            return redirect('scanner:scan_list')
+
+        firm = request.user.firm
+        active = set(ScanResult.objects.filter(
+            firm=firm, domain__in=domains, status__in=['PENDING', 'RUNNING']
+        ).values_list('domain', flat=True))
+        to_scan = [d for d in domains if d not in active]
+
+        batch = ScanBatch.objects.create(firm=firm, user=request.user, total=len(to_scan))
+        # Every scan waits for a firm slot; the first ones start right away and each
+        # finishing scan starts the next (batches.py)
+        ScanResult.objects.bulk_create([
+            ScanResult(
+                firm=firm,
+                user=request.user,
+                batch=batch,
+                domain=domain,
+                status='PENDING',
+                queued_at=None,
+                current_step=WAITING_STEP,
+                scan_id=str(uuid.uuid4())[:8]
+            )
+            for domain in to_scan
+        ])
+        if to_scan:
+            start_waiting_scans(firm.pk)
+        else:
+            finish_batch_if_done(batch.pk)
+
+        if is_api:
+            return JsonResponse({
+                'batch_id': batch.batch_id,
+                'queued': len(to_scan),
+                'skipped_active': sorted(active),
+                'invalid': invalid,
+                'status_url': request.build_absolute_uri(reverse('scanner:batch_status_api', args=[batch.batch_id])),
+            }, status=201)
+
+        messages.success(request, f"Portfolio scan started for {len(to_scan)} domains", extra_tags="scan_started")
+        if invalid or active:
+            messages.warning(request, f"Skipped {len(invalid)} invalid and {len(active)} already-running domains.")
+        if request.htmx:
+            return HttpResponseLocation(reverse('scanner:batch_status', args=[batch.batch_id]))
+        return redirect('scanner:batch_status', batch_id=batch.batch_id)
+
+
+def _batch_context(request, batch_id):
+    batch = get_object_or_404(ScanBatch, batch_id=batch_id, firm=request.user.firm)
+    return {
+        'batch': batch,
+        'scans': batch.scans.order_by('domain'),
+        'counts': dict(batch.scans.values_list('status').annotate(n=Count('id'))),
+    }
+
+
+def batch_status(request, batch_id):
+    return render(request, 'scanner/batch_status.html', _batch_context(request, batch_id))
+
+
+def batch_status_partial(request, batch_id):
+    return render(request, 'scanner/partials/batch_progress.html', _batch_context(request, batch_id))
+
+
+def batch_status_api(request, batch_id):
+    context = _batch_context(request, batch_id)
+    batch = context['batch']
+    return JsonResponse({
+        'batch_id': batch.batch_id,
+        'status': batch.status,
+        'progress': batch.progress,
+        'total': batch.total,
+        'counts': context['counts'],
+        'created_at': batch.created_at.isoformat(),
+        'completed_at': batch.completed_at.isoformat() if batch.completed_at else None,
+        'summary': batch.summary,
+        'scans': [
+            {
+                'scan_id': s.scan_id,
+                'domain': s.domain,
+                'status': s.status,
+                'progress': s.progress,
+                'grade': s.grade,
+                'risk_score': s.risk_score,
+            }
+            for s in context['scans']
+        ],
+    })
+
+# === RECURRING SCANS ===
+def _schedule_json(schedule):
+    return {
+        'domain': schedule.domain,
+        'frequency': schedule.frequency,
+        'enabled': schedule.enabled,
+        'next_run_at': schedule.next_run_at.isoformat() if schedule.enabled and schedule.next_run_at else None,
+        'last_run_at': schedule.last_run_at.isoformat() if schedule.last_run_at else None,
+        'last_scan_id': schedule.scans.values_list('scan_id', flat=True).first(),
+    }
+
+
+@method_decorator(ratelimit(key='user', rate='60/h', method='POST', block=True), name='dispatch')
+class ScheduleView(FirmRequiredMixin, View):
+    """List the firm's recurring scans, or set one (form or JSON {"domain", "frequency"});
+    frequency is "daily", "weekly" or "off". The start time within the day/week is fixed
+    per domain (scheduling.py), not chosen by the customer."""
+
+    def get(self, request):
+        schedules = ScanSchedule.objects.filter(firm=request.user.firm)
+        return JsonResponse({'schedules': [_schedule_json(s) for s in schedules]})
+
+    def post(self, request):
+        is_api = request.content_type == 'application/json'
+        if is_api:
+            try:
+                payload = json.loads(request.body or b"{}")
+            except ValueError:
+                return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+        else:
+            payload = request.POST
+        domain = _parse_domains(str(payload.get('domain', '')))[:1]
+        frequency = str(payload.get('frequency', '')).lower()
+
+        error = None
+        if not domain or not DOMAIN_RE.match(domain[0]):
+            error = "Invalid domain format."
+        elif frequency not in PERIODS and frequency != 'off':
+            error = "Frequency must be daily, weekly or off."
+        if error:
+            if is_api:
+                return JsonResponse({'error': error}, status=400)
+            messages.error(request, error)
+            return redirect('scanner:scan_list')
+
+        schedule = save_schedule(request.user.firm, request.user, domain[0], frequency)
+        if is_api:
+            return JsonResponse(_schedule_json(schedule))
+
+        if schedule.enabled:
+            messages.success(request, f"{schedule.domain} will be rescanned {schedule.frequency}.")
+        else:
+            messages.success(request, f"Recurring scans of {schedule.domain} stopped.")
+        scan_id = payload.get('scan_id')
+        if scan_id:
+            return redirect('scanner:scan_status', scan_id=scan_id)
+        return redirect('scanner:scan_list')
+
+
 # === SCAN STATUS ===
 
 # We define this as a function to match your urls.py 'views.scan_status'
@@ -125,10 +349,31 @@ def scan_status(request, scan_id):
     scan = get_object_or_404(ScanResult, scan_id=scan_id, firm=request.user.firm)
     context = {
         'scan': scan,
-        'active_statuses': ("RUNNING", "PENDING")
+        'active_statuses': ("RUNNING", "PENDING"),
+        'schedule': ScanSchedule.objects.filter(firm=scan.firm, domain=scan.domain, enabled=True).first(),
     }
     return render(request, 'scanner/scan_status.html', context)
 
+# === CHANGES SINCE THE LAST SCAN ===
+def scan_changes_api(request, scan_id):
+    """New / resolved / changed findings against the previous completed scan of the domain
+    (stored when the scan finished; changes is null for a domain's first scan)"""
+    scan = get_object_or_404(
+        ScanResult.objects.only('scan_id', 'domain', 'status', 'completed_at', '_delta', 'firm_id'),
+        scan_id=scan_id, firm=request.user.firm
+    )
+    delta = scan.delta
+    return JsonResponse({
+        'scan_id': scan.scan_id,
+        'domain': scan.domain,
+        'status': scan.status,
+        'completed_at': scan.completed_at.isoformat() if scan.completed_at else None,
+        'previous_scan_id': delta['previous_scan_id'] if delta else None,
+        'counts': {key: len(delta[key]) for key in ('new', 'resolved', 'changed', 'unverified')} if delta else None,
+        'changes': delta,
+    })
+
+
 # === HTMX PARTIAL: Progress Update ===
 def scan_status_partial(request, scan_id):
     scan = get_object_or_404(ScanResult, scan_id=scan_id, firm=request.user.firm)
@@ -152,9 +397,17 @@ class CancelScanView(LoginRequiredMixin, View):
     def post(self, request, scan_id):
         scan = get_object_or_404(ScanResult, scan_id=scan_id, firm=request.user.firm)
         if scan.status in ['PENDING', 'RUNNING']:
+            was_running = scan.status == 'RUNNING'
             scan.status = 'CANCELLED'
             scan.scan_log = (scan.scan_log or "") + '\n[Cancelled by user]'
-            scan.save()
+            scan.save(update_fields=['status', 'scan_log'])
+            # The worker stops at its next poll, saves the partial results and hands on its slot
+            request_cancel(scan.pk)
+            if was_running:
+                finish_batch_if_done(scan.batch_id)
+            else:
+                # A queued scan gives up its slot (or its place in line) now
+                scan_finished(scan)
         return HttpResponseClientRefresh()
 
 # === RETRY SCAN ===
@@ -171,7 +424,7 @@ class RetryScanView(LoginRequiredMixin, View):
             scan_id=str(uuid.uuid4())[:8],
             scan_log='Retrying FAILED scan...'
         )
-        run_compliance_scan.delay(new_scan.pk)
+        run_compliance_scan.delay(new_scan.pk, force_refresh=True, subscription=old_scan.firm.subscription_tier)
         return HttpResponseLocation(reverse('scanner:scan_status', args=[new_scan.scan_id]))
 
 # === GENERATE PDF ===